@@ -0,0 +1,39 @@
+import sys
+import os
+from pathlib import Path
+
+# 添加项目根目录到 Python 路径
+project_root = Path(__file__).parent.parent
+sys.path.insert(0, str(project_root))
+
+from src.core.engines.llm.base import LLM
+from src.core.engines.ocr.base import OCR
+from src.modules.agent import Agent, ToolRegistry, tool
+
+ocr = OCR(server_url="http://localhost:8001")
+
+
+@tool(description="识别本地图片中的文字，返回识别结果", timeout=30)
+def recognize(image_path: str) -> dict:
+    return ocr.recognize(image_path)
+
+
+def main():
+    """Agent 工具调用示例：模型可在同一步中并发调用多次 OCR"""
+    llm = LLM(
+        model="qwen-plus",
+        api_key="sk-xxxxxxxxxxxxxxxxxxx",
+        base_url="https://dashscope.aliyuncs.com/compatible-mode/v1"
+    )
+    agent = Agent(llm, ToolRegistry([recognize]), max_steps=4)
+
+    image = str(project_root / "src" / "common" / "images" / "image001.png")
+    result = agent.run(f"识别 {image} 中的文字，并总结主要内容")
+    print(result["response"])
+    print('------------------------')
+    for step in result["steps"]:
+        print(f"第 {step['step']} 步: 模型 {step['llm_elapsed']}s, "
+              f"工具 {[(c['name'], c['elapsed']) for c in step['tool_calls']]}")
+
+if __name__ == "__main__":
+    main()
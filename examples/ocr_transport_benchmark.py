@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+"""
+OCR 数组传输方式基准测试
+
+对比 numpy 数组的三种发送方式：
+    json: PNG 压缩 + base64 JSON（旧路径）
+    png:  PNG 压缩后以二进制发送
+    raw:  直接发送像素缓冲区，服务端零拷贝还原
+
+默认只测量本地的编码 + 服务端解码开销（不需要启动服务）；
+加 --server 时额外测量对该服务的端到端识别耗时
+
+用法:
+    python examples/ocr_transport_benchmark.py
+    python examples/ocr_transport_benchmark.py --size 1920x1080 --server http://localhost:8001
+"""
+
+import argparse
+import base64
+import io
+import statistics
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+from PIL import Image
+
+# 添加项目根目录到 Python 路径
+project_root = Path(__file__).parent.parent
+sys.path.insert(0, str(project_root))
+
+from src.core.engines.ocr.base import OCR
+
+
+def make_image(width: int, height: int) -> np.ndarray:
+    """生成带文字区域特征（大块背景 + 噪声）的测试图片"""
+    rng = np.random.default_rng(0)
+    image = np.full((height, width, 3), 235, dtype=np.uint8)
+    noise = rng.integers(0, 255, size=(height // 4, width, 3), dtype=np.uint8)
+    image[: height // 4] = noise
+    return image
+
+
+def decode_png(data: bytes) -> np.ndarray:
+    """服务端 PNG 解码（与 paddleocr/server.py 的 bytes_to_image 一致）"""
+    return np.array(Image.open(io.BytesIO(data)))
+
+
+def decode_raw(data: bytes, shape, dtype) -> np.ndarray:
+    """服务端原始缓冲区还原（与 paddleocr/server.py 的 ndarray_from_buffer 一致）"""
+    return np.ndarray(shape, dtype=dtype, buffer=data)
+
+
+def timed(fn, repeat: int) -> float:
+    """返回多次执行耗时的中位数（毫秒）"""
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - started) * 1000)
+    return statistics.median(samples)
+
+
+def bench_local(image: np.ndarray, repeat: int) -> None:
+    ocr = OCR()
+
+    def json_path():
+        image_b64 = ocr._to_base64(image)
+        decode_png(base64.b64decode(image_b64))
+
+    def png_path():
+        decode_png(ocr._to_bytes(image))
+
+    def raw_path():
+        payload = ocr._ndarray_payload(image)
+        decode_raw(payload["content"], image.shape, image.dtype)
+
+    sizes = {
+        "json": len(ocr._to_base64(image)),
+        "png": len(ocr._to_bytes(image)),
+        "raw": image.nbytes,
+    }
+    print(f"本地编码 + 解码（中位数，{repeat} 次）:")
+    for name, fn in (("json", json_path), ("png", png_path), ("raw", raw_path)):
+        print(f"  {name:<5} {timed(fn, repeat):8.2f} ms  请求体 {sizes[name] / 1024:10.1f} KB")
+    ocr.close()
+
+
+def bench_server(image: np.ndarray, server_url: str, repeat: int) -> None:
+    clients = {
+        "json": OCR(server_url, transport="json"),
+        "png": OCR(server_url, transport="binary", array_encoding="png"),
+        "raw": OCR(server_url, transport="binary", array_encoding="raw"),
+    }
+    print(f"端到端识别（中位数，{repeat} 次）: {server_url}")
+    for name, ocr in clients.items():
+        ocr.recognize(image)  # 预热连接
+        print(f"  {name:<5} {timed(lambda: ocr.recognize(image), repeat):8.2f} ms")
+        ocr.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="OCR 数组传输方式基准测试")
+    parser.add_argument("--size", default="1920x1080", help="测试图片尺寸，宽x高")
+    parser.add_argument("--repeat", type=int, default=20, help="每种方式的重复次数")
+    parser.add_argument("--server", default=None, help="PaddleOCR 服务地址，不指定时只做本地测试")
+    args = parser.parse_args()
+
+    width, height = (int(n) for n in args.size.lower().split("x"))
+    image = make_image(width, height)
+    print(f"测试图片: {width}x{height}，{image.nbytes / 1024 / 1024:.1f} MB")
+
+    bench_local(image, args.repeat)
+    if args.server:
+        bench_server(image, args.server, max(1, args.repeat // 4))
+
+
+if __name__ == "__main__":
+    main()
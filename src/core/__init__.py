@@ -5,6 +5,6 @@ This module contains the core functionality including base classes,
 engines, and utilities used throughout the application.
 """
 
-from .base import Logger, get_logger, setup_logging
+from .base import Logger, LRUCache, get_logger, setup_logging
 
-__all__ = ["Logger", "get_logger", "setup_logging"]
\ No newline at end of file
+__all__ = ["Logger", "LRUCache", "get_logger", "setup_logging"]
\ No newline at end of file
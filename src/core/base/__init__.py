@@ -4,6 +4,8 @@ Core base module for MyAgent project.
 This module contains base classes and utilities for the entire application.
 """
 
+from .cache import LRUCache
+from .concurrency import bounded_map
 from .logger import Logger, get_logger, setup_logging
 
-__all__ = ["Logger", "get_logger", "setup_logging"]
\ No newline at end of file
+__all__ = ["Logger", "LRUCache", "bounded_map", "get_logger", "setup_logging"]
\ No newline at end of file
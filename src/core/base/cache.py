@@ -0,0 +1,213 @@
+"""
+In-memory cache utilities for MyAgent project.
+
+This module provides a small, thread-safe LRU cache used by the engines for
+pooling clients and caching results. It supports:
+- Bounded size (entry count and optional total bytes) with LRU eviction
+- Optional time-to-live for entries
+- Eviction callbacks for releasing resources held by evicted values
+- Hit/miss/eviction counters for monitoring
+"""
+
+import threading
+import time
+from collections import OrderedDict
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    Generic,
+    Hashable,
+    List,
+    Optional,
+    Tuple,
+    TypeVar,
+)
+
+K = TypeVar("K", bound=Hashable)
+V = TypeVar("V")
+
+_MISSING = object()
+
+
+class LRUCache(Generic[K, V]):
+    """Thread-safe LRU cache with TTL, size limits and usage statistics."""
+
+    def __init__(
+        self,
+        max_items: int = 128,
+        on_evict: Optional[Callable[[K, V], None]] = None,
+        ttl: Optional[float] = None,
+        max_bytes: Optional[int] = None,
+        sizeof: Optional[Callable[[V], int]] = None,
+    ) -> None:
+        """Initialize the cache.
+
+        Args:
+            max_items: Maximum number of entries kept before evicting the
+                least recently used one.
+            on_evict: Optional callback invoked with (key, value) for every
+                entry removed by eviction, expiry, pop or clear.
+            ttl: Optional time-to-live in seconds, refreshed on every put.
+            max_bytes: Optional limit on the total size of all values.
+            sizeof: Function returning the size of a value in bytes. Required
+                when ``max_bytes`` is set.
+        """
+        if max_items <= 0:
+            raise ValueError("max_items must be positive")
+        if max_bytes is not None and sizeof is None:
+            raise ValueError("sizeof is required when max_bytes is set")
+
+        self.max_items = max_items
+        self.on_evict = on_evict
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.sizeof = sizeof
+        # key -> (value, expires_at, size)
+        self._data: "OrderedDict[K, Tuple[V, Optional[float], int]]" = OrderedDict()
+        self._lock = threading.RLock()
+        self._bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, key: K, default: Optional[V] = None) -> Optional[V]:
+        """Return the cached value and mark it as recently used.
+
+        Args:
+            key: Cache key.
+            default: Value returned when the key is missing or expired.
+
+        Returns:
+            Cached value or ``default``.
+        """
+        expired: List[Tuple[K, V]] = []
+        with self._lock:
+            entry = self._data.get(key, _MISSING)
+            if entry is not _MISSING:
+                value, expires_at, _ = entry
+                if expires_at is None or expires_at > time.monotonic():
+                    self._data.move_to_end(key)
+                    self.hits += 1
+                    return value
+                expired.append((key, self._remove(key)))
+                self.expirations += 1
+            self.misses += 1
+        self._release(expired)
+        return default
+
+    def put(self, key: K, value: V) -> None:
+        """Insert or replace an entry, evicting old entries if needed.
+
+        Args:
+            key: Cache key.
+            value: Value to store.
+        """
+        size = self.sizeof(value) if self.sizeof else 0
+        expires_at = time.monotonic() + self.ttl if self.ttl else None
+        evicted: List[Tuple[K, V]] = []
+        with self._lock:
+            if key in self._data:
+                self._remove(key)
+            self._data[key] = (value, expires_at, size)
+            self._bytes += size
+            while len(self._data) > self.max_items or (
+                self.max_bytes is not None
+                and self._bytes > self.max_bytes
+                and len(self._data) > 1
+            ):
+                oldest = next(iter(self._data))
+                evicted.append((oldest, self._remove(oldest)))
+                self.evictions += 1
+        self._release(evicted)
+
+    def pop(self, key: K, default: Optional[V] = None) -> Optional[V]:
+        """Remove an entry and return its value.
+
+        Args:
+            key: Cache key.
+            default: Value returned when the key is missing.
+
+        Returns:
+            Removed value or ``default``.
+        """
+        with self._lock:
+            if key not in self._data:
+                return default
+            value = self._remove(key)
+        self._release([(key, value)])
+        return value
+
+    def purge_expired(self) -> int:
+        """Remove all expired entries.
+
+        Returns:
+            Number of entries removed.
+        """
+        if not self.ttl:
+            return 0
+        now = time.monotonic()
+        with self._lock:
+            expired = [
+                (key, self._remove(key))
+                for key, (_, expires_at, _) in list(self._data.items())
+                if expires_at is not None and expires_at <= now
+            ]
+            self.expirations += len(expired)
+        self._release(expired)
+        return len(expired)
+
+    def clear(self) -> None:
+        """Remove all entries."""
+        with self._lock:
+            evicted = [(key, entry[0]) for key, entry in self._data.items()]
+            self._data.clear()
+            self._bytes = 0
+        self._release(evicted)
+
+    def items(self) -> List[Tuple[K, V]]:
+        """Return a snapshot of entries from least to most recently used."""
+        with self._lock:
+            return [(key, entry[0]) for key, entry in self._data.items()]
+
+    def stats(self) -> Dict[str, Any]:
+        """Return usage statistics.
+
+        Returns:
+            Dictionary with size, capacity, hit/miss/eviction counters and hit rate.
+        """
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._data),
+                "max_items": self.max_items,
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+            }
+
+    def _remove(self, key: K) -> V:
+        """Remove an entry while holding the lock and return its value."""
+        value, _, size = self._data.pop(key)
+        self._bytes -= size
+        return value
+
+    def _release(self, entries: List[Tuple[K, V]]) -> None:
+        """Run the eviction callback outside of the lock."""
+        if not self.on_evict:
+            return
+        for key, value in entries:
+            self.on_evict(key, value)
+
+    def __contains__(self, key: object) -> bool:
+        with self._lock:
+            return key in self._data
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._data)
@@ -0,0 +1,115 @@
+"""
+Async concurrency helpers for MyAgent project.
+
+This module provides a bounded-concurrency map over lazily consumed inputs,
+shared by the engines that fan work out to a fixed number of coroutines:
+- At most ``concurrency`` calls run at once and at most that many inputs
+  are pulled from the source, so large or unbounded inputs are never
+  expanded into tasks up front
+- Works with plain iterables and async iterables (pulls are serialized)
+- Results carry their input index and are yielded as they complete, or in
+  input order when requested
+- Stopping iteration early cancels the calls still in flight
+"""
+
+import asyncio
+import itertools
+from typing import (
+    Any,
+    AsyncIterable,
+    AsyncIterator,
+    Awaitable,
+    Callable,
+    Dict,
+    Iterable,
+    Tuple,
+    TypeVar,
+    Union,
+)
+
+T = TypeVar("T")
+R = TypeVar("R")
+
+_DONE = object()
+
+
+async def bounded_map(
+    fn: Callable[[T], Awaitable[R]],
+    items: Union[Iterable[T], AsyncIterable[T]],
+    concurrency: int = 8,
+    ordered: bool = False,
+) -> AsyncIterator[Tuple[int, R]]:
+    """Apply ``fn`` to every item with bounded concurrency.
+
+    A fixed number of worker coroutines take the next item from ``items``
+    only when they are free, so inputs are consumed lazily. An exception
+    raised by ``fn`` or by the source cancels the remaining work and is
+    re-raised to the consumer; callers that want per-item errors should
+    catch them inside ``fn``.
+
+    Args:
+        fn: Coroutine function applied to each item.
+        items: Iterable or async iterable of inputs. Async iterables are
+            pulled by one worker at a time.
+        concurrency: Maximum number of concurrent ``fn`` calls.
+        ordered: Yield results in input order instead of completion order.
+            Results that finish early are buffered until their turn.
+
+    Yields:
+        ``(index, result)`` pairs, where ``index`` is the input position.
+    """
+    workers_count = max(1, concurrency)
+    is_async = isinstance(items, AsyncIterable)
+    source: Any = items.__aiter__() if is_async else iter(items)
+    indexes = itertools.count()
+    pull_lock = asyncio.Lock()
+    results: "asyncio.Queue[Any]" = asyncio.Queue()
+
+    async def pull() -> Any:
+        async with pull_lock:
+            try:
+                item = await source.__anext__() if is_async else next(source)
+            except (StopIteration, StopAsyncIteration):
+                return _DONE
+            return next(indexes), item
+
+    async def worker() -> None:
+        try:
+            while True:
+                pulled = await pull()
+                if pulled is _DONE:
+                    return
+                index, item = pulled
+                # drop the input before waiting for the next one
+                del pulled
+                result = await fn(item)
+                del item
+                results.put_nowait((index, result))
+        except Exception as e:
+            results.put_nowait(e)
+        finally:
+            results.put_nowait(_DONE)
+
+    tasks = [asyncio.create_task(worker()) for _ in range(workers_count)]
+    buffered: Dict[int, R] = {}
+    next_index = 0
+    finished = 0
+    try:
+        while finished < workers_count:
+            entry = await results.get()
+            if entry is _DONE:
+                finished += 1
+                continue
+            if isinstance(entry, Exception):
+                raise entry
+            if not ordered:
+                yield entry
+                continue
+            buffered[entry[0]] = entry[1]
+            while next_index in buffered:
+                yield next_index, buffered.pop(next_index)
+                next_index += 1
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
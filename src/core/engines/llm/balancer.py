@@ -0,0 +1,373 @@
+"""
+多端点负载均衡
+
+在多个部署了同一模型的 OpenAI 兼容端点之间分配请求：
+按 EWMA 延迟或进行中请求数选择端点，连续失败的端点自动摘除一段时间，
+可选的对冲请求（hedging）在首个请求超过观测到的 p95 延迟时向另一端点发起备份请求
+"""
+
+import asyncio
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import (
+    Any,
+    Awaitable,
+    Callable,
+    Deque,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    Set,
+    TypeVar,
+)
+
+from src.core.base.cache import LRUCache
+from src.core.base.logger import get_logger
+from src.core.engines.llm.ratelimit import RetryPolicy
+
+T = TypeVar("T")
+
+ROUTING_POLICIES = ("least_latency", "least_outstanding")
+
+
+class Endpoint:
+    """
+    单个上游端点的运行状态
+
+    属性:
+        base_url: 端点地址
+        ewma_latency: 请求延迟的指数加权移动平均（秒），尚无样本时为 None
+        outstanding: 进行中的请求数
+        consecutive_failures: 连续失败次数
+        ejected_until: 摘除截止时间（monotonic），0 表示未摘除
+    """
+
+    def __init__(self, base_url: str, alpha: float = 0.3, window: int = 200) -> None:
+        self.base_url = base_url
+        self.alpha = alpha
+        self.ewma_latency: Optional[float] = None
+        self.outstanding = 0
+        self.consecutive_failures = 0
+        self.ejected_until = 0.0
+        self.requests = 0
+        self.failures = 0
+        self.latencies: Deque[float] = deque(maxlen=window)
+
+    def healthy(self, now: float) -> bool:
+        """端点当前是否可用"""
+        return self.ejected_until <= now
+
+    def observe(self, latency: float) -> None:
+        """记录一次成功请求的延迟"""
+        self.latencies.append(latency)
+        if self.ewma_latency is None:
+            self.ewma_latency = latency
+        else:
+            self.ewma_latency = self.alpha * latency + (1 - self.alpha) * self.ewma_latency
+        self.consecutive_failures = 0
+
+    def percentile(self, q: float) -> Optional[float]:
+        """最近请求延迟的分位数，无样本时返回 None"""
+        if not self.latencies:
+            return None
+        ordered = sorted(self.latencies)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+    def stats(self, now: float) -> Dict[str, Any]:
+        """返回端点统计信息"""
+        return {
+            "base_url": self.base_url,
+            "healthy": self.healthy(now),
+            "ewma_latency": round(self.ewma_latency, 4) if self.ewma_latency else None,
+            "p95_latency": self.percentile(0.95),
+            "outstanding": self.outstanding,
+            "requests": self.requests,
+            "failures": self.failures,
+            "consecutive_failures": self.consecutive_failures,
+        }
+
+
+class EndpointPool:
+    """
+    端点池，负责端点选择、健康摘除与对冲请求
+
+    属性:
+        endpoints: 端点列表
+        policy: 路由策略，least_latency 或 least_outstanding
+        hedge: 是否启用对冲请求
+        name: 端点池标识，用于缓存键与请求合并键
+    """
+
+    def __init__(
+        self,
+        base_urls: Iterable[str],
+        policy: str = "least_latency",
+        hedge: bool = False,
+        hedge_delay: float = 2.0,
+        hedge_min_samples: int = 20,
+        eject_after: int = 3,
+        eject_seconds: float = 30.0,
+    ) -> None:
+        """
+        初始化端点池
+
+        参数:
+            base_urls: 端点地址列表
+            policy: 路由策略，least_latency（EWMA 延迟 × 进行中请求数）或 least_outstanding
+            hedge: 是否启用对冲请求（仅异步调用）
+            hedge_delay: 样本不足时发起对冲请求前的等待时间（秒）
+            hedge_min_samples: 使用观测 p95 作为对冲等待时间所需的最少样本数
+            eject_after: 连续失败多少次后摘除端点
+            eject_seconds: 端点被摘除的时长（秒）
+        """
+        urls = list(dict.fromkeys(base_urls))
+        if not urls:
+            raise ValueError("端点池至少需要一个 base_url")
+        if policy not in ROUTING_POLICIES:
+            raise ValueError(f"不支持的路由策略: {policy}，可选: {ROUTING_POLICIES}")
+
+        self.endpoints = [Endpoint(url) for url in urls]
+        self.policy = policy
+        self.hedge = hedge
+        self.hedge_delay = hedge_delay
+        self.hedge_min_samples = hedge_min_samples
+        self.eject_after = eject_after
+        self.eject_seconds = eject_seconds
+        self.name = ",".join(sorted(urls))
+        self.hedged = 0
+        self.hedge_wins = 0
+        self.failovers = 0
+        self.logger = get_logger(self.__class__.__name__)
+        self._lock = threading.Lock()
+
+    def pick(self, exclude: Optional[Set[Endpoint]] = None) -> Optional[Endpoint]:
+        """
+        按路由策略选择端点；全部端点都被摘除时仍从中选择，避免完全不可用
+
+        参数:
+            exclude: 不参与选择的端点
+
+        返回:
+            选中的端点，没有可选端点时返回 None
+        """
+        now = time.monotonic()
+        candidates = [e for e in self.endpoints if not exclude or e not in exclude]
+        if not candidates:
+            return None
+        healthy = [e for e in candidates if e.healthy(now)]
+        pool = healthy or candidates
+
+        if self.policy == "least_outstanding":
+            return min(pool, key=lambda e: (e.outstanding, e.ewma_latency or 0.0))
+        # 尚无样本的端点视为延迟为 0，优先探测
+        return min(pool, key=lambda e: (e.ewma_latency or 0.0) * (e.outstanding + 1))
+
+    def _begin(self, endpoint: Endpoint) -> float:
+        with self._lock:
+            endpoint.outstanding += 1
+            endpoint.requests += 1
+        return time.monotonic()
+
+    def _end(
+        self,
+        endpoint: Endpoint,
+        started: float,
+        error: Optional[BaseException],
+        observe: bool = True,
+    ) -> None:
+        """
+        结束一次请求并更新端点健康状态
+
+        只有可重试的错误（连接失败、超时、429、5xx）计为端点故障；
+        400 等请求本身的错误说明端点正常应答，按成功处理。
+        取消与调用方提前停止迭代不影响健康状态
+
+        参数:
+            endpoint: 请求所用的端点
+            started: _begin 返回的开始时间
+            error: 请求抛出的异常，成功时为 None
+            observe: 成功时是否记录延迟样本；流式请求的耗时取决于回复长度，不计入
+        """
+        with self._lock:
+            endpoint.outstanding -= 1
+            if isinstance(error, (asyncio.CancelledError, GeneratorExit)):
+                return
+            if error is None or not RetryPolicy.is_retryable(error):
+                if observe:
+                    endpoint.observe(time.monotonic() - started)
+                else:
+                    endpoint.consecutive_failures = 0
+                return
+            endpoint.failures += 1
+            endpoint.consecutive_failures += 1
+            if endpoint.consecutive_failures >= self.eject_after:
+                endpoint.ejected_until = time.monotonic() + self.eject_seconds
+                self.logger.warning(
+                    f"端点连续失败 {endpoint.consecutive_failures} 次，"
+                    f"摘除 {self.eject_seconds} 秒: {endpoint.base_url}"
+                )
+
+    @contextmanager
+    def stream(self) -> Iterator[Endpoint]:
+        """
+        为流式请求选择端点，with 块结束（流读完、出错或被中断）前一直计入该端点的进行中请求数
+
+        流式请求不做对冲与故障切换，只按路由策略选择一次；流建立或读取中的
+        可重试错误同样计入端点故障
+        """
+        endpoint = self.pick()
+        started = self._begin(endpoint)
+        try:
+            yield endpoint
+        except BaseException as e:
+            self._end(endpoint, started, e, observe=False)
+            raise
+        self._end(endpoint, started, None, observe=False)
+
+    def _hedge_after(self, endpoint: Endpoint) -> float:
+        """对冲等待时间：样本充足时取该端点观测到的 p95 延迟"""
+        if len(endpoint.latencies) >= self.hedge_min_samples:
+            return endpoint.percentile(0.95) or self.hedge_delay
+        return self.hedge_delay
+
+    def call(self, fn: Callable[[Endpoint], T]) -> T:
+        """
+        同步执行请求，失败且错误可重试时切换到其他端点
+
+        每个端点最多尝试一次，总尝试次数不超过端点数；端点池是唯一的重试层，
+        调用方不应在单个端点内再重试
+
+        参数:
+            fn: 以端点为参数的调用函数
+
+        返回:
+            fn 的返回值
+        """
+        tried: Set[Endpoint] = set()
+        while True:
+            endpoint = self.pick(exclude=tried)
+            tried.add(endpoint)
+            started = self._begin(endpoint)
+            try:
+                result = fn(endpoint)
+            except Exception as e:
+                self._end(endpoint, started, e)
+                if not RetryPolicy.is_retryable(e) or len(tried) >= len(self.endpoints):
+                    raise
+                self.failovers += 1
+                self.logger.warning(f"端点请求失败，切换端点重试: {endpoint.base_url}")
+                continue
+            self._end(endpoint, started, None)
+            return result
+
+    async def _arun(self, endpoint: Endpoint, fn: Callable[[Endpoint], Awaitable[T]]) -> T:
+        started = self._begin(endpoint)
+        try:
+            result = await fn(endpoint)
+        except BaseException as e:
+            self._end(endpoint, started, e)
+            raise
+        self._end(endpoint, started, None)
+        return result
+
+    async def acall(self, fn: Callable[[Endpoint], Awaitable[T]]) -> T:
+        """
+        异步执行请求；启用对冲时，首个请求超过 p95 仍未完成则向另一端点发起备份请求，
+        取先成功的结果并取消另一个；失败且错误可重试时切换到其他端点。
+        对冲请求同样计入已尝试的端点，总尝试次数不超过端点数
+
+        参数:
+            fn: 以端点为参数、返回可等待对象的调用函数
+
+        返回:
+            调用结果
+        """
+        tried: Set[Endpoint] = set()
+        while True:
+            endpoint = self.pick(exclude=tried)
+            tried.add(endpoint)
+            try:
+                if self.hedge and len(self.endpoints) > 1:
+                    return await self._ahedged(endpoint, fn, tried)
+                return await self._arun(endpoint, fn)
+            except Exception as e:
+                if not RetryPolicy.is_retryable(e) or len(tried) >= len(self.endpoints):
+                    raise
+                self.failovers += 1
+                self.logger.warning(f"端点请求失败，切换端点重试: {endpoint.base_url}")
+
+    async def _ahedged(
+        self,
+        primary: Endpoint,
+        fn: Callable[[Endpoint], Awaitable[T]],
+        tried: Set[Endpoint],
+    ) -> T:
+        """带对冲的单次请求"""
+        tasks: Dict["asyncio.Task[T]", Endpoint] = {
+            asyncio.ensure_future(self._arun(primary, fn)): primary
+        }
+        try:
+            done, _ = await asyncio.wait(set(tasks), timeout=self._hedge_after(primary))
+            if not done:
+                backup = self.pick(exclude=tried)
+                if backup is not None:
+                    tried.add(backup)
+                    self.hedged += 1
+                    self.logger.info(
+                        f"请求超过 p95 延迟，向备用端点发起对冲请求: {backup.base_url}"
+                    )
+                    tasks[asyncio.ensure_future(self._arun(backup, fn))] = backup
+
+            pending = set(tasks)
+            error: Optional[BaseException] = None
+            while pending:
+                done, pending = await asyncio.wait(
+                    pending, return_when=asyncio.FIRST_COMPLETED
+                )
+                for task in done:
+                    if task.exception() is None:
+                        if tasks[task] is not primary:
+                            self.hedge_wins += 1
+                        return task.result()
+                    error = task.exception()
+            raise error
+        finally:
+            for task in tasks:
+                if not task.done():
+                    task.cancel()
+
+    def stats(self) -> Dict[str, Any]:
+        """返回端点池统计信息"""
+        now = time.monotonic()
+        return {
+            "policy": self.policy,
+            "hedge": self.hedge,
+            "hedged": self.hedged,
+            "hedge_wins": self.hedge_wins,
+            "failovers": self.failovers,
+            "endpoints": [e.stats(now) for e in self.endpoints],
+        }
+
+
+_endpoint_pools: LRUCache[tuple, EndpointPool] = LRUCache(max_items=64)
+
+
+def get_endpoint_pool(
+    base_urls: List[str], policy: str = "least_latency", hedge: bool = False
+) -> EndpointPool:
+    """获取进程级端点池，相同配置的请求共享延迟统计与健康状态"""
+    key = (tuple(sorted(set(base_urls))), policy, hedge)
+    pool = _endpoint_pools.get(key)
+    if pool is None:
+        pool = EndpointPool(base_urls, policy=policy, hedge=hedge)
+        _endpoint_pools.put(key, pool)
+    return pool
+
+
+def endpoint_pool_stats() -> List[Dict[str, Any]]:
+    """返回所有端点池的统计信息"""
+    return [pool.stats() for _, pool in _endpoint_pools.items()]
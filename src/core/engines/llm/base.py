@@ -1,18 +1,49 @@
-from openai import OpenAI
-from typing import Optional, List, Dict, Any
+import time
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from openai import AsyncOpenAI, OpenAI
+from typing import Any, AsyncIterator, Dict, Iterable, Iterator, List, Optional, Tuple
 
+from src.core.base.concurrency import bounded_map
 from src.core.base.logger import get_logger
+from src.core.engines.llm.balancer import EndpointPool
+from src.core.engines.llm.cache import ResponseCache, get_response_cache, request_key
+from src.core.engines.llm.client_pool import (
+    ClientPool,
+    get_client_pool,
+    key_fingerprint,
+)
+from src.core.engines.llm.context_window import (
+    ContextWindow,
+    Message,
+    MessageSplit,
+    TokenCounter,
+)
+from src.core.engines.llm.history import MessageHistory, MessageList
+from src.core.engines.llm.ratelimit import UpstreamLimiter, get_upstream_limiter
+from src.core.engines.llm.singleflight import SingleFlight, get_singleflight
 
 
 class LLM:
     """
     支持上下文对话的 LLM 封装类
     默认使用 OpenAI GPT 系列模型，可扩展其他后端
+    同时提供同步接口（chat）与异步接口（achat），异步接口基于 AsyncOpenAI，
+    适合在 FastAPI 等事件循环中直接 await，不会阻塞其他请求
 
     属性:
         model: 模型名称
-        messages: 对话上下文消息列表
+        messages: 当前分支的对话上下文消息列表（只读，整体赋值可替换上下文）
+        history: 结构共享的带分支对话历史，分叉与回退均为 O(1)
         logger: 日志记录器实例
+        client: 同步 OpenAI 客户端（从客户端池复用）
+        async_client: 异步 OpenAI 客户端（从客户端池复用）
+        context_window: 上下文窗口预算策略，为 None 时发送完整上下文
+        token_counter: 消息 token 计数器
+        response_cache: 确定性请求（temperature=0）的响应缓存，为 None 时不缓存
+        singleflight: 相同进行中请求的合并器，为 None 时不合并
+        limiter: 当前上游的限流与重试器
+        endpoints: 多端点池，设置后请求在多个端点间负载均衡，为 None 时只使用 base_url
     """
 
     def __init__(
@@ -20,6 +51,14 @@ class LLM:
         model: Optional[str] = None,
         api_key: Optional[str] = None,
         base_url: Optional[str] = None,
+        client_pool: Optional[ClientPool] = None,
+        context_window: Optional[ContextWindow] = None,
+        response_cache: Optional[ResponseCache] = None,
+        use_response_cache: bool = True,
+        singleflight: Optional[SingleFlight] = None,
+        coalesce_requests: bool = True,
+        limiter: Optional[UpstreamLimiter] = None,
+        endpoints: Optional[EndpointPool] = None,
     ) -> None:
         """
         初始化 LLM 实例
@@ -28,26 +67,321 @@ class LLM:
             model: 要使用的模型名称（例如：'gpt-3.5-turbo', 'gpt-4'）
             api_key: OpenAI API 密钥。如果为 None，将使用环境变量 OPENAI_API_KEY
             base_url: API 调用的自定义基础 URL。如果为 None，使用 OpenAI 的默认 URL
+            client_pool: 客户端池。如果为 None，使用进程级共享的客户端池
+            context_window: 上下文窗口预算策略。如果为 None，每次发送完整上下文
+            response_cache: 响应缓存。如果为 None，使用进程级共享的响应缓存
+            use_response_cache: 是否启用响应缓存
+            singleflight: 请求合并器。如果为 None，使用进程级共享的合并器
+            coalesce_requests: 是否合并同一时刻完全相同的非流式请求
+            limiter: 上游限流与重试器。如果为 None，使用该 API 密钥与 base_url 的进程级限流器
+            endpoints: 多端点池。设置后忽略 base_url，按端点池的路由策略选择上游，
+                每个端点使用各自的进程级限流器
         """
         self.model = model or "gpt-3.5-turbo"
-        self.messages: List[Dict[str, str]] = []
+        self.api_key = api_key
+        self.base_url = base_url
+        self.history = MessageHistory()
+        self.client_pool = client_pool or get_client_pool()
+        self.context_window = context_window
+        self.token_counter = TokenCounter(self.model)
+        self.response_cache = (
+            (response_cache or get_response_cache()) if use_response_cache else None
+        )
+        self.singleflight = (
+            (singleflight or get_singleflight()) if coalesce_requests else None
+        )
+        self.limiter = limiter or get_upstream_limiter(base_url, api_key)
+        self.endpoints = endpoints
+        # summarize 策略将早期轮次替换为摘要后置为 True，此时上下文不再是之前的前缀
+        self.history_rewritten = False
 
         # 初始化日志记录器
         self.logger = get_logger(self.__class__.__name__)
 
-        # 初始化 OpenAI 客户端
-        client_kwargs = {}
-        if api_key:
-            client_kwargs["api_key"] = api_key
-        if base_url:
-            client_kwargs["base_url"] = base_url
+        # 客户端从池中复用，构造实例本身不再建立连接
+        self.logger.debug(
+            f"LLM 已初始化，使用模型: {self.model}，基础 URL: {self._upstream_name() or '默认'}"
+        )
+
+    @property
+    def messages(self) -> List[Dict[str, str]]:
+        """
+        当前分支的只读消息列表
+
+        每次访问生成新列表，append 等原地修改会抛出 TypeError 而不是静默丢失；
+        需要可修改的副本请使用 get_context
+        """
+        return MessageList(self.history.messages())
+
+    @messages.setter
+    def messages(self, messages: List[Dict[str, str]]) -> None:
+        self.history.reset(messages)
+
+    @property
+    def client(self) -> OpenAI:
+        """同步 OpenAI 客户端（来自客户端池）"""
+        return self.client_pool.get(self.api_key, self.base_url)
+
+    @property
+    def async_client(self) -> AsyncOpenAI:
+        """异步 OpenAI 客户端（来自客户端池）"""
+        return self.client_pool.get(self.api_key, self.base_url, asynchronous=True)
+
+    def _begin_turn(self, user_input: str, system_prompt: Optional[str]) -> None:
+        """将系统提示（仅首次）与用户输入追加到上下文"""
+        self.logger.info(f"开始对话，用户输入长度: {len(user_input)}")
+
+        # 首次系统提示
+        if system_prompt and not len(self.history):
+            self.history.append(Message(role="system", content=system_prompt))
+            self.logger.info("已添加系统提示到对话上下文")
+
+        self.history.append(Message(role="user", content=user_input))
+        self.logger.debug(f"已添加用户消息到上下文。总消息数: {len(self.history)}")
+
+    def _completion_kwargs(
+        self,
+        temperature: float,
+        stream: bool = False,
+        messages: Optional[List[Dict[str, str]]] = None,
+    ) -> Dict[str, Any]:
+        """构造 chat.completions.create 的请求参数，messages 为空时使用当前上下文"""
+        kwargs = {
+            "model": self.model,
+            "messages": messages if messages is not None else self._request_messages(),
+            "temperature": temperature,
+            "max_tokens": 2048,
+            "top_p": 1,
+            "frequency_penalty": 0,
+            "presence_penalty": 0,
+        }
+        if stream:
+            kwargs["stream"] = True
+        return kwargs
+
+    def _request_messages(self) -> List[Dict[str, str]]:
+        """按上下文窗口预算裁剪后实际发送给上游的消息"""
+        if self.context_window is None:
+            return self.messages
+        return self.context_window.fit(self.messages, self.token_counter)
+
+    def _pending_summary(self) -> Optional[MessageSplit]:
+        """summarize 策略下超出预算、需要压缩为摘要的早期消息"""
+        if self.context_window is None or self.context_window.policy != "summarize":
+            return None
+        pinned, dropped, kept = self.context_window.split(
+            self.messages, self.token_counter
+        )
+        if not dropped:
+            return None
+        return pinned, dropped, kept
+
+    def _summary_kwargs(self, dropped: List[Dict[str, str]]) -> Dict[str, Any]:
+        """构造生成滚动摘要的请求参数"""
+        return {
+            "model": self.model,
+            "messages": self.context_window.summary_request(dropped),
+            "temperature": 0,
+            "max_tokens": self.context_window.summary_max_tokens,
+        }
+
+    def _apply_summary(self, split: MessageSplit, summary: str) -> None:
+        """用摘要消息替换早期轮次"""
+        pinned, dropped, kept = split
+        self.messages = pinned + [self.context_window.summary_message(summary)] + kept
+        self.history_rewritten = True
+        self.logger.info(f"已将 {len(dropped)} 条早期消息压缩为滚动摘要")
+
+    def _summarize_history(self) -> None:
+        """summarize 策略：超出预算时调用模型生成滚动摘要，失败时退化为丢弃早期轮次"""
+        split = self._pending_summary()
+        if split is None:
+            return
+        try:
+            summary = self._create_completion(self._summary_kwargs(split[1]))
+            self._apply_summary(split, summary)
+        except Exception as e:
+            self.logger.warning(f"生成对话摘要失败，本次请求改为省略早期轮次: {e}")
+
+    async def _asummarize_history(self) -> None:
+        """_summarize_history 的异步版本"""
+        split = self._pending_summary()
+        if split is None:
+            return
+        try:
+            summary = await self._acreate_completion(self._summary_kwargs(split[1]))
+            self._apply_summary(split, summary)
+        except Exception as e:
+            self.logger.warning(f"生成对话摘要失败，本次请求改为省略早期轮次: {e}")
+
+    def _should_cache(self, kwargs: Dict[str, Any], use_cache: bool) -> bool:
+        """确定性请求（temperature=0）且调用方未要求跳过时使用响应缓存"""
+        if self.response_cache is None or kwargs.get("temperature") != 0:
+            return False
+        if not use_cache:
+            self.response_cache.record_bypass()
+            return False
+        return True
+
+    def _request_key(self, kwargs: Dict[str, Any]) -> str:
+        """响应缓存键，包含 API 密钥的哈希，不同密钥之间不共享缓存的回复"""
+        return request_key(
+            self.model, self._upstream_name(), kwargs["messages"], kwargs, self.api_key
+        )
+
+    def _flight_key(self, key: str) -> str:
+        """请求合并键，按 API 密钥隔离，不同密钥的请求不会共享上游调用"""
+        return f"{key_fingerprint(self.api_key)}:{key}"
+
+    def _upstream_name(self) -> Optional[str]:
+        """上游标识，用于缓存键；使用端点池时为池内全部端点"""
+        return self.endpoints.name if self.endpoints is not None else self.base_url
+
+    def _limiter_for(self, base_url: Optional[str]) -> UpstreamLimiter:
+        """指定端点的限流器，按 API 密钥隔离"""
+        if base_url == self.base_url:
+            return self.limiter
+        return get_upstream_limiter(base_url, self.api_key)
+
+    def _call_upstream(self, base_url: Optional[str], kwargs: Dict[str, Any]) -> Any:
+        """
+        在指定端点的限流与重试保护下调用 chat.completions.create
+
+        使用端点池时由端点池的故障切换负责重试，限流器只调用一次，
+        避免每个端点内的重试与切换端点相乘放大上游请求数
+        """
+        with self.client_pool.lease(self.api_key, base_url) as client:
+            return self._limiter_for(base_url).call(
+                lambda: client.chat.completions.create(**kwargs),
+                retry=self.endpoints is None,
+            )
+
+    async def _acall_upstream(
+        self, base_url: Optional[str], kwargs: Dict[str, Any]
+    ) -> Any:
+        """_call_upstream 的异步版本"""
+        with self.client_pool.lease(self.api_key, base_url, asynchronous=True) as client:
+            return await self._limiter_for(base_url).acall(
+                lambda: client.chat.completions.create(**kwargs),
+                retry=self.endpoints is None,
+            )
 
-        self.client = OpenAI(**client_kwargs)
+    @contextmanager
+    def _stream_endpoint(self) -> Iterator[Optional[str]]:
+        """
+        流式请求使用的端点；流式请求不做对冲，只按路由策略选择一次，
+        流读完之前一直计入该端点的进行中请求数
+        """
+        if self.endpoints is None:
+            yield self.base_url
+            return
+        with self.endpoints.stream() as endpoint:
+            yield endpoint.base_url
+
+    def _create_response(self, kwargs: Dict[str, Any]) -> Any:
+        """在限流与重试保护下向上游发起一次非流式请求，返回原始响应"""
+        if self.endpoints is None:
+            return self._call_upstream(self.base_url, kwargs)
+        return self.endpoints.call(
+            lambda endpoint: self._call_upstream(endpoint.base_url, kwargs)
+        )
+
+    async def _acreate_response(self, kwargs: Dict[str, Any]) -> Any:
+        """_create_response 的异步版本，启用对冲时由端点池发起备份请求"""
+        if self.endpoints is None:
+            return await self._acall_upstream(self.base_url, kwargs)
+        return await self.endpoints.acall(
+            lambda endpoint: self._acall_upstream(endpoint.base_url, kwargs)
+        )
 
-        # 记录初始化日志
-        self.logger.info(f"LLM 已初始化，使用模型: {self.model}")
-        if base_url:
-            self.logger.info(f"使用自定义基础 URL: {base_url}")
+    def _create_completion(self, kwargs: Dict[str, Any]) -> str:
+        """向上游发起一次非流式补全请求并返回回复文本"""
+        response = self._create_response(kwargs)
+        return response.choices[0].message.content.strip()
+
+    async def _acreate_completion(self, kwargs: Dict[str, Any]) -> str:
+        """_create_completion 的异步版本"""
+        response = await self._acreate_response(kwargs)
+        return response.choices[0].message.content.strip()
+
+    def _complete(self, kwargs: Dict[str, Any], use_cache: bool = True) -> str:
+        """
+        发起一次非流式补全请求并返回回复文本
+
+        确定性请求优先读取响应缓存；同一时刻完全相同的请求合并为一次上游调用
+        """
+        key = self._request_key(kwargs)
+        cacheable = self._should_cache(kwargs, use_cache)
+        if cacheable:
+            cached = self.response_cache.get(key)
+            if cached is not None:
+                self.logger.info("命中响应缓存")
+                return cached
+
+        if self.singleflight is not None:
+            reply = self.singleflight.do(
+                self._flight_key(key), lambda: self._create_completion(kwargs)
+            )
+        else:
+            reply = self._create_completion(kwargs)
+
+        if cacheable:
+            self.response_cache.put(key, reply)
+        return reply
+
+    async def _acomplete(self, kwargs: Dict[str, Any], use_cache: bool = True) -> str:
+        """_complete 的异步版本"""
+        key = self._request_key(kwargs)
+        cacheable = self._should_cache(kwargs, use_cache)
+        if cacheable:
+            cached = await self.response_cache.aget(key)
+            if cached is not None:
+                self.logger.info("命中响应缓存")
+                return cached
+
+        if self.singleflight is not None:
+            reply = await self.singleflight.ado(
+                self._flight_key(key), lambda: self._acreate_completion(kwargs)
+            )
+        else:
+            reply = await self._acreate_completion(kwargs)
+
+        if cacheable:
+            await self.response_cache.aput(key, reply)
+        return reply
+
+    @staticmethod
+    def _chunk_text(chunk: Any) -> str:
+        """提取流式响应分片中的增量文本"""
+        if not chunk.choices:
+            return ""
+        return chunk.choices[0].delta.content or ""
+
+    def _finish_turn(self, assistant_reply: str, keep_context: bool) -> str:
+        """根据 keep_context 决定保留助手回复还是回滚用户消息"""
+        self.logger.info(f"收到模型回复。回复长度: {len(assistant_reply)}")
+
+        if keep_context:
+            self.history.append(Message(role="assistant", content=assistant_reply))
+            self.logger.debug("已添加助手回复到上下文")
+        else:
+            # 不保留上下文则回滚 user 消息
+            self.history.pop()
+            self.logger.debug("已移除用户消息（keep_context=False）")
+
+        return assistant_reply
+
+    def _discard_user_message(self) -> None:
+        """移除本轮刚添加的用户消息"""
+        last = self.history.last()
+        if last is not None and last["role"] == "user":
+            self.history.pop()
+            self.logger.debug("已移除本轮用户消息")
+
+    def _rollback_turn(self, error: Exception) -> None:
+        """调用失败时移除刚添加的用户消息"""
+        self.logger.error(f"对话完成过程中出错: {str(error)}")
+        self._discard_user_message()
 
     def chat(
         self,
@@ -55,6 +389,7 @@ class LLM:
         system_prompt: Optional[str] = None,
         keep_context: bool = True,
         temperature: float = 0.7,
+        use_cache: bool = True,
     ) -> str:
         """
         发送用户输入并返回模型回复
@@ -64,6 +399,7 @@ class LLM:
             system_prompt: 可选的系统提示，仅首次有效
             keep_context: 是否将本轮对话追加到上下文
             temperature: 生成温度参数，控制回复的随机性
+            use_cache: temperature=0 时是否使用响应缓存，False 表示本次请求跳过缓存
 
         返回:
             模型回复内容
@@ -71,47 +407,332 @@ class LLM:
         异常:
             Exception: 当 API 调用失败时抛出异常
         """
-        self.logger.info(f"开始对话，用户输入长度: {len(user_input)}")
+        self._begin_turn(user_input, system_prompt)
+        self._summarize_history()
 
-        # 首次系统提示
-        if system_prompt and not self.messages:
-            self.messages.append({"role": "system", "content": system_prompt})
-            self.logger.info("已添加系统提示到对话上下文")
+        try:
+            assistant_reply = self._complete(
+                self._completion_kwargs(temperature), use_cache
+            )
+            return self._finish_turn(assistant_reply, keep_context)
 
-        self.messages.append({"role": "user", "content": user_input})
-        self.logger.debug(f"已添加用户消息到上下文。总消息数: {len(self.messages)}")
+        except Exception as e:
+            self._rollback_turn(e)
+            raise
+
+    async def achat(
+        self,
+        user_input: str,
+        system_prompt: Optional[str] = None,
+        keep_context: bool = True,
+        temperature: float = 0.7,
+        use_cache: bool = True,
+    ) -> str:
+        """
+        chat 的异步版本，使用 AsyncOpenAI 发起请求，等待期间不阻塞事件循环
+
+        参数与返回值同 chat
+        """
+        self._begin_turn(user_input, system_prompt)
+        await self._asummarize_history()
 
         try:
-            response = self.client.chat.completions.create(
-                model=self.model,
-                messages=self.messages,
-                temperature=temperature,
-                max_tokens=2048,
-                top_p=1,
-                frequency_penalty=0,
-                presence_penalty=0,
+            assistant_reply = await self._acomplete(
+                self._completion_kwargs(temperature), use_cache
             )
+            return self._finish_turn(assistant_reply, keep_context)
 
-            assistant_reply = response.choices[0].message.content.strip()
-            self.logger.info(f"收到模型回复。回复长度: {len(assistant_reply)}")
+        except Exception as e:
+            self._rollback_turn(e)
+            raise
 
-            if keep_context:
-                self.messages.append({"role": "assistant", "content": assistant_reply})
-                self.logger.debug("已添加助手回复到上下文")
-            else:
-                # 不保留上下文则回滚 user 消息
-                self.messages.pop()
-                self.logger.debug("已移除用户消息（keep_context=False）")
+    def chat_stream(
+        self,
+        user_input: str,
+        system_prompt: Optional[str] = None,
+        keep_context: bool = True,
+        temperature: float = 0.7,
+    ) -> Iterator[str]:
+        """
+        以流式方式发送用户输入，逐段产出模型回复
 
-            return assistant_reply
+        参数与 chat 相同。全部分片接收完毕后，拼接好的完整回复按
+        keep_context 追加到上下文；调用失败或调用方提前停止迭代时回滚用户消息
+
+        返回:
+            增量文本片段的迭代器
+        """
+        self._begin_turn(user_input, system_prompt)
+        self._summarize_history()
+        parts: List[str] = []
+
+        try:
+            kwargs = self._completion_kwargs(temperature, stream=True)
+            # 读取完整个流之前一直借用客户端，避免其连接池被 LRU 淘汰关闭
+            with self._stream_endpoint() as base_url, self.client_pool.lease(
+                self.api_key, base_url
+            ) as client:
+                # 收到首个分片后释放上游的并发槽位；限流与重试只作用于建立流的请求
+                with self._limiter_for(base_url).stream(
+                    lambda: client.chat.completions.create(**kwargs)
+                ) as stream:
+                    for chunk in stream:
+                        text = self._chunk_text(chunk)
+                        if text:
+                            parts.append(text)
+                            yield text
+            self._finish_turn("".join(parts).strip(), keep_context)
 
         except Exception as e:
-            self.logger.error(f"对话完成过程中出错: {str(e)}")
-            # 如果出错，移除刚添加的用户消息
-            if self.messages and self.messages[-1]["role"] == "user":
-                self.messages.pop()
-                self.logger.debug("由于错误已移除用户消息")
+            self._rollback_turn(e)
             raise
+        except BaseException:
+            # 调用方提前停止迭代（GeneratorExit）或任务被取消
+            self.logger.warning("流式对话被中断，回滚本轮用户消息")
+            self._discard_user_message()
+            raise
+
+    async def achat_stream(
+        self,
+        user_input: str,
+        system_prompt: Optional[str] = None,
+        keep_context: bool = True,
+        temperature: float = 0.7,
+    ) -> AsyncIterator[str]:
+        """
+        chat_stream 的异步版本，基于 AsyncOpenAI 的流式接口
+
+        参数与返回值同 chat_stream
+        """
+        self._begin_turn(user_input, system_prompt)
+        await self._asummarize_history()
+        parts: List[str] = []
+
+        try:
+            kwargs = self._completion_kwargs(temperature, stream=True)
+            # 读取完整个流之前一直借用客户端，避免其连接池被 LRU 淘汰关闭
+            with self._stream_endpoint() as base_url, self.client_pool.lease(
+                self.api_key, base_url, asynchronous=True
+            ) as client:
+                # 收到首个分片后释放上游的并发槽位；限流与重试只作用于建立流的请求
+                async with self._limiter_for(base_url).astream(
+                    lambda: client.chat.completions.create(**kwargs)
+                ) as stream:
+                    async for chunk in stream:
+                        text = self._chunk_text(chunk)
+                        if text:
+                            parts.append(text)
+                            yield text
+            self._finish_turn("".join(parts).strip(), keep_context)
+
+        except Exception as e:
+            self._rollback_turn(e)
+            raise
+        except BaseException:
+            # 调用方提前停止迭代（GeneratorExit）或任务被取消
+            self.logger.warning("流式对话被中断，回滚本轮用户消息")
+            self._discard_user_message()
+            raise
+
+    def _tool_kwargs(
+        self, tools: List[Dict[str, Any]], temperature: float, tool_choice: Any
+    ) -> Dict[str, Any]:
+        """构造带工具定义的请求参数"""
+        kwargs = self._completion_kwargs(temperature)
+        if tools:
+            kwargs["tools"] = tools
+            kwargs["tool_choice"] = tool_choice
+        return kwargs
+
+    def _append_tool_reply(self, message: Any) -> Dict[str, Any]:
+        """将模型回复（可能包含工具调用）追加到上下文并返回该消息"""
+        reply = Message(role="assistant", content=message.content or "")
+        if message.tool_calls:
+            reply["tool_calls"] = [
+                {
+                    "id": call.id,
+                    "type": "function",
+                    "function": {
+                        "name": call.function.name,
+                        "arguments": call.function.arguments,
+                    },
+                }
+                for call in message.tool_calls
+            ]
+        self.history.append(reply)
+        self.logger.info(
+            f"收到模型回复，工具调用数: {len(reply.get('tool_calls', []))}，"
+            f"文本长度: {len(reply['content'])}"
+        )
+        return reply
+
+    def chat_step(
+        self,
+        user_input: Optional[str],
+        tools: List[Dict[str, Any]],
+        system_prompt: Optional[str] = None,
+        temperature: float = 0.7,
+        tool_choice: Any = "auto",
+    ) -> Dict[str, Any]:
+        """
+        执行一次允许工具调用的补全，模型回复（含 tool_calls）追加到上下文
+
+        工具调用请求可能有副作用，不使用响应缓存与请求合并
+
+        参数:
+            user_input: 用户本轮输入，为 None 时在现有上下文（如刚追加的工具结果）上继续
+            tools: OpenAI 格式的工具定义列表
+            system_prompt: 可选的系统提示，仅首次有效
+            temperature: 生成温度参数
+            tool_choice: 工具选择策略，auto / none / required 或指定工具
+
+        返回:
+            助手消息，包含 content，以及模型请求工具调用时的 tool_calls
+        """
+        if user_input is not None:
+            self._begin_turn(user_input, system_prompt)
+        self._summarize_history()
+
+        try:
+            response = self._create_response(
+                self._tool_kwargs(tools, temperature, tool_choice)
+            )
+            return self._append_tool_reply(response.choices[0].message)
+
+        except Exception as e:
+            self.logger.error(f"工具调用补全出错: {str(e)}")
+            if user_input is not None:
+                self._discard_user_message()
+            raise
+
+    async def achat_step(
+        self,
+        user_input: Optional[str],
+        tools: List[Dict[str, Any]],
+        system_prompt: Optional[str] = None,
+        temperature: float = 0.7,
+        tool_choice: Any = "auto",
+    ) -> Dict[str, Any]:
+        """
+        chat_step 的异步版本
+
+        参数与返回值同 chat_step
+        """
+        if user_input is not None:
+            self._begin_turn(user_input, system_prompt)
+        await self._asummarize_history()
+
+        try:
+            response = await self._acreate_response(
+                self._tool_kwargs(tools, temperature, tool_choice)
+            )
+            return self._append_tool_reply(response.choices[0].message)
+
+        except Exception as e:
+            self.logger.error(f"工具调用补全出错: {str(e)}")
+            if user_input is not None:
+                self._discard_user_message()
+            raise
+
+    def add_tool_result(self, tool_call_id: str, content: str) -> None:
+        """将一次工具调用的结果追加到上下文"""
+        self.history.append(
+            Message(role="tool", tool_call_id=tool_call_id, content=content)
+        )
+
+    @staticmethod
+    def _batch_messages(item: Dict[str, Any]) -> List[Dict[str, str]]:
+        """构造批量请求中单个条目的独立消息列表"""
+        messages = []
+        if item.get("system_prompt"):
+            messages.append({"role": "system", "content": item["system_prompt"]})
+        messages.append({"role": "user", "content": item["message"]})
+        return messages
+
+    def _batch_kwargs(self, item: Dict[str, Any]) -> Dict[str, Any]:
+        """构造批量请求中单个条目的请求参数"""
+        return self._completion_kwargs(
+            item.get("temperature", 0.7), messages=self._batch_messages(item)
+        )
+
+    @staticmethod
+    def _batch_result(
+        index: int, started: float, reply: Optional[str] = None, error: Any = None
+    ) -> Dict[str, Any]:
+        """构造批量请求中单个条目的结果"""
+        result: Dict[str, Any] = {
+            "index": index,
+            "elapsed": round(time.perf_counter() - started, 3),
+        }
+        if error is not None:
+            result["error"] = str(error)
+        else:
+            result["response"] = reply
+        return result
+
+    def chat_many(
+        self, items: Iterable[Dict[str, Any]], concurrency: int = 8
+    ) -> Iterator[Dict[str, Any]]:
+        """
+        并发执行多个相互独立的单轮对话，按完成顺序逐个返回结果
+
+        各条目不读取也不修改当前上下文，单个条目失败不会影响其他条目
+
+        参数:
+            items: 请求条目，每项包含 message，可选 system_prompt、temperature、use_cache
+            concurrency: 同时发往上游的最大请求数
+
+        返回:
+            结果迭代器，每项包含 index、elapsed，以及 response 或 error
+        """
+        items = list(items)
+        self.logger.info(f"开始批量对话，条目数: {len(items)}，并发上限: {concurrency}")
+
+        def run(index: int, item: Dict[str, Any]) -> Dict[str, Any]:
+            started = time.perf_counter()
+            try:
+                reply = self._complete(
+                    self._batch_kwargs(item), item.get("use_cache", True)
+                )
+                return self._batch_result(index, started, reply=reply)
+            except Exception as e:
+                self.logger.warning(f"批量对话条目 {index} 失败: {e}")
+                return self._batch_result(index, started, error=e)
+
+        with ThreadPoolExecutor(max_workers=max(1, concurrency)) as executor:
+            futures = [
+                executor.submit(run, index, item) for index, item in enumerate(items)
+            ]
+            for future in as_completed(futures):
+                yield future.result()
+
+    async def achat_many(
+        self, items: Iterable[Dict[str, Any]], concurrency: int = 8
+    ) -> AsyncIterator[Dict[str, Any]]:
+        """
+        chat_many 的异步版本
+
+        固定数量的协程从条目迭代器中依次取任务，条目不会被一次性全部展开为任务；
+        调用方提前停止迭代时取消剩余请求
+
+        参数与返回值同 chat_many
+        """
+        self.logger.info(f"开始异步批量对话，并发上限: {max(1, concurrency)}")
+
+        async def run(entry: Tuple[int, Dict[str, Any]]) -> Dict[str, Any]:
+            index, item = entry
+            started = time.perf_counter()
+            try:
+                reply = await self._acomplete(
+                    self._batch_kwargs(item), item.get("use_cache", True)
+                )
+                return self._batch_result(index, started, reply=reply)
+            except Exception as e:
+                self.logger.warning(f"批量对话条目 {index} 失败: {e}")
+                return self._batch_result(index, started, error=e)
+
+        async for _, result in bounded_map(run, enumerate(items), concurrency):
+            yield result
 
     def delete_last_qa(self) -> bool:
         """
@@ -123,7 +744,7 @@ class LLM:
         self.logger.info("尝试删除上一条问答对话")
 
         # 检查是否有足够的消息可以删除
-        if len(self.messages) < 2:
+        if len(self.history) < 2:
             self.logger.warning("没有足够的消息可以删除问答对")
             return False
 
@@ -131,14 +752,16 @@ class LLM:
         deleted_count = 0
 
         # 从后往前查找，删除最后的助手回复
-        if self.messages and self.messages[-1]["role"] == "assistant":
-            removed_message = self.messages.pop()
+        last = self.history.last()
+        if last is not None and last["role"] == "assistant":
+            removed_message = self.history.pop()
             deleted_count += 1
             self.logger.debug(f"已删除助手回复: {removed_message['content'][:50]}...")
 
         # 删除对应的用户问题
-        if self.messages and self.messages[-1]["role"] == "user":
-            removed_message = self.messages.pop()
+        last = self.history.last()
+        if last is not None and last["role"] == "user":
+            removed_message = self.history.pop()
             deleted_count += 1
             self.logger.debug(f"已删除用户问题: {removed_message['content'][:50]}...")
 
@@ -151,8 +774,8 @@ class LLM:
 
     def clear_context(self) -> None:
         """清空当前对话上下文"""
-        previous_count = len(self.messages)
-        self.messages.clear()
+        previous_count = len(self.history)
+        self.history.clear()
         self.logger.info(f"已清空对话上下文。移除了 {previous_count} 条消息")
 
     def get_context(self) -> List[Dict[str, str]]:
@@ -162,8 +785,8 @@ class LLM:
         返回:
             当前对话上下文的副本
         """
-        self.logger.debug(f"获取对话上下文，包含 {len(self.messages)} 条消息")
-        return self.messages.copy()
+        self.logger.debug(f"获取对话上下文，包含 {len(self.history)} 条消息")
+        return self.history.messages()
 
     def set_context(self, history: List[Dict[str, str]]) -> None:
         """
@@ -172,9 +795,56 @@ class LLM:
         参数:
             history: 要设置的对话历史记录
         """
-        previous_count = len(self.messages)
-        self.messages = history.copy()
+        previous_count = len(self.history)
+        self.history.reset(history)
         self.logger.info(
-            f"已设置对话上下文。之前: {previous_count} 条，现在: {len(self.messages)} 条消息"
+            f"已设置对话上下文。之前: {previous_count} 条，现在: {len(self.history)} 条消息"
         )
 
+    def fork(self, branch: str, at: Optional[str] = None) -> None:
+        """
+        从当前分支头或指定轮次分叉出新分支并切换过去，与原分支共享公共前缀
+
+        参数:
+            branch: 新分支名
+            at: 分叉位置的消息节点 ID（见 get_context_nodes），为 None 时从当前分支头分叉
+
+        异常:
+            ValueError: 分支已存在
+            KeyError: 节点不存在
+        """
+        self.history.fork(branch, at)
+        self.logger.info(f"已创建并切换到分支: {branch}，消息数: {len(self.history)}")
+
+    def checkout(self, branch: str) -> None:
+        """
+        切换到已有分支
+
+        异常:
+            KeyError: 分支不存在
+        """
+        self.history.checkout(branch)
+        self.logger.info(f"已切换到分支: {branch}，消息数: {len(self.history)}")
+
+    def undo(self, to: Optional[str] = None) -> None:
+        """
+        将当前分支回退到指定消息节点（保留该节点），为 None 时清空当前分支
+
+        被回退的消息仍可通过其节点 ID 再次回到该位置
+
+        异常:
+            KeyError: 节点不存在
+        """
+        self.history.rewind(to)
+        self.logger.info(f"已回退当前分支，消息数: {len(self.history)}")
+
+    def list_branches(self) -> List[Dict[str, Any]]:
+        """返回所有分支的名称、头节点 ID、消息数以及是否为当前分支"""
+        return self.history.branch_list()
+
+    def get_context_nodes(self) -> List[Dict[str, Any]]:
+        """返回当前分支的消息及其节点 ID，节点 ID 可用于 fork 与 undo"""
+        return [
+            {"id": node.node_id, **node.message} for node in self.history.path()
+        ]
+
@@ -0,0 +1,298 @@
+"""
+LLM 响应缓存
+
+对确定性请求（temperature=0）按 (API 密钥, model, base_url, messages, 采样参数) 的哈希缓存模型回复，
+不同密钥的请求互不命中；包含内存 LRU 层与可选的本地 SQLite 磁盘层，均带 TTL，磁盘层按总字节数限制
+"""
+
+import asyncio
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+from src.core.base.cache import LRUCache
+from src.core.base.logger import get_logger
+
+# 参与缓存键计算的采样参数
+SAMPLING_PARAMS = (
+    "temperature",
+    "max_tokens",
+    "top_p",
+    "frequency_penalty",
+    "presence_penalty",
+)
+
+
+def request_key(
+    model: str,
+    base_url: Optional[str],
+    messages: List[Dict[str, Any]],
+    params: Dict[str, Any],
+    api_key: Optional[str] = None,
+) -> str:
+    """
+    计算请求的缓存键
+
+    键包含 API 密钥的哈希：缓存命中不会绕过上游鉴权，也不会把一个密钥的回复返回给另一个密钥
+
+    参数:
+        model: 模型名称
+        base_url: API 基础 URL
+        messages: 实际发送给上游的消息列表
+        params: 请求参数，只取其中的采样参数
+        api_key: 发起请求的 API 密钥，为 None 时表示使用环境变量中的密钥
+
+    返回:
+        SHA-256 十六进制摘要
+    """
+    payload = {
+        "credential": hashlib.sha256(api_key.encode("utf-8")).hexdigest() if api_key else None,
+        "model": model,
+        "base_url": base_url,
+        "messages": messages,
+        "params": {name: params.get(name) for name in SAMPLING_PARAMS},
+    }
+    encoded = json.dumps(payload, ensure_ascii=False, sort_keys=True, default=str)
+    return hashlib.sha256(encoded.encode("utf-8")).hexdigest()
+
+
+class ResponseCache:
+    """
+    两级响应缓存：内存 LRU + 可选 SQLite 磁盘层
+
+    属性:
+        memory: 内存 LRU 层
+        db_path: 磁盘层数据库路径，为 None 时不启用磁盘层
+        ttl: 缓存有效期（秒）
+        disk_max_bytes: 磁盘层回复总字节数上限
+        purge_interval: 写入时清理过期条目的最短间隔（秒）
+    """
+
+    def __init__(
+        self,
+        max_items: int = 1024,
+        ttl: Optional[float] = 3600.0,
+        db_path: Optional[str] = None,
+        disk_max_bytes: int = 256 * 1024 * 1024,
+        purge_interval: float = 300.0,
+    ) -> None:
+        """
+        初始化响应缓存
+
+        参数:
+            max_items: 内存层最多缓存的回复数量
+            ttl: 缓存有效期（秒），None 表示不过期
+            db_path: 磁盘层 SQLite 文件路径，为 None 时只使用内存层
+            disk_max_bytes: 磁盘层回复总字节数上限，超过时先清理过期条目，再淘汰最早写入的条目
+            purge_interval: 两次清理过期条目之间的最短间隔（秒），清理在写入时顺带进行
+        """
+        self.logger = get_logger(self.__class__.__name__)
+        self.ttl = ttl
+        self.memory: LRUCache[str, str] = LRUCache(max_items=max_items, ttl=ttl)
+        self.disk_max_bytes = disk_max_bytes
+        self.purge_interval = purge_interval
+        self.disk_hits = 0
+        self.disk_evictions = 0
+        self.disk_expirations = 0
+        self.misses = 0
+        self.bypassed = 0
+
+        self.db_path = Path(db_path) if db_path else None
+        self._conn: Optional[sqlite3.Connection] = None
+        self._lock = threading.Lock()
+        self._disk_bytes = 0
+        self._purged_at = time.monotonic()
+        if self.db_path:
+            self.db_path.parent.mkdir(parents=True, exist_ok=True)
+            self._conn = sqlite3.connect(str(self.db_path), check_same_thread=False)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS responses (
+                    key TEXT PRIMARY KEY,
+                    response TEXT NOT NULL,
+                    expires_at REAL,
+                    size INTEGER NOT NULL DEFAULT 0
+                )
+                """
+            )
+            columns = {row[1] for row in self._conn.execute("PRAGMA table_info(responses)")}
+            if "size" not in columns:
+                # 兼容不含 size 列的旧数据库
+                self._conn.execute(
+                    "ALTER TABLE responses ADD COLUMN size INTEGER NOT NULL DEFAULT 0"
+                )
+                self._conn.execute("UPDATE responses SET size = LENGTH(CAST(response AS BLOB))")
+            self._conn.commit()
+            self._disk_bytes = self._conn.execute(
+                "SELECT COALESCE(SUM(size), 0) FROM responses"
+            ).fetchone()[0]
+            self.logger.info(f"LLM 响应缓存磁盘层已启用: {self.db_path}")
+
+    def get(self, key: str) -> Optional[str]:
+        """读取缓存，内存层未命中时查询磁盘层并回填内存层"""
+        response = self.memory.get(key)
+        if response is not None:
+            return response
+        return self._get_disk(key)
+
+    async def aget(self, key: str) -> Optional[str]:
+        """get 的异步版本，磁盘层查询在线程池中执行，不阻塞事件循环"""
+        response = self.memory.get(key)
+        if response is not None:
+            return response
+        if self._conn is None:
+            self.misses += 1
+            return None
+        return await asyncio.to_thread(self._get_disk, key)
+
+    def _get_disk(self, key: str) -> Optional[str]:
+        """查询磁盘层，命中时回填内存层"""
+        if self._conn is not None:
+            with self._lock:
+                row = self._conn.execute(
+                    "SELECT response, expires_at FROM responses WHERE key = ?", (key,)
+                ).fetchone()
+            if row is not None:
+                response, expires_at = row
+                if expires_at is None or expires_at > time.time():
+                    self.disk_hits += 1
+                    self.memory.put(key, response)
+                    return response
+
+        self.misses += 1
+        return None
+
+    def put(self, key: str, response: str) -> None:
+        """写入内存层与磁盘层"""
+        self.memory.put(key, response)
+        self._put_disk(key, response)
+
+    async def aput(self, key: str, response: str) -> None:
+        """put 的异步版本，磁盘层写入在线程池中执行"""
+        self.memory.put(key, response)
+        if self._conn is not None:
+            await asyncio.to_thread(self._put_disk, key, response)
+
+    def _put_disk(self, key: str, response: str) -> None:
+        """写入磁盘层，超过容量时淘汰，并按间隔顺带清理过期条目"""
+        if self._conn is None:
+            return
+        expires_at = time.time() + self.ttl if self.ttl else None
+        size = len(response.encode("utf-8"))
+        with self._lock:
+            previous = self._conn.execute(
+                "SELECT size FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses (key, response, expires_at, size) "
+                "VALUES (?, ?, ?, ?)",
+                (key, response, expires_at, size),
+            )
+            self._disk_bytes += size - (previous[0] if previous else 0)
+            if (
+                self._disk_bytes > self.disk_max_bytes
+                or time.monotonic() - self._purged_at >= self.purge_interval
+            ):
+                self._purge_disk()
+            if self._disk_bytes > self.disk_max_bytes:
+                self._evict_disk()
+            self._conn.commit()
+
+    def _purge_disk(self) -> int:
+        """持有锁时调用：删除磁盘层已过期的条目"""
+        self._purged_at = time.monotonic()
+        expired = self._conn.execute(
+            "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses "
+            "WHERE expires_at IS NOT NULL AND expires_at <= ?",
+            (time.time(),),
+        ).fetchone()
+        if expired[0]:
+            self._conn.execute(
+                "DELETE FROM responses WHERE expires_at IS NOT NULL AND expires_at <= ?",
+                (time.time(),),
+            )
+            self._disk_bytes -= expired[1]
+            self.disk_expirations += expired[0]
+        return expired[0]
+
+    def _evict_disk(self) -> None:
+        """持有锁时调用：按写入顺序从旧到新删除，直到总字节数回到上限的 90%"""
+        target = int(self.disk_max_bytes * 0.9)
+        rows = self._conn.execute(
+            "SELECT key, size FROM responses ORDER BY rowid"
+        ).fetchall()
+        evicted = []
+        for key, size in rows:
+            if self._disk_bytes <= target:
+                break
+            evicted.append((key,))
+            self._disk_bytes -= size
+        self._conn.executemany("DELETE FROM responses WHERE key = ?", evicted)
+        self.disk_evictions += len(evicted)
+        self.logger.info(f"LLM 响应缓存磁盘层淘汰 {len(evicted)} 条回复")
+
+    def record_bypass(self) -> None:
+        """记录一次显式跳过缓存的请求"""
+        self.bypassed += 1
+
+    def purge_expired(self) -> int:
+        """清理两级缓存中已过期的条目，返回磁盘层删除的条目数"""
+        self.memory.purge_expired()
+        if self._conn is None:
+            return 0
+        with self._lock:
+            removed = self._purge_disk()
+            self._conn.commit()
+        return removed
+
+    def stats(self) -> Dict[str, Any]:
+        """返回缓存命中统计"""
+        memory = self.memory.stats()
+        hits = memory["hits"] + self.disk_hits
+        lookups = hits + self.misses
+        return {
+            "memory": memory,
+            "disk_enabled": self._conn is not None,
+            "disk_bytes": self._disk_bytes,
+            "disk_max_bytes": self.disk_max_bytes if self._conn is not None else None,
+            "memory_hits": memory["hits"],
+            "disk_hits": self.disk_hits,
+            "disk_evictions": self.disk_evictions,
+            "disk_expirations": self.disk_expirations,
+            "misses": self.misses,
+            "bypassed": self.bypassed,
+            "hit_rate": hits / lookups if lookups else 0.0,
+        }
+
+
+_response_cache: Optional[ResponseCache] = None
+
+
+def get_response_cache() -> ResponseCache:
+    """
+    获取进程级响应缓存
+
+    通过环境变量配置:
+        LLM_CACHE_SIZE: 内存层容量
+        LLM_CACHE_TTL: 缓存有效期（秒），0 表示不过期
+        LLM_CACHE_DB: 磁盘层 SQLite 文件路径，未设置时不启用磁盘层
+        LLM_CACHE_DISK_MAX_BYTES: 磁盘层回复总字节数上限
+    """
+    global _response_cache
+    if _response_cache is None:
+        _response_cache = ResponseCache(
+            max_items=int(os.getenv("LLM_CACHE_SIZE", "1024")),
+            ttl=float(os.getenv("LLM_CACHE_TTL", "3600")) or None,
+            db_path=os.getenv("LLM_CACHE_DB") or None,
+            disk_max_bytes=int(
+                os.getenv("LLM_CACHE_DISK_MAX_BYTES", str(256 * 1024 * 1024))
+            ),
+        )
+    return _response_cache
@@ -0,0 +1,243 @@
+"""
+OpenAI 客户端连接池
+
+按 (api_key, base_url) 复用进程内的 OpenAI / AsyncOpenAI 客户端，
+避免每个请求都重新建立连接池与 TLS 握手
+"""
+
+import asyncio
+import hashlib
+import os
+import threading
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, Optional, Tuple, Union
+
+import httpx
+from openai import AsyncOpenAI, OpenAI
+
+from src.core.base.cache import LRUCache
+from src.core.base.logger import get_logger
+
+ClientKey = Tuple[str, Optional[str], bool]
+
+
+def key_fingerprint(api_key: Optional[str], length: int = 8) -> str:
+    """
+    返回 API 密钥的短哈希，用于日志与按密钥隔离的键，避免暴露密钥本身
+
+    参数:
+        api_key: API 密钥，为空时表示使用环境变量中的密钥
+        length: 哈希的十六进制位数，用作持久化的隔离键时应取更长的值以避免碰撞
+    """
+    if not api_key:
+        return "环境变量"
+    return hashlib.sha256(api_key.encode("utf-8")).hexdigest()[:length]
+
+
+class ClientPool:
+    """
+    进程级 OpenAI 客户端注册表
+
+    以 (api_key, base_url, 是否异步) 为键缓存客户端，超过容量时按 LRU 淘汰并关闭
+    被淘汰客户端的连接池；每个客户端的 httpx 连接池限制空闲连接数与保活时长。
+    通过 lease 借出的客户端在归还前不会被关闭，被淘汰时延迟到最后一个借用方归还后再关闭
+
+    属性:
+        cache: 底层 LRU 缓存，提供命中率等统计信息
+        limits: 每个客户端使用的 httpx 连接池限制
+    """
+
+    def __init__(
+        self,
+        max_clients: int = 32,
+        max_connections: int = 100,
+        max_keepalive_connections: int = 20,
+        keepalive_expiry: float = 30.0,
+        timeout: float = 600.0,
+        connect_timeout: float = 5.0,
+    ) -> None:
+        """
+        初始化客户端池
+
+        参数:
+            max_clients: 最多缓存的客户端数量
+            max_connections: 单个客户端的最大连接数
+            max_keepalive_connections: 单个客户端保留的最大空闲连接数
+            keepalive_expiry: 空闲连接的保活时长（秒）
+            timeout: 请求超时时间（秒）
+            connect_timeout: 建立连接的超时时间（秒）
+        """
+        self.logger = get_logger(self.__class__.__name__)
+        self.limits = httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_keepalive_connections,
+            keepalive_expiry=keepalive_expiry,
+        )
+        self.timeout = httpx.Timeout(timeout, connect=connect_timeout)
+        self.cache: LRUCache[ClientKey, Union[OpenAI, AsyncOpenAI]] = LRUCache(
+            max_items=max_clients, on_evict=self._close_client
+        )
+        # 创建客户端与借出计数共用一把锁；淘汰回调在 put 内触发，需要可重入
+        self._lock = threading.RLock()
+        # id(client) -> 借出次数
+        self._leases: Dict[int, int] = {}
+        # 已被淘汰但仍有借用方的客户端，id(client) -> (键, 客户端)
+        self._retired: Dict[int, Tuple[ClientKey, Union[OpenAI, AsyncOpenAI]]] = {}
+
+    def get(
+        self,
+        api_key: Optional[str] = None,
+        base_url: Optional[str] = None,
+        asynchronous: bool = False,
+    ) -> Union[OpenAI, AsyncOpenAI]:
+        """
+        获取（必要时创建）与凭据和基础 URL 对应的客户端
+
+        参数:
+            api_key: API 密钥，为 None 时由 OpenAI SDK 读取环境变量
+            base_url: 自定义基础 URL
+            asynchronous: 为 True 时返回 AsyncOpenAI 客户端
+
+        返回:
+            可复用的 OpenAI 或 AsyncOpenAI 客户端
+        """
+        key: ClientKey = (api_key or "", base_url, asynchronous)
+        client = self.cache.get(key)
+        if client is not None:
+            return client
+
+        with self._lock:
+            # 加锁后再查一次，并发未命中的线程只有一个创建客户端
+            client = self.cache.get(key)
+            if client is not None:
+                return client
+            client = self._create_client(api_key, base_url, asynchronous)
+            self.cache.put(key, client)
+        self.logger.info(
+            f"已创建{'异步' if asynchronous else '同步'} OpenAI 客户端，"
+            f"密钥指纹: {key_fingerprint(api_key)}，基础 URL: {base_url or '默认'}"
+        )
+        return client
+
+    @contextmanager
+    def lease(
+        self,
+        api_key: Optional[str] = None,
+        base_url: Optional[str] = None,
+        asynchronous: bool = False,
+    ) -> Iterator[Union[OpenAI, AsyncOpenAI]]:
+        """
+        借出客户端，with 块结束前即使客户端被 LRU 淘汰也不会关闭其连接池
+
+        参数同 get；请求（包括流式响应的整个读取过程）应在 with 块内完成
+        """
+        with self._lock:
+            client = self.get(api_key, base_url, asynchronous)
+            self._leases[id(client)] = self._leases.get(id(client), 0) + 1
+        try:
+            yield client
+        finally:
+            self._return(client)
+
+    def _return(self, client: Union[OpenAI, AsyncOpenAI]) -> None:
+        """归还借出的客户端；已被淘汰且没有其他借用方时关闭"""
+        with self._lock:
+            remaining = self._leases[id(client)] - 1
+            if remaining:
+                self._leases[id(client)] = remaining
+                return
+            del self._leases[id(client)]
+            retired = self._retired.pop(id(client), None)
+        if retired is not None:
+            self._close_now(*retired)
+
+    def _create_client(
+        self, api_key: Optional[str], base_url: Optional[str], asynchronous: bool
+    ) -> Union[OpenAI, AsyncOpenAI]:
+        """创建带连接池限制的客户端"""
+        # 重试由 ratelimit.UpstreamLimiter 统一负责，关闭 SDK 内置重试避免叠加
+        client_kwargs: Dict[str, Any] = {"max_retries": 0}
+        if api_key:
+            client_kwargs["api_key"] = api_key
+        if base_url:
+            client_kwargs["base_url"] = base_url
+
+        if asynchronous:
+            http_client = httpx.AsyncClient(
+                limits=self.limits, timeout=self.timeout, follow_redirects=True
+            )
+            return AsyncOpenAI(http_client=http_client, **client_kwargs)
+
+        http_client = httpx.Client(
+            limits=self.limits, timeout=self.timeout, follow_redirects=True
+        )
+        return OpenAI(http_client=http_client, **client_kwargs)
+
+    def _close_client(self, key: ClientKey, client: Union[OpenAI, AsyncOpenAI]) -> None:
+        """淘汰回调：客户端仍被借用时推迟到归还后关闭，否则立即关闭"""
+        with self._lock:
+            if self._leases.get(id(client)):
+                self._retired[id(client)] = (key, client)
+                self.logger.debug(f"客户端仍在使用中，推迟关闭，基础 URL: {key[1] or '默认'}")
+                return
+        self._close_now(key, client)
+
+    def _close_now(self, key: ClientKey, client: Union[OpenAI, AsyncOpenAI]) -> None:
+        """关闭客户端的连接池"""
+        try:
+            if isinstance(client, AsyncOpenAI):
+                try:
+                    loop = asyncio.get_running_loop()
+                except RuntimeError:
+                    # 没有运行中的事件循环时无法 await，交由垃圾回收释放
+                    return
+                loop.create_task(client.close())
+            else:
+                client.close()
+            self.logger.debug(f"已关闭客户端，基础 URL: {key[1] or '默认'}")
+        except Exception as e:
+            self.logger.warning(f"关闭客户端失败: {e}")
+
+    def stats(self) -> Dict[str, Any]:
+        """返回客户端池统计信息（容量、命中率、淘汰次数等）"""
+        stats = self.cache.stats()
+        with self._lock:
+            stats["leased"] = sum(self._leases.values())
+            stats["retired"] = len(self._retired)
+        stats["max_keepalive_connections"] = self.limits.max_keepalive_connections
+        stats["keepalive_expiry"] = self.limits.keepalive_expiry
+        return stats
+
+    async def aclose(self) -> None:
+        """关闭并移除所有客户端，包括已被淘汰但尚未归还的客户端"""
+        with self._lock:
+            retired = list(self._retired.values())
+            self._retired.clear()
+        for _, client in self.cache.items() + retired:
+            try:
+                if isinstance(client, AsyncOpenAI):
+                    await client.close()
+                else:
+                    client.close()
+            except Exception as e:
+                self.logger.warning(f"关闭客户端失败: {e}")
+        # 客户端已手动关闭，清空时跳过淘汰回调
+        on_evict, self.cache.on_evict = self.cache.on_evict, None
+        self.cache.clear()
+        self.cache.on_evict = on_evict
+
+
+_client_pool: Optional[ClientPool] = None
+
+
+def get_client_pool() -> ClientPool:
+    """获取进程级客户端池，容量等参数可通过环境变量配置"""
+    global _client_pool
+    if _client_pool is None:
+        _client_pool = ClientPool(
+            max_clients=int(os.getenv("LLM_CLIENT_POOL_SIZE", "32")),
+            max_connections=int(os.getenv("LLM_MAX_CONNECTIONS", "100")),
+            max_keepalive_connections=int(os.getenv("LLM_MAX_KEEPALIVE", "20")),
+            keepalive_expiry=float(os.getenv("LLM_KEEPALIVE_EXPIRY", "30")),
+        )
+    return _client_pool
@@ -0,0 +1,241 @@
+"""
+LLM 上下文窗口管理
+
+按 token 预算裁剪发送给上游的消息列表，使长会话的提示长度与延迟保持有界。
+每条消息的 token 数在首次计算后缓存在消息对象上，后续轮次不再重复计算
+"""
+
+import json
+from typing import Any, Dict, List, Optional, Tuple
+
+from src.core.base.logger import get_logger
+
+try:
+    import tiktoken
+except ImportError:  # tiktoken 为可选依赖，缺失时使用字符数估算
+    tiktoken = None
+
+# 滚动摘要消息的内容前缀，用于与普通系统提示区分
+SUMMARY_PREFIX = "[对话摘要]"
+
+# 每条消息在 chat 格式中的固定开销（role、分隔符等）
+MESSAGE_OVERHEAD_TOKENS = 4
+
+CONTEXT_POLICIES = ("drop_oldest", "pin_system", "summarize")
+
+# (固定保留的系统提示, 需要丢弃或摘要的早期消息, 保留的近期消息)
+MessageSplit = Tuple[List[Dict[str, Any]], List[Dict[str, Any]], List[Dict[str, Any]]]
+
+
+class Message(dict):
+    """
+    对话消息，行为与普通 dict 一致，可直接发送给 OpenAI SDK
+
+    额外在对象上缓存 token 计数，消息内容视为不可变
+    """
+
+    __slots__ = ("token_cache",)
+
+    def __init__(self, *args: Any, **kwargs: Any) -> None:
+        super().__init__(*args, **kwargs)
+        # (编码名称, token 数)
+        self.token_cache: Optional[Tuple[str, int]] = None
+
+
+def is_summary(message: Dict[str, Any]) -> bool:
+    """判断消息是否为滚动摘要"""
+    content = message.get("content")
+    return (
+        message.get("role") == "system"
+        and isinstance(content, str)
+        and content.startswith(SUMMARY_PREFIX)
+    )
+
+
+class TokenCounter:
+    """
+    消息 token 计数器
+
+    安装了 tiktoken 时使用模型对应的编码精确计数，否则按字符估算：
+    ASCII 字符约 4 个一个 token，其他字符（如中文）约 1 个一个 token
+    """
+
+    def __init__(self, model: Optional[str] = None) -> None:
+        self.encoding = None
+        self.encoding_name = "estimate"
+        if tiktoken is not None:
+            try:
+                self.encoding = tiktoken.encoding_for_model(model or "")
+            except KeyError:
+                self.encoding = tiktoken.get_encoding("cl100k_base")
+            self.encoding_name = self.encoding.name
+
+    def count_text(self, text: str) -> int:
+        """计算文本的 token 数"""
+        if not text:
+            return 0
+        if self.encoding is not None:
+            return len(self.encoding.encode(text))
+        ascii_chars = sum(1 for ch in text if ord(ch) < 128)
+        return (ascii_chars + 3) // 4 + (len(text) - ascii_chars)
+
+    def count_message(self, message: Dict[str, Any]) -> int:
+        """计算单条消息的 token 数，结果缓存在 Message 对象上"""
+        if isinstance(message, Message) and message.token_cache:
+            encoding_name, tokens = message.token_cache
+            if encoding_name == self.encoding_name:
+                return tokens
+
+        content = message.get("content")
+        if content is not None and not isinstance(content, str):
+            content = json.dumps(content, ensure_ascii=False)
+        tokens = MESSAGE_OVERHEAD_TOKENS + self.count_text(content or "")
+        if message.get("name"):
+            tokens += self.count_text(message["name"])
+        if message.get("tool_calls"):
+            tokens += self.count_text(json.dumps(message["tool_calls"], ensure_ascii=False))
+
+        if isinstance(message, Message):
+            message.token_cache = (self.encoding_name, tokens)
+        return tokens
+
+    def count_messages(self, messages: List[Dict[str, Any]]) -> int:
+        """计算消息列表的 token 总数"""
+        return sum(self.count_message(m) for m in messages)
+
+
+class ContextWindow:
+    """
+    上下文窗口预算策略
+
+    策略:
+        drop_oldest: 从最早的轮次开始整轮丢弃，系统提示也可能被丢弃
+        pin_system: 固定保留开头的系统提示，从最早的轮次开始整轮丢弃
+        summarize: 固定保留系统提示，将超出预算的早期轮次替换为滚动摘要
+
+    属性:
+        max_tokens: 提示（上下文）允许的最大 token 数
+        policy: 预算策略名称
+        summary_max_tokens: 滚动摘要的最大 token 数（仅 summarize 策略）
+        low_watermark: summarize 策略触发摘要后压缩到的预算比例
+    """
+
+    def __init__(
+        self,
+        max_tokens: int,
+        policy: str = "pin_system",
+        summary_max_tokens: int = 512,
+        low_watermark: float = 0.6,
+    ) -> None:
+        """
+        初始化上下文窗口
+
+        参数:
+            max_tokens: 提示允许的最大 token 数
+            policy: 预算策略，可选 drop_oldest、pin_system、summarize
+            summary_max_tokens: 滚动摘要的最大 token 数
+            low_watermark: summarize 策略超出预算时，把保留的消息压缩到预算的这一比例以下，
+                之后若干轮都不必再次生成摘要；为 1 时只压缩到恰好不超出预算
+        """
+        if policy not in CONTEXT_POLICIES:
+            raise ValueError(f"不支持的上下文策略: {policy}，可选: {CONTEXT_POLICIES}")
+        if max_tokens <= 0:
+            raise ValueError("max_tokens 必须为正数")
+        if not 0 < low_watermark <= 1:
+            raise ValueError("low_watermark 应在 (0, 1] 范围内")
+
+        self.max_tokens = max_tokens
+        self.policy = policy
+        self.summary_max_tokens = summary_max_tokens
+        self.low_watermark = low_watermark
+        self.logger = get_logger(self.__class__.__name__)
+
+    def split(
+        self, messages: List[Dict[str, Any]], counter: TokenCounter
+    ) -> MessageSplit:
+        """
+        按预算划分消息
+
+        summarize 策略带滞回：未超出预算时不划出任何消息；超出后划出足够多的早期轮次，
+        使保留部分降到预算的 low_watermark 以下，避免此后每一轮都再生成一次摘要
+
+        参数:
+            messages: 完整对话上下文
+            counter: token 计数器
+
+        返回:
+            (固定保留的系统提示, 需要丢弃或摘要的早期消息, 保留的近期消息)
+        """
+        pinned_count = 0
+        if self.policy != "drop_oldest":
+            while (
+                pinned_count < len(messages)
+                and messages[pinned_count].get("role") == "system"
+                and not is_summary(messages[pinned_count])
+            ):
+                pinned_count += 1
+        pinned = messages[:pinned_count]
+        rest = messages[pinned_count:]
+
+        budget = self.max_tokens - counter.count_messages(pinned)
+        total = counter.count_messages(rest)
+        if total <= budget:
+            return pinned, [], rest
+        target = budget
+        if self.policy == "summarize":
+            # 为摘要消息预留空间，并压缩到低水位
+            budget -= self.summary_max_tokens + MESSAGE_OVERHEAD_TOKENS
+            target = int(budget * self.low_watermark)
+
+        # 只在用户消息处切分，保证按整轮丢弃且最后一轮始终保留
+        cut = 0
+        for index in range(1, len(rest)):
+            if total <= target:
+                break
+            if rest[index].get("role") != "user":
+                continue
+            total -= counter.count_messages(rest[cut:index])
+            cut = index
+
+        if total > budget:
+            self.logger.warning(
+                f"最近一轮对话本身已超出上下文预算: {total} > {budget} tokens"
+            )
+        return pinned, rest[:cut], rest[cut:]
+
+    def fit(
+        self, messages: List[Dict[str, Any]], counter: TokenCounter
+    ) -> List[Dict[str, Any]]:
+        """返回按预算裁剪后、实际发送给上游的消息列表（不修改原列表）"""
+        pinned, dropped, kept = self.split(messages, counter)
+        if dropped:
+            self.logger.debug(f"上下文超出预算，本次请求省略 {len(dropped)} 条早期消息")
+        return pinned + kept
+
+    @staticmethod
+    def summary_request(dropped: List[Dict[str, Any]]) -> List[Dict[str, str]]:
+        """构造生成滚动摘要的请求消息"""
+        lines = []
+        for message in dropped:
+            content = message.get("content")
+            if content is None:
+                continue
+            if not isinstance(content, str):
+                content = json.dumps(content, ensure_ascii=False)
+            if is_summary(message):
+                lines.append(f"此前摘要: {content[len(SUMMARY_PREFIX):].strip()}")
+            else:
+                lines.append(f"{message.get('role')}: {content}")
+        return [
+            {
+                "role": "system",
+                "content": "请将以下对话压缩为简洁的摘要，保留事实、用户偏好和未完成的任务，"
+                "只输出摘要本身。",
+            },
+            {"role": "user", "content": "\n".join(lines)},
+        ]
+
+    @staticmethod
+    def summary_message(summary: str) -> Message:
+        """构造替换早期轮次的摘要消息"""
+        return Message(role="system", content=f"{SUMMARY_PREFIX} {summary.strip()}")
@@ -0,0 +1,372 @@
+"""
+结构共享的对话历史
+
+对话历史以不可变的链式节点表示，每个节点只指向父节点，
+不同分支共享公共前缀：分叉、回退到任意轮次、切换分支都只移动分支头指针，
+时间与额外内存均为 O(1)，不复制消息列表
+"""
+
+import uuid
+from typing import Any, Dict, Iterable, List, NoReturn, Optional, Set
+
+from src.core.engines.llm.context_window import Message
+
+DEFAULT_BRANCH = "main"
+
+
+class HistoryNode:
+    """
+    历史中的一条消息，创建后不再修改
+
+    属性:
+        node_id: 节点 ID，用于回退与分叉定位
+        message: 消息内容
+        parent: 父节点，首条消息为 None
+        depth: 从根到该节点的消息数
+    """
+
+    __slots__ = ("node_id", "message", "parent", "depth")
+
+    def __init__(
+        self, message: Message, parent: Optional["HistoryNode"], node_id: Optional[str] = None
+    ) -> None:
+        self.node_id = node_id or uuid.uuid4().hex[:12]
+        self.message = message
+        self.parent = parent
+        self.depth = parent.depth + 1 if parent is not None else 1
+
+
+def _message_size(message: Message) -> int:
+    return len(message.get("role", "")) + len(message.get("content") or "")
+
+
+class NodeRegistry(Dict[str, HistoryNode]):
+    """
+    节点 ID 到节点的注册表
+
+    增删节点时维护全部节点的估算字节数，size 查询不需要遍历节点
+    """
+
+    def __init__(self) -> None:
+        super().__init__()
+        self.bytes = 0
+
+    def __setitem__(self, node_id: str, node: HistoryNode) -> None:
+        previous = self.get(node_id)
+        if previous is not None:
+            self.bytes -= _message_size(previous.message)
+        super().__setitem__(node_id, node)
+        self.bytes += _message_size(node.message)
+
+    def __delitem__(self, node_id: str) -> None:
+        self.bytes -= _message_size(self[node_id].message)
+        super().__delitem__(node_id)
+
+
+class MessageList(List[Message]):
+    """
+    当前分支消息的只读列表
+
+    每次访问都是新生成的列表，原地修改不会写回历史，因此直接抛出 TypeError；
+    切片、拼接等得到的是普通列表。修改上下文请使用 MessageHistory 的方法或整体赋值
+    """
+
+    def _readonly(self, *args: Any, **kwargs: Any) -> NoReturn:
+        raise TypeError("消息列表是只读的，请通过对话历史的 append/reset 等方法修改上下文")
+
+    append = extend = insert = remove = pop = clear = sort = reverse = _readonly
+    __setitem__ = __delitem__ = __iadd__ = __imul__ = _readonly
+
+    def __reduce_ex__(self, protocol: Any) -> Any:
+        # 复制与序列化得到普通列表
+        return list, (list(self),)
+
+
+class MessageHistory:
+    """
+    带分支的对话历史
+
+    所有分支共享同一个节点注册表，分支只记录头节点；
+    被回退掉的节点仍保留在注册表中，可通过节点 ID 重新回到该位置，
+    直到 prune 丢弃不可达的节点（注册表超过 prune_bytes 时 reset 会自动 prune）
+
+    属性:
+        nodes: 节点 ID 到节点的注册表
+        branches: 分支名到分支头节点的映射，空分支为 None
+        branch: 当前分支名
+        prune_bytes: reset 后注册表超过该字节数时丢弃不可达的节点
+    """
+
+    prune_bytes = 1024 * 1024
+
+    def __init__(self) -> None:
+        self.nodes = NodeRegistry()
+        self.branches: Dict[str, Optional[HistoryNode]] = {DEFAULT_BRANCH: None}
+        self.branch = DEFAULT_BRANCH
+        # 注册表与 snapshot 出的副本共享时为 True，首次登记新节点前复制一份
+        self._shared = False
+
+    def _own_nodes(self) -> NodeRegistry:
+        """返回可写的注册表，与其他副本共享时先复制"""
+        if self._shared:
+            registry = NodeRegistry()
+            dict.update(registry, self.nodes)
+            registry.bytes = self.nodes.bytes
+            self.nodes = registry
+            self._shared = False
+        return self.nodes
+
+    @property
+    def head(self) -> Optional[HistoryNode]:
+        """当前分支的头节点"""
+        return self.branches[self.branch]
+
+    def __len__(self) -> int:
+        head = self.head
+        return head.depth if head is not None else 0
+
+    def _move_head(self, node: Optional[HistoryNode]) -> None:
+        self.branches[self.branch] = node
+
+    def append(self, message: Message) -> HistoryNode:
+        """在当前分支末尾追加消息"""
+        node = HistoryNode(message, self.head)
+        self._own_nodes()[node.node_id] = node
+        self._move_head(node)
+        return node
+
+    def last(self) -> Optional[Message]:
+        """当前分支的最后一条消息"""
+        head = self.head
+        return head.message if head is not None else None
+
+    def pop(self) -> Message:
+        """移除当前分支的最后一条消息"""
+        head = self.head
+        if head is None:
+            raise IndexError("对话历史为空")
+        self._move_head(head.parent)
+        return head.message
+
+    def clear(self) -> None:
+        """清空当前分支，其他分支不受影响"""
+        self._move_head(None)
+
+    def reset(self, messages: Iterable[Dict[str, Any]]) -> None:
+        """
+        用给定的消息列表替换当前分支
+
+        每个位置上已有内容相同的节点（同一父节点下，包括其他分支与被回退掉的节点）时沿用该节点，
+        客户端持有的节点 ID 保持有效；只为不同的消息创建新节点。
+        不可达的节点只在注册表超过 prune_bytes 时丢弃，避免反复压缩摘要时注册表无限增长
+        """
+        children: Dict[Optional[str], List[HistoryNode]] = {}
+        for node in self.nodes.values():
+            parent_id = node.parent.node_id if node.parent is not None else None
+            children.setdefault(parent_id, []).append(node)
+
+        self._move_head(None)
+        for message in messages:
+            head = self.head
+            siblings = children.get(head.node_id if head is not None else None, [])
+            match = next((node for node in siblings if node.message == message), None)
+            if match is not None:
+                self._move_head(match)
+            else:
+                self.append(message if isinstance(message, Message) else Message(message))
+        if self.nodes.bytes > self.prune_bytes:
+            self.prune()
+
+    def prune(self) -> int:
+        """
+        丢弃从所有分支头都不可达的节点（被回退掉或被 reset 替换的节点）
+
+        有节点被丢弃时换用新的注册表，此前 snapshot 出的副本仍持有原注册表，不受影响
+
+        返回:
+            丢弃的节点数
+        """
+        registry = NodeRegistry()
+        for node in self.branches.values():
+            while node is not None and node.node_id not in registry:
+                registry[node.node_id] = node
+                node = node.parent
+        removed = len(self.nodes) - len(registry)
+        if removed:
+            self.nodes = registry
+            self._shared = False
+        return removed
+
+    def messages(self) -> List[Message]:
+        """按时间顺序返回当前分支的消息列表（新列表）"""
+        return [node.message for node in self.path()]
+
+    def path(self) -> List[HistoryNode]:
+        """按时间顺序返回当前分支上的节点"""
+        nodes: List[HistoryNode] = []
+        node = self.head
+        while node is not None:
+            nodes.append(node)
+            node = node.parent
+        nodes.reverse()
+        return nodes
+
+    def _resolve(self, node_id: Optional[str]) -> Optional[HistoryNode]:
+        if node_id is None:
+            return self.head
+        node = self.nodes.get(node_id)
+        if node is None:
+            raise KeyError(f"节点不存在: {node_id}")
+        return node
+
+    def fork(self, name: str, at: Optional[str] = None) -> None:
+        """
+        从指定节点创建新分支并切换过去
+
+        参数:
+            name: 新分支名
+            at: 分叉位置的节点 ID，为 None 时从当前分支头分叉
+        """
+        if name in self.branches:
+            raise ValueError(f"分支已存在: {name}")
+        node = self._resolve(at)
+        self.branches[name] = node
+        self.branch = name
+
+    def checkout(self, name: str) -> None:
+        """切换到已有分支"""
+        if name not in self.branches:
+            raise KeyError(f"分支不存在: {name}")
+        self.branch = name
+
+    def rewind(self, node_id: Optional[str]) -> None:
+        """将当前分支头移动到指定节点，为 None 时清空当前分支"""
+        self._move_head(self._resolve(node_id) if node_id is not None else None)
+
+    def delete_branch(self, name: str) -> None:
+        """删除分支，不能删除当前分支"""
+        if name == self.branch:
+            raise ValueError(f"不能删除当前分支: {name}")
+        if name not in self.branches:
+            raise KeyError(f"分支不存在: {name}")
+        del self.branches[name]
+
+    def branch_list(self) -> List[Dict[str, Any]]:
+        """返回所有分支的名称、头节点 ID 与消息数"""
+        return [
+            {
+                "name": name,
+                "head": node.node_id if node is not None else None,
+                "length": node.depth if node is not None else 0,
+                "current": name == self.branch,
+            }
+            for name, node in self.branches.items()
+        ]
+
+    def snapshot(self) -> "MessageHistory":
+        """
+        返回共享全部节点的副本，只复制分支头指针
+
+        注册表在两者之间写时复制：任一方首次登记新节点前先复制注册表，
+        丢弃的副本上追加的节点不会留在原历史中，也不计入原历史的 size
+        """
+        history = MessageHistory.__new__(MessageHistory)
+        history.nodes = self.nodes
+        history.branches = dict(self.branches)
+        history.branch = self.branch
+        history._shared = self._shared = True
+        return history
+
+    def size(self) -> int:
+        """估算所有节点占用的字节数，由注册表增量维护，O(1)"""
+        return self.nodes.bytes
+
+    def to_dict(
+        self, exclude: Optional[Set[str]] = None, reachable_only: bool = True
+    ) -> Dict[str, Any]:
+        """
+        序列化为可 JSON 编码的字典
+
+        参数:
+            exclude: 已序列化过的节点 ID，遇到时停止向上遍历（其祖先节点也已序列化），
+                用于只导出增量节点
+            reachable_only: 为 True 时只保留从分支头可达的节点，
+                为 False 时导出注册表中的全部节点（含被回退掉的节点）
+        """
+        exclude = exclude or set()
+        reachable: Dict[str, HistoryNode] = {}
+        heads = self.nodes.values() if not reachable_only else self.branches.values()
+        for node in heads:
+            while (
+                node is not None
+                and node.node_id not in reachable
+                and node.node_id not in exclude
+            ):
+                reachable[node.node_id] = node
+                node = node.parent
+        ordered = sorted(reachable.values(), key=lambda n: n.depth)
+        return {
+            "nodes": [
+                {
+                    "id": node.node_id,
+                    "parent": node.parent.node_id if node.parent is not None else None,
+                    "message": dict(node.message),
+                }
+                for node in ordered
+            ],
+            "branches": {
+                name: node.node_id if node is not None else None
+                for name, node in self.branches.items()
+            },
+            "branch": self.branch,
+        }
+
+    def merge(self, data: Dict[str, Any]) -> None:
+        """
+        合并 to_dict 导出的（增量）节点，并以其中的分支头与当前分支为准
+
+        父节点或分支头既不在导出数据中也不在当前历史中时抛出 ValueError，
+        此时当前历史保持不变
+
+        参数:
+            data: to_dict 的结果
+        """
+        added: Dict[str, HistoryNode] = {}
+
+        def lookup(node_id: str) -> Optional[HistoryNode]:
+            return added.get(node_id) or self.nodes.get(node_id)
+
+        for item in data["nodes"]:
+            if item["id"] in self.nodes or item["id"] in added:
+                continue
+            parent = None
+            if item["parent"]:
+                parent = lookup(item["parent"])
+                if parent is None:
+                    raise ValueError(
+                        f"节点 {item['id']} 的父节点不存在: {item['parent']}"
+                    )
+            added[item["id"]] = HistoryNode(
+                Message(item["message"]), parent, node_id=item["id"]
+            )
+
+        branches: Dict[str, Optional[HistoryNode]] = {}
+        for name, node_id in data["branches"].items():
+            node = lookup(node_id) if node_id else None
+            if node_id and node is None:
+                raise ValueError(f"分支 {name} 的头节点不存在: {node_id}")
+            branches[name] = node
+
+        if added:
+            registry = self._own_nodes()
+            for node_id, node in added.items():
+                registry[node_id] = node
+        self.branches = branches
+        self.branch = data["branch"]
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "MessageHistory":
+        """从 to_dict 的结果恢复历史"""
+        history = cls()
+        history.merge(data)
+        return history
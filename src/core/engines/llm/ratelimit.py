@@ -0,0 +1,558 @@
+"""
+上游限流与重试
+
+按 (API 密钥, base_url) 为每个租户的每个上游维护令牌桶限速与自适应并发上限（AIMD），
+并发已满时有界排队，对 429 与临时性 5xx / 网络错误按抖动指数退避重试，并遵循 Retry-After 响应头
+"""
+
+import asyncio
+import email.utils
+import os
+import random
+import threading
+import time
+from collections import deque
+from contextlib import asynccontextmanager, contextmanager
+from typing import (
+    Any,
+    AsyncIterable,
+    AsyncIterator,
+    Awaitable,
+    Callable,
+    Deque,
+    Dict,
+    Iterable,
+    Iterator,
+    Optional,
+    Tuple,
+    TypeVar,
+)
+
+import openai
+
+from src.core.base.logger import get_logger
+from src.core.engines.llm.client_pool import key_fingerprint
+
+T = TypeVar("T")
+
+
+class TokenBucket:
+    """
+    令牌桶限速器
+
+    属性:
+        rate: 每秒补充的令牌数（即稳定状态下每秒允许的请求数）
+        burst: 桶容量，允许的瞬时突发请求数
+    """
+
+    def __init__(self, rate: float, burst: Optional[float] = None) -> None:
+        self.rate = rate
+        self.burst = burst or max(1.0, rate)
+        self._tokens = self.burst
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reserve(self) -> float:
+        """预占一个令牌，返回调用方需要等待的秒数"""
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(
+                self.burst, self._tokens + (now - self._updated) * self.rate
+            )
+            self._updated = now
+            self._tokens -= 1
+            if self._tokens >= 0:
+                return 0.0
+            return -self._tokens / self.rate
+
+
+class _Waiter:
+    """等待并发槽位的调用方：线程持有 event，协程持有 future 及其事件循环"""
+
+    __slots__ = ("event", "future", "loop", "granted")
+
+    def __init__(
+        self,
+        event: Optional[threading.Event] = None,
+        future: Optional["asyncio.Future[None]"] = None,
+        loop: Optional[asyncio.AbstractEventLoop] = None,
+    ) -> None:
+        self.event = event
+        self.future = future
+        self.loop = loop
+        self.granted = False
+
+
+class UpstreamBusy(Exception):
+    """等待上游并发槽位超时：上游已满载，调用方应稍后重试（网关返回 503）"""
+
+
+def _resolve(future: "asyncio.Future[None]") -> None:
+    if not future.done():
+        future.set_result(None)
+
+
+class AdaptiveConcurrency:
+    """
+    自适应并发上限（AIMD）
+
+    每次成功时上限加性增长，遇到 429 限流时乘性减半，
+    使并发在上游限额附近稳定，而不是反复冲击后集中失败。
+    槽位已满时调用方按到达顺序排队，释放的槽位直接移交给队首，不轮询也不会饿死；
+    同步线程与异步协程（可在不同事件循环中）共用同一个队列
+    """
+
+    def __init__(
+        self, initial: int = 4, min_limit: int = 1, max_limit: int = 256
+    ) -> None:
+        """
+        参数:
+            initial: 初始并发上限，从较低值起步，随成功请求逐步增长到 max_limit
+            min_limit: 并发上限的下限
+            max_limit: 并发上限的上限
+        """
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.limit = float(min(max(initial, min_limit), max_limit))
+        self.in_flight = 0
+        self._lock = threading.Lock()
+        self._waiters: Deque[_Waiter] = deque()
+
+    @property
+    def waiting(self) -> int:
+        """排队等待槽位的调用方数量"""
+        return len(self._waiters)
+
+    def _try_acquire_locked(self) -> bool:
+        """持有锁时调用：没有排队者且有空闲槽位时直接占用"""
+        if not self._waiters and self.in_flight < int(self.limit):
+            self.in_flight += 1
+            return True
+        return False
+
+    def _grant_locked(self) -> None:
+        """持有锁时调用：按到达顺序把空闲槽位移交给排队者"""
+        while self._waiters and self.in_flight < int(self.limit):
+            waiter = self._waiters.popleft()
+            if waiter.future is not None and waiter.future.done():
+                # 等待的协程已取消
+                continue
+            waiter.granted = True
+            self.in_flight += 1
+            if waiter.event is not None:
+                waiter.event.set()
+            else:
+                waiter.loop.call_soon_threadsafe(_resolve, waiter.future)
+
+    def acquire(self, timeout: Optional[float] = None) -> bool:
+        """
+        同步占用一个并发槽位，槽位已满时阻塞排队
+
+        参数:
+            timeout: 最长排队时间（秒），为 None 时一直等待
+
+        返回:
+            是否占用成功，排队超时返回 False
+        """
+        with self._lock:
+            if self._try_acquire_locked():
+                return True
+            waiter = _Waiter(event=threading.Event())
+            self._waiters.append(waiter)
+        if waiter.event.wait(timeout):
+            return True
+        return self._abandon(waiter)
+
+    async def aacquire(self, timeout: Optional[float] = None) -> bool:
+        """异步占用一个并发槽位，槽位已满时排队等待，不阻塞事件循环；参数与返回值同 acquire"""
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            if self._try_acquire_locked():
+                return True
+            waiter = _Waiter(future=loop.create_future(), loop=loop)
+            self._waiters.append(waiter)
+        try:
+            # asyncio.wait 超时时不取消 future，移交与超时的竞争统一在 _abandon 中处理
+            done, _ = await asyncio.wait({waiter.future}, timeout=timeout)
+        except asyncio.CancelledError:
+            if self._abandon(waiter):
+                # 取消前槽位已移交过来，归还给下一个排队者
+                self.release()
+            raise
+        if done:
+            return True
+        return self._abandon(waiter)
+
+    def _abandon(self, waiter: _Waiter) -> bool:
+        """放弃排队：返回放弃前槽位是否已移交给该排队者，未移交时移出队列"""
+        with self._lock:
+            if waiter.granted:
+                return True
+            self._waiters.remove(waiter)
+            return False
+
+    def release(self) -> None:
+        """释放并发槽位，有排队者时直接移交"""
+        with self._lock:
+            self.in_flight = max(0, self.in_flight - 1)
+            self._grant_locked()
+
+    def on_success(self) -> None:
+        """加性增长，上限提高时唤醒排队者"""
+        with self._lock:
+            self.limit = min(self.max_limit, self.limit + 1.0 / self.limit)
+            self._grant_locked()
+
+    def on_throttle(self) -> None:
+        """乘性减小"""
+        with self._lock:
+            self.limit = max(self.min_limit, self.limit / 2)
+
+
+class RetryPolicy:
+    """
+    抖动指数退避重试策略
+
+    属性:
+        max_retries: 最大重试次数
+        base_delay: 首次重试的基础延迟（秒）
+        max_delay: 单次延迟上限（秒）
+    """
+
+    def __init__(
+        self, max_retries: int = 3, base_delay: float = 0.5, max_delay: float = 30.0
+    ) -> None:
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+    @staticmethod
+    def is_retryable(error: BaseException) -> bool:
+        """429、5xx、超时与连接错误可重试，其余错误（如 400、401）直接抛出"""
+        if isinstance(error, (openai.APITimeoutError, openai.APIConnectionError)):
+            return True
+        if isinstance(error, openai.APIStatusError):
+            return error.status_code == 429 or error.status_code >= 500
+        return False
+
+    @staticmethod
+    def retry_after(error: BaseException) -> Optional[float]:
+        """解析上游返回的 Retry-After / retry-after-ms 响应头"""
+        response = getattr(error, "response", None)
+        headers = getattr(response, "headers", None)
+        if not headers:
+            return None
+
+        retry_after_ms = headers.get("retry-after-ms")
+        if retry_after_ms:
+            try:
+                return float(retry_after_ms) / 1000
+            except ValueError:
+                pass
+
+        retry_after = headers.get("retry-after")
+        if not retry_after:
+            return None
+        try:
+            return float(retry_after)
+        except ValueError:
+            parsed = email.utils.parsedate_tz(retry_after)
+            if parsed is None:
+                return None
+            return max(0.0, email.utils.mktime_tz(parsed) - time.time())
+
+    def delay(self, attempt: int, error: BaseException) -> float:
+        """计算第 attempt 次重试前的等待时间，优先使用 Retry-After"""
+        retry_after = self.retry_after(error)
+        if retry_after is not None:
+            return min(retry_after, self.max_delay)
+        # full jitter: [0, base * 2^attempt)
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2**attempt))
+
+
+class UpstreamLimiter:
+    """
+    单个上游（base_url）的限流器，组合令牌桶、自适应并发与重试
+
+    属性:
+        base_url: 上游地址
+        bucket: 令牌桶，为 None 时不限制请求速率
+        concurrency: 自适应并发上限
+        retry_policy: 重试策略
+        queue_timeout: 等待并发槽位的最长时间（秒）
+    """
+
+    def __init__(
+        self,
+        base_url: Optional[str],
+        rate: Optional[float] = None,
+        burst: Optional[float] = None,
+        concurrency: Optional[AdaptiveConcurrency] = None,
+        retry_policy: Optional[RetryPolicy] = None,
+        queue_timeout: Optional[float] = None,
+    ) -> None:
+        """
+        参数:
+            base_url: 上游地址
+            rate: 每秒允许的请求数，为 None 时不限制请求速率
+            burst: 令牌桶容量
+            concurrency: 自适应并发上限，默认从 4 起步
+            retry_policy: 重试策略
+            queue_timeout: 等待并发槽位的最长时间（秒），超时抛出 UpstreamBusy；为 None 时一直等待
+        """
+        self.base_url = base_url
+        self.bucket = TokenBucket(rate, burst) if rate else None
+        self.concurrency = concurrency or AdaptiveConcurrency()
+        self.retry_policy = retry_policy or RetryPolicy()
+        self.queue_timeout = queue_timeout
+        self.logger = get_logger(self.__class__.__name__)
+
+        self.requests = 0
+        self.rejected = 0
+        self.streaming = 0
+        self.retries = 0
+        self.throttled = 0
+        self.failures = 0
+        self.wait_time = 0.0
+
+    def _record_wait(self, seconds: float) -> None:
+        self.wait_time += seconds
+
+    def _acquire(self) -> None:
+        """同步等待令牌与并发槽位"""
+        started = time.monotonic()
+        if self.bucket is not None:
+            delay = self.bucket.reserve()
+            if delay > 0:
+                time.sleep(delay)
+        acquired = self.concurrency.acquire(self.queue_timeout)
+        self._record_wait(time.monotonic() - started)
+        if not acquired:
+            self._reject()
+
+    async def _aacquire(self) -> None:
+        """异步等待令牌与并发槽位"""
+        started = time.monotonic()
+        if self.bucket is not None:
+            delay = self.bucket.reserve()
+            if delay > 0:
+                await asyncio.sleep(delay)
+        acquired = await self.concurrency.aacquire(self.queue_timeout)
+        self._record_wait(time.monotonic() - started)
+        if not acquired:
+            self._reject()
+
+    def _reject(self) -> None:
+        self.rejected += 1
+        raise UpstreamBusy(
+            f"上游 {self.base_url or '默认'} 并发已满，排队超过 {self.queue_timeout} 秒"
+        )
+
+    def _on_error(self, attempt: int, error: Exception, retry: bool) -> float:
+        """记录失败并返回重试前的等待时间；不可重试、不允许重试或重试次数用尽时重新抛出"""
+        if isinstance(error, openai.RateLimitError):
+            self.throttled += 1
+            self.concurrency.on_throttle()
+        if (
+            not retry
+            or not self.retry_policy.is_retryable(error)
+            or attempt >= self.retry_policy.max_retries
+        ):
+            self.failures += 1
+            raise error
+        delay = self.retry_policy.delay(attempt, error)
+        self.retries += 1
+        self.logger.warning(
+            f"上游请求失败，{delay:.2f} 秒后进行第 {attempt + 1} 次重试: {error}"
+        )
+        return delay
+
+    def _call(self, fn: Callable[[], T], hold: bool, retry: bool = True) -> T:
+        """
+        在限流与重试保护下执行同步调用
+
+        hold 为 True 时成功后不释放并发槽位，由调用方在收到流的首个分片后释放；
+        retry 为 False 时只调用一次，重试交给外层（如端点池的故障切换）
+        """
+        self.requests += 1
+        attempt = 0
+        while True:
+            self._acquire()
+            try:
+                result = fn()
+            except Exception as e:
+                self.concurrency.release()
+                delay = self._on_error(attempt, e, retry)
+            except BaseException:
+                self.concurrency.release()
+                raise
+            else:
+                self.concurrency.on_success()
+                if not hold:
+                    self.concurrency.release()
+                return result
+            self._record_wait(delay)
+            time.sleep(delay)
+            attempt += 1
+
+    async def _acall(
+        self, fn: Callable[[], Awaitable[T]], hold: bool, retry: bool = True
+    ) -> T:
+        """_call 的异步版本"""
+        self.requests += 1
+        attempt = 0
+        while True:
+            await self._aacquire()
+            try:
+                result = await fn()
+            except Exception as e:
+                self.concurrency.release()
+                delay = self._on_error(attempt, e, retry)
+            except BaseException:
+                self.concurrency.release()
+                raise
+            else:
+                self.concurrency.on_success()
+                if not hold:
+                    self.concurrency.release()
+                return result
+            self._record_wait(delay)
+            await asyncio.sleep(delay)
+            attempt += 1
+
+    def call(self, fn: Callable[[], T], retry: bool = True) -> T:
+        """在限流与重试保护下执行同步调用，retry 为 False 时失败不重试"""
+        return self._call(fn, hold=False, retry=retry)
+
+    async def acall(self, fn: Callable[[], Awaitable[T]], retry: bool = True) -> T:
+        """在限流与重试保护下执行异步调用，retry 为 False 时失败不重试"""
+        return await self._acall(fn, hold=False, retry=retry)
+
+    @contextmanager
+    def stream(
+        self, fn: Callable[[], Iterable[T]], retry: bool = True
+    ) -> Iterator[Iterator[T]]:
+        """
+        建立流式响应，返回逐个产出分片的迭代器
+
+        并发槽位在收到首个分片（或流结束、出错、被中断）时释放：并发上限约束的是上游开始生成前的排队，
+        长回复的流不会一直占用槽位而让其他请求无限期排队。活跃的流单独计数（stats 中的 streaming）。
+        限流与重试只作用于建立流的请求，流建立后不再重试
+        """
+        stream = self._call(fn, hold=True, retry=retry)
+        released = False
+
+        def release() -> None:
+            nonlocal released
+            if not released:
+                released = True
+                self.concurrency.release()
+
+        def chunks() -> Iterator[T]:
+            for chunk in stream:
+                release()
+                yield chunk
+
+        self.streaming += 1
+        try:
+            yield chunks()
+        finally:
+            self.streaming -= 1
+            release()
+
+    @asynccontextmanager
+    async def astream(
+        self, fn: Callable[[], Awaitable[AsyncIterable[T]]], retry: bool = True
+    ) -> AsyncIterator[AsyncIterator[T]]:
+        """stream 的异步版本"""
+        stream = await self._acall(fn, hold=True, retry=retry)
+        released = False
+
+        def release() -> None:
+            nonlocal released
+            if not released:
+                released = True
+                self.concurrency.release()
+
+        async def chunks() -> AsyncIterator[T]:
+            async for chunk in stream:
+                release()
+                yield chunk
+
+        self.streaming += 1
+        try:
+            yield chunks()
+        finally:
+            self.streaming -= 1
+            release()
+
+    def stats(self) -> Dict[str, Any]:
+        """返回限流与重试统计"""
+        return {
+            "requests": self.requests,
+            "retries": self.retries,
+            "throttled": self.throttled,
+            "failures": self.failures,
+            "wait_time_total": round(self.wait_time, 3),
+            "concurrency_limit": int(self.concurrency.limit),
+            "in_flight": self.concurrency.in_flight,
+            "waiting": self.concurrency.waiting,
+            "streaming": self.streaming,
+            "rejected": self.rejected,
+            "rate_limit": self.bucket.rate if self.bucket else None,
+        }
+
+
+_limiters: Dict[Tuple[str, Optional[str]], UpstreamLimiter] = {}
+_limiters_lock = threading.Lock()
+
+
+def get_upstream_limiter(
+    base_url: Optional[str], api_key: Optional[str] = None
+) -> UpstreamLimiter:
+    """
+    获取指定 API 密钥与上游的进程级限流器
+
+    限流器按 (密钥指纹, base_url) 隔离：上游的速率与并发限额通常按密钥计算，
+    一个租户的密钥遇到 429 只下调该密钥的并发上限，不影响其他租户
+
+    通过环境变量配置:
+        LLM_RATE_LIMIT_RPS: 每个密钥每个上游每秒允许的请求数，0 表示不限制
+        LLM_RATE_LIMIT_BURST: 令牌桶容量
+        LLM_MAX_CONCURRENCY: 每个密钥每个上游的并发上限，遇到 429 时自适应下调
+        LLM_INITIAL_CONCURRENCY: 初始并发上限，随成功请求加性增长到 LLM_MAX_CONCURRENCY
+        LLM_QUEUE_TIMEOUT: 等待并发槽位的最长时间（秒），超时抛出 UpstreamBusy，0 表示一直等待
+        LLM_MAX_RETRIES: 最大重试次数
+    """
+    key = (key_fingerprint(api_key), base_url)
+    with _limiters_lock:
+        limiter = _limiters.get(key)
+        if limiter is None:
+            rate = float(os.getenv("LLM_RATE_LIMIT_RPS", "0")) or None
+            burst = float(os.getenv("LLM_RATE_LIMIT_BURST", "0")) or None
+            max_concurrency = int(os.getenv("LLM_MAX_CONCURRENCY", "16"))
+            initial_concurrency = int(os.getenv("LLM_INITIAL_CONCURRENCY", "4"))
+            limiter = UpstreamLimiter(
+                base_url,
+                rate=rate,
+                burst=burst,
+                concurrency=AdaptiveConcurrency(
+                    initial=min(initial_concurrency, max_concurrency),
+                    max_limit=max_concurrency,
+                ),
+                retry_policy=RetryPolicy(
+                    max_retries=int(os.getenv("LLM_MAX_RETRIES", "3"))
+                ),
+                queue_timeout=float(os.getenv("LLM_QUEUE_TIMEOUT", "30")) or None,
+            )
+            _limiters[key] = limiter
+        return limiter
+
+
+def limiter_stats() -> Dict[str, Any]:
+    """返回所有限流器的统计信息，键为 密钥指纹@上游"""
+    with _limiters_lock:
+        return {
+            f"{fingerprint}@{base_url or 'default'}": limiter.stats()
+            for (fingerprint, base_url), limiter in _limiters.items()
+        }
@@ -0,0 +1,636 @@
+"""
+LLM 会话存储
+
+按会话 ID 在服务端保存 LLM 的对话历史（含分支），使客户端每轮只需发送本轮输入。
+支持追加写对话日志（默认，进程重启与多 worker 共享）、内存与本地 SQLite 快照三种后端，
+均带 TTL 过期
+"""
+
+import asyncio
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from abc import ABC, abstractmethod
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Set
+
+from src.core.base.cache import LRUCache
+from src.core.base.logger import get_logger
+from src.core.engines.llm.history import MessageHistory
+from src.db.conversation_log import EVENT_DELETE, ConversationLog
+
+# 默认 SQLite 数据库文件位置: <项目根目录>/src/db/sessions.db
+DEFAULT_DB_PATH = Path(__file__).parent.parent.parent.parent / "db" / "sessions.db"
+
+
+class SessionConflict(Exception):
+    """保存时会话已被其他请求或进程更新到更高的版本"""
+
+
+class SessionRecord:
+    """
+    单个会话的快照
+
+    属性:
+        session_id: 会话 ID
+        messages: 当前分支的对话上下文消息列表
+        version: 上下文版本号，每次保存递增
+        updated_at: 最近一次保存的时间戳
+        history: 带分支的完整对话历史，为 None 时只有 messages
+    """
+
+    def __init__(
+        self,
+        session_id: str,
+        messages: Optional[List[Dict[str, str]]] = None,
+        version: int = 0,
+        updated_at: Optional[float] = None,
+        history: Optional[MessageHistory] = None,
+    ) -> None:
+        self.session_id = session_id
+        self.messages = messages or []
+        self.version = version
+        self.updated_at = updated_at or time.time()
+        self.history = history
+
+    def size(self) -> int:
+        """估算会话占用的字节数"""
+        if self.history is not None:
+            return self.history.size()
+        return sum(
+            len(m.get("role", "")) + len(m.get("content") or "") for m in self.messages
+        )
+
+
+class SessionBackend(ABC):
+    """会话存储后端接口"""
+
+    @abstractmethod
+    def get(self, session_id: str) -> Optional[SessionRecord]:
+        """读取会话，不存在或已过期时返回 None"""
+
+    @abstractmethod
+    def put(self, record: SessionRecord) -> None:
+        """写入会话快照，支持版本校验的后端在版本冲突时抛出 SessionConflict"""
+
+    @abstractmethod
+    def delete(self, session_id: str) -> bool:
+        """删除会话，返回是否存在"""
+
+    @abstractmethod
+    def stats(self) -> Dict[str, Any]:
+        """返回后端统计信息"""
+
+    def close(self) -> None:
+        """释放后端资源"""
+
+
+class MemorySessionBackend(SessionBackend):
+    """基于进程内 LRU 缓存的会话后端，进程退出后会话丢失"""
+
+    def __init__(
+        self,
+        max_sessions: int = 10000,
+        ttl: Optional[float] = 86400.0,
+        max_bytes: Optional[int] = 256 * 1024 * 1024,
+    ) -> None:
+        """
+        参数:
+            max_sessions: 最多保留的会话数量
+            ttl: 会话空闲过期时间（秒），None 表示不过期
+            max_bytes: 所有会话内容的总字节上限
+        """
+        self.cache: LRUCache[str, SessionRecord] = LRUCache(
+            max_items=max_sessions,
+            ttl=ttl,
+            max_bytes=max_bytes,
+            sizeof=SessionRecord.size,
+        )
+
+    def get(self, session_id: str) -> Optional[SessionRecord]:
+        return self.cache.get(session_id)
+
+    def put(self, record: SessionRecord) -> None:
+        self.cache.put(record.session_id, record)
+
+    def delete(self, session_id: str) -> bool:
+        return self.cache.pop(session_id) is not None
+
+    def stats(self) -> Dict[str, Any]:
+        stats = self.cache.stats()
+        stats["backend"] = "memory"
+        return stats
+
+
+class SQLiteSessionBackend(SessionBackend):
+    """
+    基于本地 SQLite 文件的会话后端，进程重启后会话仍然保留
+
+    数据库使用 WAL 日志与 synchronous=NORMAL，提交不再逐次等待 fsync；
+    读取不写数据库，最近访问时间先记录在内存中，下次写入时批量落盘
+    """
+
+    def __init__(
+        self,
+        db_path: Optional[str] = None,
+        max_sessions: int = 10000,
+        ttl: Optional[float] = 86400.0,
+        max_bytes: Optional[int] = 256 * 1024 * 1024,
+    ) -> None:
+        """
+        参数:
+            db_path: 数据库文件路径，默认 src/db/sessions.db
+            max_sessions: 最多保留的会话数量
+            ttl: 会话空闲过期时间（秒），None 表示不过期
+            max_bytes: 所有会话内容的总字节上限
+        """
+        self.db_path = Path(db_path) if db_path else DEFAULT_DB_PATH
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self.max_sessions = max_sessions
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.evictions = 0
+        self.expirations = 0
+        self.logger = get_logger(self.__class__.__name__)
+
+        self._lock = threading.Lock()
+        # 尚未落盘的最近访问时间，session_id -> accessed_at
+        self._touched: Dict[str, float] = {}
+        self._conn = sqlite3.connect(str(self.db_path), check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS sessions (
+                session_id TEXT PRIMARY KEY,
+                messages TEXT NOT NULL,
+                version INTEGER NOT NULL,
+                size INTEGER NOT NULL,
+                updated_at REAL NOT NULL,
+                accessed_at REAL NOT NULL,
+                history TEXT
+            )
+            """
+        )
+        columns = {row[1] for row in self._conn.execute("PRAGMA table_info(sessions)")}
+        if "history" not in columns:
+            # 兼容不含分支历史列的旧数据库
+            self._conn.execute("ALTER TABLE sessions ADD COLUMN history TEXT")
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_sessions_accessed ON sessions (accessed_at)"
+        )
+        self._conn.commit()
+        self.logger.info(f"SQLite 会话存储已就绪: {self.db_path}")
+
+    def get(self, session_id: str) -> Optional[SessionRecord]:
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT messages, version, updated_at, accessed_at, history FROM sessions "
+                "WHERE session_id = ?",
+                (session_id,),
+            ).fetchone()
+            if row is None:
+                return None
+            messages, version, updated_at, accessed_at, history = row
+            accessed_at = max(accessed_at, self._touched.get(session_id, 0.0))
+            if self.ttl and accessed_at + self.ttl <= now:
+                # 过期会话由下次写入时的淘汰删除，读取路径不写数据库
+                return None
+            self._touched[session_id] = now
+        return SessionRecord(
+            session_id,
+            json.loads(messages),
+            version,
+            updated_at,
+            MessageHistory.from_dict(json.loads(history)) if history else None,
+        )
+
+    def put(self, record: SessionRecord) -> None:
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO sessions "
+                "(session_id, messages, version, size, updated_at, accessed_at, history) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (
+                    record.session_id,
+                    json.dumps(record.messages, ensure_ascii=False),
+                    record.version,
+                    record.size(),
+                    record.updated_at,
+                    now,
+                    json.dumps(record.history.to_dict(), ensure_ascii=False)
+                    if record.history is not None
+                    else None,
+                ),
+            )
+            self._touched.pop(record.session_id, None)
+            self._flush_touched()
+            self._evict(now)
+            self._conn.commit()
+
+    def _flush_touched(self) -> None:
+        """把内存中的最近访问时间批量写入数据库（需持有锁，由调用方提交）"""
+        if not self._touched:
+            return
+        self._conn.executemany(
+            "UPDATE sessions SET accessed_at = MAX(accessed_at, ?) WHERE session_id = ?",
+            [(accessed_at, session_id) for session_id, accessed_at in self._touched.items()],
+        )
+        self._touched.clear()
+
+    def _evict(self, now: float) -> None:
+        """删除过期会话，并按最近访问时间淘汰超出容量的会话（需持有锁）"""
+        if self.ttl:
+            cursor = self._conn.execute(
+                "DELETE FROM sessions WHERE accessed_at <= ?", (now - self.ttl,)
+            )
+            self.expirations += cursor.rowcount
+
+        count, total = self._conn.execute(
+            "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM sessions"
+        ).fetchone()
+        while count > 1 and (
+            count > self.max_sessions
+            or (self.max_bytes is not None and total > self.max_bytes)
+        ):
+            session_id, size = self._conn.execute(
+                "SELECT session_id, size FROM sessions ORDER BY accessed_at LIMIT 1"
+            ).fetchone()
+            self._conn.execute(
+                "DELETE FROM sessions WHERE session_id = ?", (session_id,)
+            )
+            self.evictions += 1
+            count -= 1
+            total -= size
+
+    def delete(self, session_id: str) -> bool:
+        with self._lock:
+            self._touched.pop(session_id, None)
+            cursor = self._conn.execute(
+                "DELETE FROM sessions WHERE session_id = ?", (session_id,)
+            )
+            self._conn.commit()
+        return cursor.rowcount > 0
+
+    def close(self) -> None:
+        """写入尚未落盘的访问时间并关闭数据库连接"""
+        with self._lock:
+            self._flush_touched()
+            self._conn.commit()
+            self._conn.close()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            count, total = self._conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM sessions"
+            ).fetchone()
+        return {
+            "backend": "sqlite",
+            "path": str(self.db_path),
+            "size": count,
+            "max_items": self.max_sessions,
+            "bytes": total,
+            "max_bytes": self.max_bytes,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+        }
+
+
+class LogSessionBackend(SessionBackend):
+    """
+    基于追加写对话日志的会话后端
+
+    每次保存只把新增的历史节点与分支头指针作为一条事件入队，由后台线程批量提交，
+    请求路径不等待磁盘同步；读取时先用索引查询日志中的最新版本，
+    本进程缓存不落后时直接返回，否则回放该会话的事件。
+    进程重启后与其他 worker 进程都能读到同一份会话。
+
+    写入提交之前记录固定在本进程中，不受缓存淘汰影响，读取直接返回该记录；
+    每个会话同时最多一条未提交的写入，保存时校验版本号紧接日志中的最新版本，
+    多个 worker 基于同一版本保存时抛出 SessionConflict。
+    过期时间与日志压缩一致，按最近一次写入计算
+    """
+
+    def __init__(
+        self,
+        db_path: Optional[str] = None,
+        max_sessions: int = 10000,
+        ttl: Optional[float] = 86400.0,
+        max_bytes: Optional[int] = 256 * 1024 * 1024,
+        flush_interval: float = 0.05,
+        compact_interval: Optional[float] = 600.0,
+    ) -> None:
+        """
+        参数:
+            db_path: 日志数据库文件路径，默认 src/db/conversation_log.db
+            max_sessions: 本进程缓存的会话数量
+            ttl: 会话过期时间（秒），按最近一次写入计算，None 表示不过期
+            max_bytes: 本进程缓存的会话内容总字节上限
+            flush_interval: 批量提交的最长等待时间（秒）
+            compact_interval: 日志压缩间隔（秒），None 表示不自动压缩
+        """
+        self.ttl = ttl
+        self.log = ConversationLog(
+            db_path,
+            compactor=self._fold,
+            flush_interval=flush_interval,
+            compact_interval=compact_interval,
+            ttl=ttl,
+            on_commit=self._on_commit,
+        )
+        self.cache: LRUCache[str, SessionRecord] = LRUCache(
+            max_items=max_sessions,
+            ttl=ttl,
+            max_bytes=max_bytes,
+            sizeof=SessionRecord.size,
+        )
+        # 每个会话已写入日志的节点 ID，保存时只追加其余节点
+        self._written: LRUCache[str, Set[str]] = LRUCache(max_items=max_sessions)
+        # 尚未提交的写入，session_id -> 记录；值为 None 表示删除尚未提交
+        self._pending: Dict[str, Optional[SessionRecord]] = {}
+        self._lock = threading.Lock()
+        self.replays = 0
+
+    @staticmethod
+    def _replay(payloads: List[Dict[str, Any]]) -> MessageHistory:
+        """按顺序合并事件负载，恢复完整历史"""
+        history = MessageHistory()
+        for payload in payloads:
+            history.merge(payload)
+        return history
+
+    @classmethod
+    def _fold(cls, payloads: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """
+        压缩时把会话的多条事件折叠为一个快照
+
+        保留全部节点（含被回退掉的节点）：这些节点已记入 _written，
+        本进程之后回到这些节点再保存时只会追加增量，丢弃它们会让增量引用不存在的父节点
+        """
+        return cls._replay(payloads).to_dict(reachable_only=False)
+
+    def _on_commit(self, session_id: str, version: int, written: bool) -> None:
+        """日志提交回调：解除固定；事件被丢弃时清除本进程对该会话的缓存"""
+        with self._lock:
+            if session_id in self._pending:
+                pending = self._pending[session_id]
+                if (pending.version if pending is not None else 0) == version:
+                    del self._pending[session_id]
+        if not written:
+            # 日志中没有这些节点，下次保存需写入完整历史，读取时回放日志中的版本
+            self._written.pop(session_id)
+            self.cache.pop(session_id)
+
+    def _expired(self, written_at: float) -> bool:
+        return bool(self.ttl) and written_at + self.ttl <= time.time()
+
+    def _delete_pending(self, session_id: str) -> None:
+        """追加删除事件并固定到提交为止（需持有锁）"""
+        self._pending[session_id] = None
+        self.cache.pop(session_id)
+        self._written.pop(session_id)
+        self.log.delete(session_id)
+
+    def get(self, session_id: str) -> Optional[SessionRecord]:
+        with self._lock:
+            if session_id in self._pending:
+                # 本进程的写入还在提交队列中，日志里的版本已落后
+                return self._pending[session_id]
+
+        head = self.log.head(session_id)
+        if head is None:
+            # 会话不存在，或已过期被压缩清除
+            self.cache.pop(session_id)
+            return None
+        version, kind, created_at = head
+        if kind == EVENT_DELETE:
+            self.cache.pop(session_id)
+            return None
+        if self._expired(created_at):
+            # 已过期但尚未压缩：写入删除事件，之后从版本 1 重新开始的保存不会与旧事件冲突
+            with self._lock:
+                if session_id not in self._pending:
+                    self._delete_pending(session_id)
+            return None
+
+        # 删除后版本号从 1 重新开始，同时比较写入时间才能确认缓存对应日志中的最新事件
+        cached = self.cache.get(session_id)
+        if (
+            cached is not None
+            and cached.version == version
+            and cached.updated_at == created_at
+        ):
+            return cached
+
+        result = self.log.read(session_id)
+        if result is None:
+            return None
+        version, payloads = result
+        history = self._replay(payloads)
+        self.replays += 1
+        record = SessionRecord(
+            session_id, history.messages(), version, created_at, history=history
+        )
+        self.cache.put(session_id, record)
+        self._written.put(session_id, set(history.nodes))
+        return record
+
+    def put(self, record: SessionRecord) -> None:
+        history = record.history
+        if history is None:
+            history = MessageHistory()
+            history.reset(record.messages)
+
+        while True:
+            with self._lock:
+                if record.session_id not in self._pending:
+                    self._append(record, history)
+                    return
+            # 同一会话上一次写入尚未提交，等待提交后再校验版本
+            self.log.flush()
+
+    def _append(self, record: SessionRecord, history: MessageHistory) -> None:
+        """校验版本并追加事件（需持有锁，且该会话没有未提交的写入）"""
+        head = self.log.head(record.session_id)
+        current = 0 if head is None or head[1] == EVENT_DELETE else head[0]
+        if record.version != current + 1:
+            self.cache.pop(record.session_id)
+            raise SessionConflict(
+                f"会话 {record.session_id} 已被更新（当前版本 {current}，"
+                f"保存基于版本 {record.version - 1}），请重新加载后重试"
+            )
+
+        written = self._written.get(record.session_id) or set()
+        payload = history.to_dict(exclude=written)
+        self._pending[record.session_id] = record
+        self.log.append(record.session_id, record.version, payload, record.updated_at)
+        written.update(node["id"] for node in payload["nodes"])
+        self._written.put(record.session_id, written)
+        self.cache.put(record.session_id, record)
+
+    def delete(self, session_id: str) -> bool:
+        # 只查询日志中的最新事件判断是否存在，不回放会话
+        head = self.log.head(session_id)
+        with self._lock:
+            if session_id in self._pending:
+                existed = self._pending[session_id] is not None
+            else:
+                existed = head is not None and head[1] != EVENT_DELETE
+            self._delete_pending(session_id)
+        return existed
+
+    def stats(self) -> Dict[str, Any]:
+        stats = self.log.stats()
+        stats["backend"] = "log"
+        stats["cache"] = self.cache.stats()
+        stats["replays"] = self.replays
+        return stats
+
+    def close(self) -> None:
+        self.log.close()
+
+
+class SessionStore:
+    """
+    会话存储，负责会话 ID 生成与上下文的读写
+
+    属性:
+        backend: 实际的存储后端
+    """
+
+    def __init__(self, backend: SessionBackend) -> None:
+        self.backend = backend
+        self.logger = get_logger(self.__class__.__name__)
+
+    @staticmethod
+    def new_session_id() -> str:
+        """生成新的随机会话 ID"""
+        return uuid.uuid4().hex
+
+    def load(self, session_id: str) -> SessionRecord:
+        """读取会话，不存在时返回空会话"""
+        record = self.backend.get(session_id)
+        if record is None:
+            self.logger.debug(f"会话不存在或已过期，创建新会话: {session_id}")
+            return SessionRecord(session_id)
+        return record
+
+    def save(
+        self,
+        session_id: str,
+        messages: List[Dict[str, str]],
+        version: int = 0,
+        history: Optional[MessageHistory] = None,
+    ) -> SessionRecord:
+        """
+        保存会话上下文
+
+        参数:
+            session_id: 会话 ID
+            messages: 要保存的对话上下文（当前分支）
+            version: 读取会话时的版本号，保存后版本号为其加一
+            history: 带分支的完整对话历史，内存后端直接保存该对象，与其他快照共享节点
+
+        返回:
+            保存后的会话记录
+        """
+        record = SessionRecord(session_id, list(messages), version + 1, history=history)
+        self.backend.put(record)
+        self.logger.debug(
+            f"已保存会话 {session_id}，版本: {record.version}，消息数: {len(messages)}"
+        )
+        return record
+
+    def delete(self, session_id: str) -> bool:
+        """删除会话"""
+        return self.backend.delete(session_id)
+
+    async def aload(self, session_id: str) -> SessionRecord:
+        """load 的异步版本，后端读取在线程池中执行，不阻塞事件循环"""
+        return await asyncio.to_thread(self.load, session_id)
+
+    async def asave(
+        self,
+        session_id: str,
+        messages: List[Dict[str, str]],
+        version: int = 0,
+        history: Optional[MessageHistory] = None,
+    ) -> SessionRecord:
+        """save 的异步版本，序列化与后端写入在线程池中执行"""
+        return await asyncio.to_thread(self.save, session_id, messages, version, history)
+
+    async def adelete(self, session_id: str) -> bool:
+        """delete 的异步版本"""
+        return await asyncio.to_thread(self.delete, session_id)
+
+    def stats(self) -> Dict[str, Any]:
+        """返回会话存储统计信息"""
+        return self.backend.stats()
+
+    def close(self) -> None:
+        """关闭存储后端，追加写日志会先提交队列中的事件"""
+        self.backend.close()
+
+
+_session_store: Optional[SessionStore] = None
+
+
+def get_session_store() -> SessionStore:
+    """
+    获取进程级会话存储
+
+    通过环境变量配置:
+        LLM_SESSION_BACKEND: log（默认，追加写对话日志）、memory 或 sqlite
+        LLM_SESSION_DB: 数据库文件路径，默认 src/db/conversation_log.db（log）或 src/db/sessions.db（sqlite）
+        LLM_SESSION_TTL: 会话空闲过期时间（秒），0 表示不过期
+        LLM_SESSION_MAX: 最多保留（log 后端为本进程缓存）的会话数量
+        LLM_SESSION_MAX_BYTES: 所有会话内容的总字节上限
+        LLM_SESSION_FLUSH_INTERVAL: log 后端批量提交的最长等待时间（秒）
+        LLM_SESSION_COMPACT_INTERVAL: log 后端的压缩间隔（秒），0 表示不自动压缩
+    """
+    global _session_store
+    if _session_store is None:
+        ttl = float(os.getenv("LLM_SESSION_TTL", "86400")) or None
+        max_sessions = int(os.getenv("LLM_SESSION_MAX", "10000"))
+        max_bytes = int(os.getenv("LLM_SESSION_MAX_BYTES", str(256 * 1024 * 1024)))
+        backend_name = os.getenv("LLM_SESSION_BACKEND", "log").lower()
+
+        if backend_name == "log":
+            backend: SessionBackend = LogSessionBackend(
+                db_path=os.getenv("LLM_SESSION_DB"),
+                max_sessions=max_sessions,
+                ttl=ttl,
+                max_bytes=max_bytes,
+                flush_interval=float(os.getenv("LLM_SESSION_FLUSH_INTERVAL", "0.05")),
+                compact_interval=float(os.getenv("LLM_SESSION_COMPACT_INTERVAL", "600"))
+                or None,
+            )
+        elif backend_name == "sqlite":
+            backend = SQLiteSessionBackend(
+                db_path=os.getenv("LLM_SESSION_DB"),
+                max_sessions=max_sessions,
+                ttl=ttl,
+                max_bytes=max_bytes,
+            )
+        elif backend_name == "memory":
+            backend = MemorySessionBackend(
+                max_sessions=max_sessions, ttl=ttl, max_bytes=max_bytes
+            )
+        else:
+            raise ValueError(f"不支持的会话存储后端: {backend_name}")
+
+        _session_store = SessionStore(backend)
+    return _session_store
+
+
+def close_session_store() -> None:
+    """关闭已创建的进程级会话存储"""
+    global _session_store
+    if _session_store is not None:
+        _session_store.close()
+        _session_store = None
@@ -0,0 +1,134 @@
+"""
+相同请求合并（singleflight）
+
+同一时刻多个完全相同的非流式请求只向上游发起一次调用，
+所有等待方共享同一个结果或异常
+"""
+
+import asyncio
+import threading
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple, TypeVar
+
+from src.core.base.logger import get_logger
+
+T = TypeVar("T")
+
+
+class _Call:
+    """同步模式下一次进行中的调用"""
+
+    def __init__(self) -> None:
+        self.done = threading.Event()
+        self.result: Any = None
+        self.error: Optional[BaseException] = None
+
+
+class SingleFlight:
+    """
+    进行中请求的合并器
+
+    属性:
+        leaders: 实际发往上游的调用次数
+        coalesced: 被合并、复用他人调用结果的请求次数
+    """
+
+    def __init__(self) -> None:
+        self.logger = get_logger(self.__class__.__name__)
+        self._lock = threading.Lock()
+        self._calls: Dict[str, _Call] = {}
+        # (事件循环 ID, 键) -> 进行中的任务
+        self._tasks: Dict[Tuple[int, str], "asyncio.Task[Any]"] = {}
+        self.leaders = 0
+        self.coalesced = 0
+
+    def do(self, key: str, fn: Callable[[], T]) -> T:
+        """
+        执行 fn，若已有相同键的调用在进行中则等待并复用其结果
+
+        参数:
+            key: 请求键，相同键的请求会被合并
+            fn: 实际执行调用的函数
+
+        返回:
+            fn 的返回值（可能来自其他线程发起的调用）
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            if call is not None:
+                self.coalesced += 1
+                leader = False
+            else:
+                call = _Call()
+                self._calls[key] = call
+                self.leaders += 1
+                leader = True
+
+        if not leader:
+            self.logger.debug("合并进行中的相同请求")
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn()
+            return call.result
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+            call.done.set()
+
+    async def ado(self, key: str, fn: Callable[[], Awaitable[T]]) -> T:
+        """
+        do 的异步版本
+
+        上游调用在独立任务中执行，发起方被取消时不会影响其他等待方
+
+        参数:
+            key: 请求键，相同键的请求会被合并
+            fn: 返回可等待对象的函数
+
+        返回:
+            调用结果（可能来自其他协程发起的调用）
+        """
+        task_key = (id(asyncio.get_running_loop()), key)
+        task = self._tasks.get(task_key)
+        if task is not None:
+            self.coalesced += 1
+            self.logger.debug("合并进行中的相同请求")
+        else:
+            task = asyncio.ensure_future(fn())
+            self._tasks[task_key] = task
+            self.leaders += 1
+            task.add_done_callback(lambda done: self._finish(task_key, done))
+        return await asyncio.shield(task)
+
+    def _finish(self, task_key: Tuple[int, str], task: "asyncio.Task[Any]") -> None:
+        """任务结束后移除记录；读取异常，避免所有等待方都已取消时产生未处理异常告警"""
+        self._tasks.pop(task_key, None)
+        if not task.cancelled():
+            task.exception()
+
+    def stats(self) -> Dict[str, Any]:
+        """返回合并统计信息"""
+        total = self.leaders + self.coalesced
+        return {
+            "in_flight": len(self._calls) + len(self._tasks),
+            "leaders": self.leaders,
+            "coalesced": self.coalesced,
+            "coalesce_rate": self.coalesced / total if total else 0.0,
+        }
+
+
+_singleflight: Optional[SingleFlight] = None
+
+
+def get_singleflight() -> SingleFlight:
+    """获取进程级请求合并器"""
+    global _singleflight
+    if _singleflight is None:
+        _singleflight = SingleFlight()
+    return _singleflight
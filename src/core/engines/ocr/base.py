@@ -1,23 +1,88 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
 
+import asyncio
 import base64
-from typing import Any, List, Union
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, AsyncIterator, Dict, List, Sequence, Union
 import os
 
+import httpx
 import numpy as np
 import requests
 from PIL import Image
+from requests.adapters import HTTPAdapter
 import io
 
 from src.core.base.logger import get_logger
 
+TRANSPORTS = ("binary", "json")
+ARRAY_ENCODINGS = ("raw", "png")
+OUTPUT_FORMATS = ("full", "compact", "packed")
 
-class OCR:
-    """OCR 客户端"""
+# binary 传输下原始像素数组的请求类型，形状、dtype 与步长通过请求头传递
+NDARRAY_CONTENT_TYPE = "application/x-ndarray"
 
-    def __init__(self, server_url: str = "http://localhost:8001"):
-        self.server_url = server_url
+
+async def _single_chunk(data: memoryview) -> AsyncIterator[memoryview]:
+    """把内存视图包装为单块异步请求体：httpx 的 content 参数只把 bytes 当作完整请求体"""
+    yield data
+
+
+def decode_boxes(result: Dict[str, Any]) -> np.ndarray:
+    """
+    将 compact/packed 格式结果中的外接框还原为 (N, 4) 的 int32 数组
+
+    packed 格式直接包装解码后的字节，不逐个解析数字
+    """
+    boxes = result["boxes"]
+    if isinstance(boxes, str):
+        dtype = np.dtype(result.get("boxes_dtype", "<i4"))
+        return np.frombuffer(base64.b64decode(boxes), dtype=dtype).reshape(-1, 4)
+    return np.asarray(boxes, dtype=np.int32).reshape(-1, 4)
+
+
+class BaseOCR:
+    """OCR 客户端公共逻辑：输入格式转换与响应解析"""
+
+    def __init__(
+        self,
+        server_url: str = "http://localhost:8001",
+        pool_size: int = 10,
+        timeout: float = 60.0,
+        connect_timeout: float = 5.0,
+        transport: str = "json",
+        array_encoding: str = "raw",
+        output_format: str = "full",
+    ):
+        """
+        参数:
+            server_url: PaddleOCR 服务地址
+            pool_size: 连接池中保持的最大连接数
+            timeout: 等待识别结果的超时时间（秒）
+            connect_timeout: 建立连接的超时时间（秒）
+            transport: 传输方式，json（默认）以 base64 JSON 发送到 /ocr，所有版本的服务都支持；
+                binary 直接发送图片字节到 /ocr/binary，省去 base64 编码，需要服务端已提供该接口
+            array_encoding: binary 传输下 numpy 数组的编码方式，raw 直接发送像素缓冲区，
+                省去两端的 PNG 压缩与解压；png 先压缩再发送，带宽受限时体积更小
+            output_format: 识别结果格式，full 为 PaddleOCR 原始结果；compact 只含 texts、scores
+                与整数外接框 boxes；packed 的 boxes 为 base64 编码的 int32 数组，可用 decode_boxes 还原
+        """
+        if transport not in TRANSPORTS:
+            raise ValueError(f"不支持的传输方式: {transport}，可选: {TRANSPORTS}")
+        if array_encoding not in ARRAY_ENCODINGS:
+            raise ValueError(
+                f"不支持的数组编码方式: {array_encoding}，可选: {ARRAY_ENCODINGS}"
+            )
+        if output_format not in OUTPUT_FORMATS:
+            raise ValueError(f"不支持的输出格式: {output_format}，可选: {OUTPUT_FORMATS}")
+        self.server_url = server_url.rstrip("/")
+        self.transport = transport
+        self.array_encoding = array_encoding
+        self.output_format = output_format
+        self.pool_size = pool_size
+        self.timeout = timeout
+        self.connect_timeout = connect_timeout
         self.logger = get_logger(self.__class__.__name__)
 
     def _to_base64(self, image_input: Union[str, np.ndarray, bytes]) -> str:
@@ -61,6 +126,129 @@ class OCR:
             self.logger.error(f"不支持的图片输入类型: {type(image_input)}")
             raise ValueError(f"不支持的图片输入类型: {type(image_input)}")
 
+    def _to_bytes(self, image_input: Union[str, np.ndarray, bytes]) -> bytes:
+        """将不同格式的图片输入转换为图片文件字节，字节输入原样返回，不做拷贝"""
+        if isinstance(image_input, bytes):
+            self.logger.debug(f"使用字节数据，大小: {len(image_input)} 字节")
+            return image_input
+
+        if isinstance(image_input, np.ndarray):
+            self.logger.debug(f"转换 numpy 数组，形状: {image_input.shape}")
+            buffer = io.BytesIO()
+            Image.fromarray(image_input).save(buffer, format="PNG")
+            return buffer.getvalue()
+
+        if isinstance(image_input, str):
+            if os.path.exists(image_input):
+                self.logger.debug(f"读取图片文件: {image_input}")
+                with open(image_input, "rb") as f:
+                    return f.read()
+            # 兼容 base64 字符串与 data URL 输入
+            return base64.b64decode(self._to_base64(image_input))
+
+        self.logger.error(f"不支持的图片输入类型: {type(image_input)}")
+        raise ValueError(f"不支持的图片输入类型: {type(image_input)}")
+
+    def read_image(self, image_input: Union[str, np.ndarray, bytes]) -> Union[bytes, np.ndarray]:
+        """
+        读取图片内容：文件路径、base64 与 data URL 解码为图片文件字节，字节与数组原样返回
+
+        返回值可直接传给 recognize，也可用于计算内容哈希
+        """
+        if isinstance(image_input, np.ndarray):
+            return image_input
+        return self._to_bytes(image_input)
+
+    def _params(self) -> Dict[str, str]:
+        """查询参数；默认格式不附带参数，兼容旧版服务"""
+        return {"format": self.output_format} if self.output_format != "full" else {}
+
+    def _build_request(self, image_input: Union[str, np.ndarray, bytes]) -> Dict[str, Any]:
+        """按传输方式构造请求地址与请求体"""
+        if self.transport == "json":
+            body = {"image": self._to_base64(image_input)}
+            if self.output_format != "full":
+                body["format"] = self.output_format
+            return {"url": f"{self.server_url}/ocr", "json": body}
+        # 服务端只接受 uint8 像素缓冲区，其他 dtype 仍走 PNG 编码
+        if (
+            isinstance(image_input, np.ndarray)
+            and image_input.dtype == np.uint8
+            and self.array_encoding == "raw"
+        ):
+            return {
+                "url": f"{self.server_url}/ocr/binary",
+                "params": self._params(),
+                **self._ndarray_payload(image_input),
+            }
+        image_data = self._to_bytes(image_input)
+        self.logger.debug(f"图片以二进制发送，大小: {len(image_data)} 字节")
+        return {
+            "url": f"{self.server_url}/ocr/binary",
+            "params": self._params(),
+            "content": image_data,
+            "headers": {"Content-Type": "application/octet-stream"},
+        }
+
+    def _build_batch_request(
+        self, images: Sequence[Union[str, np.ndarray, bytes]]
+    ) -> Dict[str, Any]:
+        """构造批量请求：binary 传输使用 multipart（每张图片一个部分），json 传输使用 base64 列表"""
+        if self.transport == "json":
+            return {
+                "url": f"{self.server_url}/ocr/batch",
+                "params": self._params(),
+                "json": {"images": [self._to_base64(image) for image in images]},
+            }
+        files = []
+        for index, image in enumerate(images):
+            request = self._build_request(image)
+            headers = dict(request["headers"])
+            content_type = headers.pop("Content-Type")
+            # multipart 编码需要 bytes
+            content = bytes(request["content"])
+            files.append(("images", (f"image{index}", content, content_type, headers)))
+        return {"url": f"{self.server_url}/ocr/batch", "params": self._params(), "files": files}
+
+    @staticmethod
+    def _chunks(
+        images: Sequence[Union[str, np.ndarray, bytes]], batch_size: int
+    ) -> List[Sequence[Union[str, np.ndarray, bytes]]]:
+        if batch_size < 1:
+            raise ValueError("batch_size 至少为 1")
+        return [images[i:i + batch_size] for i in range(0, len(images), batch_size)]
+
+    def _parse_batch_result(self, result: Dict[str, Any], expected: int) -> List[Any]:
+        """提取批量识别结果，数量与请求中的图片数不一致时报错"""
+        results = result["results"]
+        if len(results) != expected:
+            raise ValueError(f"批量识别结果数量 {len(results)} 与图片数 {expected} 不一致")
+        return results
+
+    def _ndarray_payload(self, array: np.ndarray) -> Dict[str, Any]:
+        """
+        将数组的像素缓冲区与形状、dtype、步长元数据打包为请求体与请求头
+
+        请求体是数组内存的只读视图，C 连续的数组不拷贝；非 C 连续的数组（如切片、转置）
+        先整理为连续内存。服务端据此零拷贝还原数组
+        """
+        if array.ndim not in (2, 3):
+            raise ValueError(f"图片数组应为二维或三维，实际形状: {array.shape}")
+        array = np.ascontiguousarray(array)
+        self.logger.debug(
+            f"numpy 数组以原始缓冲区发送，形状: {array.shape}，dtype: {array.dtype}，"
+            f"大小: {array.nbytes} 字节"
+        )
+        return {
+            "content": memoryview(array).cast("B").toreadonly(),
+            "headers": {
+                "Content-Type": NDARRAY_CONTENT_TYPE,
+                "X-Array-Shape": ",".join(str(n) for n in array.shape),
+                "X-Array-Dtype": array.dtype.str,
+                "X-Array-Strides": ",".join(str(n) for n in array.strides),
+            },
+        }
+
     def _is_base64(self, s: str) -> bool:
         """检查字符串是否为有效的 base64"""
         try:
@@ -69,6 +257,48 @@ class OCR:
         except:
             return False
 
+    def _parse_result(self, result: Dict[str, Any]) -> Any:
+        """提取服务返回的第一页识别结果"""
+        self.logger.info("OCR 识别完成")
+        return result["result"][0]
+
+
+class OCR(BaseOCR):
+    """
+    OCR 客户端
+
+    使用带连接池的 requests.Session 保持与 PaddleOCR 服务的长连接，
+    连续识别多张图片时复用 TCP 连接，所有请求均带超时
+    """
+
+    def __init__(
+        self,
+        server_url: str = "http://localhost:8001",
+        pool_size: int = 10,
+        timeout: float = 60.0,
+        connect_timeout: float = 5.0,
+        transport: str = "json",
+        array_encoding: str = "raw",
+        output_format: str = "full",
+    ):
+        super().__init__(
+            server_url,
+            pool_size,
+            timeout,
+            connect_timeout,
+            transport,
+            array_encoding,
+            output_format,
+        )
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+    def close(self) -> None:
+        """关闭连接池"""
+        self.session.close()
+
     def recognize(self, image_input: Union[str, np.ndarray, bytes]) -> List[Any]:
         """识别图片中的文字
 
@@ -81,23 +311,19 @@ class OCR:
         self.logger.info(f"开始 OCR 识别，输入类型: {type(image_input).__name__}")
 
         try:
-            # 转换为 base64
-            image_b64 = self._to_base64(image_input)
-            self.logger.debug("图片转换为 base64 完成")
+            request = self._build_request(image_input)
+            # requests 使用 data 传递原始请求体
+            if "content" in request:
+                request["data"] = request.pop("content")
 
             # 发送请求
-            self.logger.debug(f"发送 OCR 请求到: {self.server_url}/ocr")
-            response = requests.post(
-                f"{self.server_url}/ocr", json={"image": image_b64}
+            self.logger.debug(f"发送 OCR 请求到: {request['url']}")
+            response = self.session.post(
+                **request, timeout=(self.connect_timeout, self.timeout)
             )
 
             if response.status_code == 200:
-                result = response.json()
-                self.logger.info(
-                    f"OCR 识别完成"
-                )
-                result = result['result'][0]
-                return result
+                return self._parse_result(response.json())
             else:
                 self.logger.error(
                     f"OCR 请求失败，状态码: {response.status_code}, 响应: {response.text}"
@@ -112,6 +338,197 @@ class OCR:
             raise
 
 
+    def _recognize_batch(self, images: Sequence[Union[str, np.ndarray, bytes]]) -> List[Any]:
+        """发送一个批量请求"""
+        request = self._build_batch_request(images)
+        self.logger.debug(f"发送批量 OCR 请求到: {request['url']}，共 {len(images)} 张图片")
+        response = self.session.post(
+            **request, timeout=(self.connect_timeout, self.timeout)
+        )
+        if response.status_code != 200:
+            self.logger.error(
+                f"批量 OCR 请求失败，状态码: {response.status_code}, 响应: {response.text}"
+            )
+            response.raise_for_status()
+        return self._parse_batch_result(response.json(), len(images))
+
+    def recognize_many(
+        self,
+        images: Sequence[Union[str, np.ndarray, bytes]],
+        batch_size: int = 8,
+        concurrency: int = 2,
+    ) -> List[Any]:
+        """批量识别多张图片
+
+        Args:
+            images: 图片列表，每项支持的格式与 recognize 相同
+            batch_size: 每个请求携带的图片数，不应超过服务端的 OCR_MAX_BATCH_SIZE
+            concurrency: 同时进行的请求数
+
+        Returns:
+            与输入顺序一一对应的识别结果列表，每项与 recognize 的返回值格式相同
+        """
+        chunks = self._chunks(images, batch_size)
+        self.logger.info(
+            f"开始批量 OCR 识别，共 {len(images)} 张图片，分为 {len(chunks)} 个请求"
+        )
+        try:
+            if len(chunks) <= 1 or concurrency <= 1:
+                results = [self._recognize_batch(chunk) for chunk in chunks]
+            else:
+                with ThreadPoolExecutor(max_workers=min(concurrency, len(chunks))) as pool:
+                    results = list(pool.map(self._recognize_batch, chunks))
+        except requests.exceptions.RequestException as e:
+            self.logger.error(f"网络请求异常: {str(e)}")
+            raise
+        self.logger.info("批量 OCR 识别完成")
+        return [item for chunk in results for item in chunk]
+
+
+class AsyncOCR(BaseOCR):
+    """
+    异步 OCR 客户端，接口与 OCR 相同，recognize 需要 await
+
+    基于 httpx.AsyncClient 的连接池保持长连接；图片格式转换在线程池中执行，
+    适合在 FastAPI 等事件循环中直接使用，不会阻塞其他请求
+    """
+
+    def __init__(
+        self,
+        server_url: str = "http://localhost:8001",
+        pool_size: int = 10,
+        timeout: float = 60.0,
+        connect_timeout: float = 5.0,
+        transport: str = "json",
+        array_encoding: str = "raw",
+        output_format: str = "full",
+    ):
+        super().__init__(
+            server_url,
+            pool_size,
+            timeout,
+            connect_timeout,
+            transport,
+            array_encoding,
+            output_format,
+        )
+        self.client = httpx.AsyncClient(
+            limits=httpx.Limits(
+                max_connections=pool_size, max_keepalive_connections=pool_size
+            ),
+            timeout=httpx.Timeout(timeout, connect=connect_timeout),
+        )
+
+    async def aclose(self) -> None:
+        """关闭连接池"""
+        await self.client.aclose()
+
+    async def check_ready(self, timeout: float = 2.0) -> Dict[str, Any]:
+        """查询 PaddleOCR 服务的就绪检查接口
+
+        Args:
+            timeout: 请求超时（秒），就绪检查应快速失败，不使用识别请求的超时
+
+        Returns:
+            {"ready": 是否就绪, "detail": 服务返回的就绪详情或请求失败原因}
+        """
+        try:
+            response = await self.client.get(f"{self.server_url}/ready", timeout=timeout)
+        except httpx.HTTPError as e:
+            return {"ready": False, "detail": f"{type(e).__name__}: {e}"}
+        try:
+            detail = response.json()
+        except ValueError:
+            detail = response.text
+        return {"ready": response.status_code == 200, "detail": detail}
+
+    async def recognize(self, image_input: Union[str, np.ndarray, bytes]) -> List[Any]:
+        """识别图片中的文字
+
+        Args:
+            image_input: 与 OCR.recognize 相同
+        """
+        self.logger.info(f"开始 OCR 识别，输入类型: {type(image_input).__name__}")
+
+        try:
+            # 字节输入无需转换；读取文件与编码可能较慢，放到线程池中执行
+            if isinstance(image_input, bytes):
+                request = self._build_request(image_input)
+            else:
+                request = await asyncio.to_thread(self._build_request, image_input)
+
+            content = request.get("content")
+            if isinstance(content, memoryview):
+                # 显式给出长度，避免 httpx 对流式请求体使用分块编码
+                request["content"] = _single_chunk(content)
+                request["headers"] = {
+                    **request["headers"],
+                    "Content-Length": str(content.nbytes),
+                }
+
+            self.logger.debug(f"发送 OCR 请求到: {request['url']}")
+            response = await self.client.post(**request)
+
+            if response.status_code == 200:
+                return self._parse_result(response.json())
+            else:
+                self.logger.error(
+                    f"OCR 请求失败，状态码: {response.status_code}, 响应: {response.text}"
+                )
+                response.raise_for_status()
+
+        except httpx.HTTPError as e:
+            self.logger.error(f"网络请求异常: {str(e)}")
+            raise
+        except Exception as e:
+            self.logger.error(f"OCR 识别过程中发生异常: {str(e)}")
+            raise
+
+
+    async def _recognize_batch(
+        self, images: Sequence[Union[str, np.ndarray, bytes]]
+    ) -> List[Any]:
+        """发送一个批量请求，请求体在线程池中构造"""
+        request = await asyncio.to_thread(self._build_batch_request, images)
+        self.logger.debug(f"发送批量 OCR 请求到: {request['url']}，共 {len(images)} 张图片")
+        response = await self.client.post(**request)
+        if response.status_code != 200:
+            self.logger.error(
+                f"批量 OCR 请求失败，状态码: {response.status_code}, 响应: {response.text}"
+            )
+            response.raise_for_status()
+        return self._parse_batch_result(response.json(), len(images))
+
+    async def recognize_many(
+        self,
+        images: Sequence[Union[str, np.ndarray, bytes]],
+        batch_size: int = 8,
+        concurrency: int = 2,
+    ) -> List[Any]:
+        """批量识别多张图片
+
+        Args:
+            参数与返回值同 OCR.recognize_many
+        """
+        chunks = self._chunks(images, batch_size)
+        self.logger.info(
+            f"开始批量 OCR 识别，共 {len(images)} 张图片，分为 {len(chunks)} 个请求"
+        )
+        semaphore = asyncio.Semaphore(max(1, concurrency))
+
+        async def run(chunk: Sequence[Union[str, np.ndarray, bytes]]) -> List[Any]:
+            async with semaphore:
+                return await self._recognize_batch(chunk)
+
+        try:
+            results = await asyncio.gather(*(run(chunk) for chunk in chunks))
+        except httpx.HTTPError as e:
+            self.logger.error(f"网络请求异常: {str(e)}")
+            raise
+        self.logger.info("批量 OCR 识别完成")
+        return [item for chunk in results for item in chunk]
+
+
 if __name__ == "__main__":
     # 测试
     ocr = OCR()
@@ -0,0 +1,236 @@
+"""
+OCR 结果缓存
+
+按图片内容（解码后的图片字节或像素缓冲区）与识别选项的哈希缓存识别结果，
+包含按字节数限制的内存 LRU 层与可选的本地 SQLite 磁盘层，磁盘层超过容量时淘汰最久未访问的条目。
+同一张图片无论以文件路径、base64 还是上传文件的形式提交，都命中同一条缓存
+"""
+
+import asyncio
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, Optional, Union
+
+import numpy as np
+
+from src.core.base.cache import LRUCache
+from src.core.base.logger import get_logger
+
+
+def image_key(image: Union[bytes, np.ndarray], options: Optional[Dict[str, Any]] = None) -> str:
+    """
+    计算图片的缓存键，大图哈希耗时较长，在事件循环中应通过 asyncio.to_thread 调用
+
+    参数:
+        image: 图片文件字节，或 numpy 像素数组（形状与 dtype 参与计算）
+        options: 影响识别结果的选项，如服务地址
+
+    返回:
+        SHA-256 十六进制摘要
+    """
+    digest = hashlib.sha256()
+    if isinstance(image, np.ndarray):
+        array = np.ascontiguousarray(image)
+        digest.update(f"ndarray:{array.shape}:{array.dtype.str}:".encode("utf-8"))
+        digest.update(memoryview(array).cast("B"))
+    else:
+        digest.update(b"bytes:")
+        digest.update(image)
+    digest.update(json.dumps(options or {}, sort_keys=True, default=str).encode("utf-8"))
+    return digest.hexdigest()
+
+
+class OCRResultCache:
+    """
+    两级 OCR 结果缓存：内存 LRU + 可选 SQLite 磁盘层
+
+    属性:
+        memory: 内存 LRU 层，按条目数与结果序列化后的字节数限制
+        db_path: 磁盘层数据库路径，为 None 时不启用磁盘层
+        disk_max_bytes: 磁盘层结果总字节数上限
+    """
+
+    def __init__(
+        self,
+        max_items: int = 1024,
+        max_bytes: Optional[int] = 64 * 1024 * 1024,
+        db_path: Optional[str] = None,
+        disk_max_bytes: int = 1024 * 1024 * 1024,
+    ) -> None:
+        """
+        初始化结果缓存
+
+        参数:
+            max_items: 内存层最多缓存的结果数量
+            max_bytes: 内存层结果总字节数上限，None 表示只按数量限制
+            db_path: 磁盘层 SQLite 文件路径，为 None 时只使用内存层
+            disk_max_bytes: 磁盘层结果总字节数上限，超过时淘汰最久未访问的条目
+        """
+        self.logger = get_logger(self.__class__.__name__)
+        self.memory: LRUCache[str, str] = LRUCache(
+            max_items=max_items, max_bytes=max_bytes, sizeof=len
+        )
+        self.disk_max_bytes = disk_max_bytes
+        self.disk_hits = 0
+        self.disk_evictions = 0
+        self.misses = 0
+        self.bypassed = 0
+
+        self.db_path = Path(db_path) if db_path else None
+        self._conn: Optional[sqlite3.Connection] = None
+        self._lock = threading.Lock()
+        self._disk_bytes = 0
+        if self.db_path:
+            self.db_path.parent.mkdir(parents=True, exist_ok=True)
+            self._conn = sqlite3.connect(str(self.db_path), check_same_thread=False)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS results (
+                    key TEXT PRIMARY KEY,
+                    result TEXT NOT NULL,
+                    size INTEGER NOT NULL,
+                    accessed_at REAL NOT NULL
+                )
+                """
+            )
+            self._conn.execute(
+                "CREATE INDEX IF NOT EXISTS idx_results_accessed ON results (accessed_at)"
+            )
+            self._conn.commit()
+            self._disk_bytes = self._conn.execute(
+                "SELECT COALESCE(SUM(size), 0) FROM results"
+            ).fetchone()[0]
+            self.logger.info(f"OCR 结果缓存磁盘层已启用: {self.db_path}")
+
+    def get(self, key: str) -> Optional[Any]:
+        """读取缓存，内存层未命中时查询磁盘层并回填内存层"""
+        encoded = self.memory.get(key)
+        if encoded is not None:
+            return json.loads(encoded)
+        return self._get_disk(key)
+
+    async def aget(self, key: str) -> Optional[Any]:
+        """get 的异步版本，磁盘层查询在线程池中执行，不阻塞事件循环"""
+        encoded = self.memory.get(key)
+        if encoded is not None:
+            return json.loads(encoded)
+        if self._conn is None:
+            self.misses += 1
+            return None
+        return await asyncio.to_thread(self._get_disk, key)
+
+    def _get_disk(self, key: str) -> Optional[Any]:
+        """查询磁盘层，命中时回填内存层"""
+        if self._conn is not None:
+            with self._lock:
+                row = self._conn.execute(
+                    "SELECT result FROM results WHERE key = ?", (key,)
+                ).fetchone()
+                if row is not None:
+                    self._conn.execute(
+                        "UPDATE results SET accessed_at = ? WHERE key = ?", (time.time(), key)
+                    )
+                    self._conn.commit()
+            if row is not None:
+                self.disk_hits += 1
+                self.memory.put(key, row[0])
+                return json.loads(row[0])
+
+        self.misses += 1
+        return None
+
+    def put(self, key: str, result: Any) -> None:
+        """写入内存层与磁盘层，磁盘层超过容量时按访问时间淘汰"""
+        encoded = json.dumps(result, ensure_ascii=False)
+        self.memory.put(key, encoded)
+        if self._conn is None:
+            return
+        size = len(encoded.encode("utf-8"))
+        with self._lock:
+            previous = self._conn.execute(
+                "SELECT size FROM results WHERE key = ?", (key,)
+            ).fetchone()
+            self._conn.execute(
+                "INSERT OR REPLACE INTO results (key, result, size, accessed_at) "
+                "VALUES (?, ?, ?, ?)",
+                (key, encoded, size, time.time()),
+            )
+            self._disk_bytes += size - (previous[0] if previous else 0)
+            if self._disk_bytes > self.disk_max_bytes:
+                self._evict_disk()
+            self._conn.commit()
+
+    async def aput(self, key: str, result: Any) -> None:
+        """put 的异步版本，序列化与磁盘层写入在线程池中执行"""
+        await asyncio.to_thread(self.put, key, result)
+
+    def _evict_disk(self) -> None:
+        """持有锁时调用：按访问时间从旧到新删除，直到总字节数回到上限的 90%"""
+        target = int(self.disk_max_bytes * 0.9)
+        rows = self._conn.execute(
+            "SELECT key, size FROM results ORDER BY accessed_at"
+        ).fetchall()
+        evicted = []
+        for key, size in rows:
+            if self._disk_bytes <= target:
+                break
+            evicted.append((key,))
+            self._disk_bytes -= size
+        self._conn.executemany("DELETE FROM results WHERE key = ?", evicted)
+        self.disk_evictions += len(evicted)
+        self.logger.info(f"OCR 结果缓存磁盘层淘汰 {len(evicted)} 条结果")
+
+    def record_bypass(self) -> None:
+        """记录一次显式跳过缓存的请求"""
+        self.bypassed += 1
+
+    def stats(self) -> Dict[str, Any]:
+        """返回缓存命中与淘汰统计"""
+        memory = self.memory.stats()
+        hits = memory["hits"] + self.disk_hits
+        lookups = hits + self.misses
+        return {
+            "memory": memory,
+            "disk_enabled": self._conn is not None,
+            "disk_bytes": self._disk_bytes,
+            "disk_max_bytes": self.disk_max_bytes if self._conn is not None else None,
+            "memory_hits": memory["hits"],
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "memory_evictions": memory["evictions"],
+            "disk_evictions": self.disk_evictions,
+            "bypassed": self.bypassed,
+            "hit_rate": hits / lookups if lookups else 0.0,
+        }
+
+
+_result_cache: Optional[OCRResultCache] = None
+
+
+def get_result_cache() -> OCRResultCache:
+    """
+    获取进程级 OCR 结果缓存
+
+    通过环境变量配置:
+        OCR_CACHE_SIZE: 内存层容量（条目数）
+        OCR_CACHE_MAX_BYTES: 内存层结果总字节数上限
+        OCR_CACHE_DB: 磁盘层 SQLite 文件路径，未设置时不启用磁盘层
+        OCR_CACHE_DISK_MAX_BYTES: 磁盘层结果总字节数上限
+    """
+    global _result_cache
+    if _result_cache is None:
+        _result_cache = OCRResultCache(
+            max_items=int(os.getenv("OCR_CACHE_SIZE", "1024")),
+            max_bytes=int(os.getenv("OCR_CACHE_MAX_BYTES", str(64 * 1024 * 1024))),
+            db_path=os.getenv("OCR_CACHE_DB") or None,
+            disk_max_bytes=int(
+                os.getenv("OCR_CACHE_DISK_MAX_BYTES", str(1024 * 1024 * 1024))
+            ),
+        )
+    return _result_cache
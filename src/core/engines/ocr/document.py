@@ -0,0 +1,147 @@
+"""
+多页文档 OCR
+
+按页惰性解码多页 TIFF 与 PDF：每次只解码下一页，识别与后续页的解码流水线并行，
+同时驻留内存的解码页数不超过并发数，数百页的文档也不会整体展开。
+PDF 渲染依赖可选的 pypdfium2，未安装时只支持 TIFF 等图片格式
+"""
+
+import asyncio
+import io
+import time
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Iterator, Optional, Union
+
+import numpy as np
+from PIL import Image, ImageSequence
+
+try:
+    import pypdfium2 as pdfium
+except ImportError:  # pypdfium2 为可选依赖，缺失时不支持 PDF
+    pdfium = None
+
+from src.core.base.concurrency import bounded_map
+from src.core.base.logger import get_logger
+
+logger = get_logger(__name__)
+
+# 识别单页的函数，输入页面像素数组，返回识别结果
+RecognizeFn = Callable[[np.ndarray], Awaitable[Any]]
+
+
+def is_pdf(data: bytes, content_type: Optional[str] = None) -> bool:
+    """按文件头或 Content-Type 判断是否为 PDF"""
+    return data[:5] == b"%PDF-" or content_type == "application/pdf"
+
+
+def _iter_pdf_pages(data: bytes, dpi: int) -> Iterator[np.ndarray]:
+    document = pdfium.PdfDocument(data)
+    try:
+        for index in range(len(document)):
+            page = document[index]
+            try:
+                bitmap = page.render(scale=dpi / 72)
+                image = np.array(bitmap.to_pil().convert("RGB"))
+            finally:
+                page.close()
+            yield image
+    finally:
+        document.close()
+
+
+def _iter_image_frames(data: bytes) -> Iterator[np.ndarray]:
+    with Image.open(io.BytesIO(data)) as image:
+        for frame in ImageSequence.Iterator(image):
+            yield np.array(frame.convert("RGB"))
+
+
+def iter_pages(
+    data: bytes, content_type: Optional[str] = None, dpi: int = 200
+) -> Iterator[np.ndarray]:
+    """
+    逐页解码文档
+
+    参数:
+        data: 文档文件字节
+        content_type: 文件的 Content-Type，用于辅助判断格式
+        dpi: PDF 渲染分辨率
+
+    返回:
+        按页顺序产出 RGB 像素数组的迭代器，每次迭代才解码下一页
+
+    异常:
+        ImportError: 文档为 PDF 但未安装 pypdfium2
+    """
+    if is_pdf(data, content_type):
+        if pdfium is None:
+            raise ImportError("PDF 识别需要安装 pypdfium2: pip install pypdfium2")
+        return _iter_pdf_pages(data, dpi)
+    return _iter_image_frames(data)
+
+
+async def recognize_document(
+    pages: Iterator[np.ndarray],
+    recognize: RecognizeFn,
+    concurrency: int = 4,
+) -> AsyncIterator[Dict[str, Any]]:
+    """
+    流水线识别文档的各页，按完成顺序产出每页结果
+
+    由 bounded_map 驱动：固定数量的协程依次从页迭代器中取下一页（解码在线程池中进行，
+    同一时刻只解码一页），取到后立即识别；调用方提前停止迭代（如客户端断开）时取消剩余识别，
+    并在进行中的解码结束后关闭页迭代器，释放其持有的文档
+
+    参数:
+        pages: 页面迭代器，通常来自 iter_pages
+        recognize: 识别单页的协程函数
+        concurrency: 同时识别的页数，也是同时驻留内存的解码页数上限
+
+    返回:
+        异步迭代器，每项包含 page（从 1 开始的页码）、elapsed，以及 result 或 error；
+        页迭代器本身出错（如文档损坏）时产出一条只含 error 的记录
+    """
+    # 进行中的解码；取消时线程仍在执行 next，需等它结束才能关闭页迭代器
+    decoding: Optional["asyncio.Future[Optional[np.ndarray]]"] = None
+
+    async def decoded() -> AsyncIterator[Union[np.ndarray, Exception]]:
+        nonlocal decoding
+        # 解码在线程池中进行；页迭代器出错后不再继续取页
+        while True:
+            decoding = asyncio.ensure_future(asyncio.to_thread(next, pages, None))
+            try:
+                image = await asyncio.shield(decoding)
+            except Exception as e:
+                logger.error(f"文档解码失败: {e}")
+                yield e
+                return
+            if image is None:
+                return
+            yield image
+
+    async def recognize_page(image: Union[np.ndarray, Exception]) -> Dict[str, Any]:
+        if isinstance(image, Exception):
+            return {"error": f"文档解码失败: {image}"}
+        started = time.perf_counter()
+        record: Dict[str, Any] = {}
+        try:
+            record["result"] = await recognize(image)
+        except Exception as e:
+            record["error"] = str(e)
+        record["elapsed"] = round(time.perf_counter() - started, 3)
+        return record
+
+    try:
+        async for index, record in bounded_map(recognize_page, decoded(), concurrency):
+            if "elapsed" not in record:
+                yield record
+                continue
+            page = index + 1
+            if "error" in record:
+                logger.warning(f"第 {page} 页识别失败: {record['error']}")
+            yield {"page": page, **record}
+    finally:
+        if decoding is not None:
+            await asyncio.wait({decoding})
+        close = getattr(pages, "close", None)
+        if close is not None:
+            # 关闭生成器会执行其 finally（如关闭 PDF 文档），同样放到线程池中
+            await asyncio.to_thread(close)
@@ -0,0 +1,237 @@
+import asyncio
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, Sequence, Set, Tuple, Type
+
+logger = logging.getLogger(__name__)
+
+# 把一批图片识别为等长结果列表的函数
+PredictFn = Callable[[List[Any]], List[Any]]
+
+
+class Histogram:
+    """固定分桶的计数直方图，桶上界包含在内，超出最大上界的样本计入 +Inf"""
+
+    def __init__(self, buckets: Sequence[float]):
+        self.buckets = sorted(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value: float) -> None:
+        for index, bound in enumerate(self.buckets):
+            if value <= bound:
+                break
+        else:
+            index = len(self.buckets)
+        self.counts[index] += 1
+        self.count += 1
+        self.sum += value
+
+    def to_dict(self) -> Dict[str, Any]:
+        labels = [str(bound) for bound in self.buckets] + ["+Inf"]
+        return {
+            "buckets": dict(zip(labels, self.counts)),
+            "count": self.count,
+            "sum": round(self.sum, 4),
+            "avg": round(self.sum / self.count, 4) if self.count else 0.0,
+        }
+
+
+class MicroBatcher:
+    """
+    动态微批调度器
+
+    并发到达的单图请求先进入队列，调度协程取出第一条后在 max_wait 窗口内继续收集，
+    攒满 max_batch_size 或窗口结束即合并为一次 predict 调用，再把结果分发给各个等待方。
+    predict 在线程池中执行，最多 concurrency 批同时进行（通常等于推理进程数）；
+    所有批次都在进行中时新到达的请求继续排队，下一批自然变大
+    """
+
+    def __init__(
+        self,
+        predict: PredictFn,
+        max_batch_size: int = 8,
+        max_wait: float = 0.01,
+        concurrency: int = 1,
+        fail_fast: Tuple[Type[BaseException], ...] = (),
+    ):
+        """
+        参数:
+            predict: 批量识别函数，输入图片列表，返回等长的结果列表，需线程安全
+            max_batch_size: 单次 predict 的最大图片数
+            max_wait: 收到第一条请求后等待更多请求的最长时间（秒）
+            concurrency: 同时进行的 predict 调用数
+            fail_fast: 整批失败时不逐张重试、直接作为整批结果的异常类型（如推理超时、进程崩溃）
+        """
+        if max_batch_size < 1:
+            raise ValueError("max_batch_size 至少为 1")
+        self.predict = predict
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self.concurrency = max(1, concurrency)
+        self.fail_fast = fail_fast
+        self.batch_sizes = Histogram([1, 2, 4, 8, 16, 32, 64])
+        self.queue_depths = Histogram([0, 1, 2, 4, 8, 16, 32, 64, 128, 256])
+        self.batch_seconds = Histogram([0.05, 0.1, 0.25, 0.5, 1, 2, 5, 10])
+        self.batches = 0
+        self.images = 0
+        self.fallbacks = 0
+        self._queue: Optional["asyncio.Queue[Tuple[Any, asyncio.Future]]"] = None
+        self._task: Optional["asyncio.Task[None]"] = None
+        self._slots: Optional[asyncio.Semaphore] = None
+        self._inflight: Set["asyncio.Task[None]"] = set()
+        self._executor = ThreadPoolExecutor(
+            max_workers=self.concurrency, thread_name_prefix="ocr-predict"
+        )
+
+    def start(self) -> None:
+        """在当前事件循环中启动调度协程"""
+        if self._task is None:
+            self._queue = asyncio.Queue()
+            self._slots = asyncio.Semaphore(self.concurrency)
+            self._task = asyncio.get_running_loop().create_task(self._run())
+            logger.info(
+                f"微批调度器已启动，最大批量: {self.max_batch_size}，"
+                f"等待窗口: {self.max_wait * 1000:.1f} ms，并发批次: {self.concurrency}"
+            )
+
+    async def stop(self) -> None:
+        """停止调度协程，队列中未处理的请求以异常结束"""
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+        while not self._queue.empty():
+            _, future = self._queue.get_nowait()
+            if not future.done():
+                future.set_exception(RuntimeError("OCR 服务正在关闭"))
+        self._executor.shutdown(wait=False)
+
+    async def submit(self, image: Any) -> Any:
+        """提交一张图片并等待其识别结果"""
+        if self._task is None:
+            raise RuntimeError("微批调度器未启动")
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((image, future))
+        return await future
+
+    async def submit_many(self, images: Sequence[Any]) -> List[Any]:
+        """提交多张图片，与其他请求一起参与组批，按输入顺序返回结果"""
+        return list(await asyncio.gather(*(self.submit(image) for image in images)))
+
+    async def _collect(self) -> List[Tuple[Any, asyncio.Future]]:
+        """阻塞取出第一条请求，再在等待窗口内收集，直到攒满一批"""
+        batch = [await self._queue.get()]
+        self.queue_depths.observe(self._queue.qsize() + 1)
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                # 窗口已过，但已在排队的请求仍直接并入本批
+                if self._queue.empty():
+                    break
+                batch.append(self._queue.get_nowait())
+                continue
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), remaining))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def _run(self) -> None:
+        while True:
+            # 先等到空闲的批次名额再组批，名额全部占用期间请求在队列中累积
+            await self._slots.acquire()
+            try:
+                batch = await self._collect()
+            except BaseException:
+                self._slots.release()
+                raise
+            # 等待方已取消（如客户端断开）的请求不再识别
+            batch = [(image, future) for image, future in batch if not future.done()]
+            if not batch:
+                self._slots.release()
+                continue
+            # 保留任务引用，避免进行中的批次被垃圾回收
+            task = asyncio.get_running_loop().create_task(self._dispatch(batch))
+            self._inflight.add(task)
+            task.add_done_callback(self._inflight.discard)
+
+    async def _dispatch(self, batch: List[Tuple[Any, asyncio.Future]]) -> None:
+        """执行一批识别并把结果分发给各个等待方"""
+        images = [image for image, _ in batch]
+        started = time.monotonic()
+        try:
+            results = await asyncio.get_running_loop().run_in_executor(
+                self._executor, self._predict, images
+            )
+        except Exception as e:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        finally:
+            self.batch_seconds.observe(time.monotonic() - started)
+            self._slots.release()
+        self.batches += 1
+        self.images += len(images)
+        self.batch_sizes.observe(len(images))
+        for (_, future), result in zip(batch, results):
+            if future.done():
+                continue
+            if isinstance(result, Exception):
+                future.set_exception(result)
+            else:
+                future.set_result(result)
+
+    def _predict(self, images: List[Any]) -> List[Any]:
+        """
+        在线程池中识别一批图片
+
+        整批识别失败时逐张重试，单张失败的图片以异常作为结果，不影响同批的其他请求；
+        fail_fast 中的异常（推理超时、进程崩溃）逐张重试只会让每张图片再等一次，
+        直接作为整批的失败，逐张重试中遇到时其余图片也不再识别
+        """
+        try:
+            results = self.predict(images)
+            if len(results) != len(images):
+                raise RuntimeError(f"识别结果数量 {len(results)} 与图片数 {len(images)} 不一致")
+            return results
+        except Exception as e:
+            if len(images) == 1 or isinstance(e, self.fail_fast):
+                raise
+            logger.warning(f"批量识别失败，逐张重试 {len(images)} 张图片: {e}")
+            self.fallbacks += 1
+
+        results: List[Any] = []
+        for index, image in enumerate(images):
+            try:
+                results.append(self.predict([image])[0])
+            except Exception as e:
+                if isinstance(e, self.fail_fast):
+                    results.extend([e] * (len(images) - index))
+                    break
+                results.append(e)
+        return results
+
+    def stats(self) -> Dict[str, Any]:
+        """返回调度统计信息"""
+        return {
+            "max_batch_size": self.max_batch_size,
+            "max_wait_ms": round(self.max_wait * 1000, 3),
+            "concurrency": self.concurrency,
+            "queue_depth": self._queue.qsize() if self._queue is not None else 0,
+            "batches": self.batches,
+            "images": self.images,
+            "avg_batch_size": round(self.images / self.batches, 3) if self.batches else 0.0,
+            "fallbacks": self.fallbacks,
+            "batch_size_histogram": self.batch_sizes.to_dict(),
+            "queue_depth_histogram": self.queue_depths.to_dict(),
+            "batch_seconds_histogram": self.batch_seconds.to_dict(),
+        }
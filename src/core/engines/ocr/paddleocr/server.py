@@ -1,15 +1,24 @@
+import asyncio
 import base64
+import functools
 import io
 import logging
-from typing import Any, List
+import os
+from contextlib import asynccontextmanager
+from pathlib import Path
+from typing import Any, Callable, List, Optional
 
 import numpy as np
-import paddleocr
 import uvicorn
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Query, Request
+from fastapi.responses import JSONResponse
 from PIL import Image
 from pydantic import BaseModel
 
+from batcher import MicroBatcher
+from tiling import merge_tile_results, plan_tiles, poly_to_box, split_tiles
+from workers import InferenceTimeout, WorkerCrashed, WorkerPool, default_pool_size
+
 # 配置日志
 logging.basicConfig(
     level=logging.INFO, 
@@ -21,59 +30,441 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-# 全局 OCR 实例
-logger.info("初始化 PaddleOCR...")
-ocr = paddleocr.PaddleOCR(use_angle_cls=True, lang="ch")
-logger.info("PaddleOCR 初始化完成")
+# 预热图片名，容器中挂载到服务脚本同目录；本地运行时在上级目录中查找仓库内置的示例图片
+WARMUP_IMAGE_NAME = "warmup.png"
+BUNDLED_IMAGE = Path("common") / "images" / "image001.png"
+# 每个工作进程就绪前识别预热图片的次数：首次包含算子初始化，之后的耗时接近稳态
+WARMUP_RUNS = int(os.getenv("OCR_WARMUP_RUNS", "2"))
+
+
+def find_warmup_image() -> Optional[Path]:
+    """
+    预热图片路径：OCR_WARMUP_IMAGE 环境变量（设为空字符串表示不预热），
+    未设置时依次查找服务脚本同目录的 warmup.png 与上级目录中的 common/images/image001.png
+    """
+    configured = os.getenv("OCR_WARMUP_IMAGE")
+    if configured is not None:
+        return Path(configured) if configured else None
+    here = Path(__file__).resolve().parent
+    candidates = [here / WARMUP_IMAGE_NAME] + [parent / BUNDLED_IMAGE for parent in here.parents]
+    return next((path for path in candidates if path.is_file()), None)
+
+
+def load_warmup_images() -> List[np.ndarray]:
+    """读取预热图片，找不到或无法解码时不预热"""
+    path = find_warmup_image()
+    if path is None or WARMUP_RUNS <= 0:
+        logger.warning("未配置预热图片，工作进程加载模型后直接就绪")
+        return []
+    try:
+        with Image.open(path) as pil_image:
+            image = np.array(pil_image.convert("RGB"))
+    except Exception as e:
+        logger.warning(f"预热图片 {path} 读取失败，跳过预热: {e}")
+        return []
+    logger.info(f"工作进程将使用 {path} 预热 {WARMUP_RUNS} 次")
+    return [image] * WARMUP_RUNS
+
+
+# 原始像素数组的请求类型，与客户端 NDARRAY_CONTENT_TYPE 一致
+NDARRAY_CONTENT_TYPE = "application/x-ndarray"
+# 单个批量请求允许的最大图片数
+MAX_BATCH_SIZE = int(os.getenv("OCR_MAX_BATCH_SIZE", "32"))
+# 切块识别：off 不切块，auto 对任一边超过 TILE_SIZE 的图片切块，on 始终切块
+TILING_MODES = ("off", "auto", "on")
+TILING = os.getenv("OCR_TILING", "off")
+TILE_SIZE = int(os.getenv("OCR_TILE_SIZE", "1600"))
+TILE_OVERLAP = int(os.getenv("OCR_TILE_OVERLAP", "160"))
+# 输出格式：full 原样返回 PaddleOCR 结果；compact 只保留文字、置信度与整数外接框；
+# packed 在 compact 基础上把外接框打包为 base64 编码的 int32 小端数组
+OUTPUT_FORMATS = ("full", "compact", "packed")
+
+
+# 推理进程池与微批调度器在 lifespan 中创建：工作进程以 spawn 启动，会把本脚本作为 __mp_main__
+# 重新导入，模块级代码不能创建进程池或读取预热图片
+workers: Optional[WorkerPool] = None
+batcher: Optional[MicroBatcher] = None
 
-app = FastAPI()
+
+def create_worker_pool() -> WorkerPool:
+    """
+    推理进程池：每个工作进程持有独立的 PaddleOCR 实例，推理不占用事件循环；
+    工作进程完成模型加载与预热后才接收请求
+    """
+    inference_timeout = float(os.getenv("OCR_INFERENCE_TIMEOUT", "300"))
+    max_restarts = int(os.getenv("OCR_MAX_RESTARTS", "5"))
+    return WorkerPool(
+        size=default_pool_size(),
+        ocr_kwargs={"use_angle_cls": True, "lang": "ch"},
+        warmup_images=load_warmup_images(),
+        restart_delay=float(os.getenv("OCR_RESTART_DELAY", "1")),
+        max_restart_delay=float(os.getenv("OCR_MAX_RESTART_DELAY", "60")),
+        max_restarts=max_restarts if max_restarts >= 0 else None,
+        inference_timeout=inference_timeout or None,
+    )
+
+
+def create_batcher(pool: WorkerPool) -> MicroBatcher:
+    """微批调度器：并发请求在等待窗口内合并为一次 predict 调用，每个工作进程同时处理一批"""
+    return MicroBatcher(
+        pool.predict,
+        max_batch_size=int(os.getenv("OCR_MICRO_BATCH_SIZE", "8")),
+        max_wait=float(os.getenv("OCR_BATCH_WINDOW_MS", "10")) / 1000,
+        concurrency=pool.size,
+        fail_fast=(InferenceTimeout, WorkerCrashed),
+    )
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    global workers, batcher
+    logger.info("启动 PaddleOCR 工作进程...")
+    workers = create_worker_pool()
+    batcher = create_batcher(workers)
+    workers.start()
+    batcher.start()
+    yield
+    await batcher.stop()
+    workers.close()
+
+
+app = FastAPI(lifespan=lifespan)
 
 
 class OCRRequest(BaseModel):
     image: str
+    tile: Optional[str] = None
+    format: str = "full"
 
 
-def base64_to_image(base64_str: str) -> np.ndarray:
-    """Base64 转图像"""
-    try:
-        if base64_str.startswith("data:image"):
-            base64_str = base64_str.split(",")[1]
+class OCRBatchRequest(BaseModel):
+    images: List[str]
+
 
-        image_data = base64.b64decode(base64_str)
+def normalize_channels(image: np.ndarray) -> np.ndarray:
+    """
+    统一图像通道：四通道（RGBA）去掉 alpha 通道，二通道（灰度 + alpha）与单通道取灰度，
+    编码图片与原始像素数组两种输入经过同样的处理后再送入 OCR
+    """
+    if image.ndim != 3:
+        return image
+    channels = image.shape[2]
+    if channels == 3:
+        return image
+    if channels == 4:
+        return np.ascontiguousarray(image[..., :3])
+    if channels in (1, 2):
+        return np.ascontiguousarray(image[..., 0])
+    raise ValueError(f"不支持的通道数: {channels}")
+
+
+def bytes_to_image(image_data: bytes) -> np.ndarray:
+    """图片字节（PNG/JPEG 等编码格式）转图像"""
+    try:
         pil_image = Image.open(io.BytesIO(image_data))
 
-        if pil_image.mode == "RGBA":
+        # 调色板、CMYK、16 位等模式先转为 RGB，其余模式的通道由 normalize_channels 统一
+        if pil_image.mode not in ("RGB", "RGBA", "L", "LA"):
             pil_image = pil_image.convert("RGB")
 
         logger.debug(f"图像转换成功，尺寸: {pil_image.size}")
-        return np.array(pil_image)
+        return normalize_channels(np.array(pil_image))
     except Exception as e:
         logger.error(f"图像转换失败: {e}")
         raise
 
 
+def ndarray_from_buffer(buffer: bytes, headers) -> np.ndarray:
+    """
+    按请求头中的形状、dtype 与步长把请求体包装为数组，不拷贝像素数据
+
+    返回的数组与请求体共享内存，为只读数组
+    """
+    try:
+        shape = tuple(int(n) for n in headers["x-array-shape"].split(","))
+        dtype = np.dtype(headers["x-array-dtype"])
+        strides_header = headers.get("x-array-strides")
+        strides = (
+            tuple(int(n) for n in strides_header.split(",")) if strides_header else None
+        )
+    except (KeyError, ValueError, TypeError) as e:
+        raise ValueError(f"数组元数据无效: {e}")
+
+    if dtype != np.uint8:
+        raise ValueError(f"不支持的数组 dtype: {dtype}，仅支持 uint8")
+    if len(shape) not in (2, 3) or (strides is not None and len(strides) != len(shape)):
+        raise ValueError(f"数组形状无效: {shape}，步长: {strides}")
+    expected = int(np.prod(shape)) * dtype.itemsize
+    if len(buffer) != expected:
+        raise ValueError(f"数组数据长度 {len(buffer)} 与形状 {shape} 不符，应为 {expected}")
+
+    # 缓冲区不足以容纳给定形状与步长时 np.ndarray 会抛出 TypeError
+    image = np.ndarray(shape, dtype=dtype, buffer=buffer, strides=strides)
+    logger.debug(f"数组还原成功，形状: {image.shape}，dtype: {image.dtype}")
+    return image
+
+
+def base64_to_image(base64_str: str) -> np.ndarray:
+    """Base64 转图像"""
+    if base64_str.startswith("data:image"):
+        base64_str = base64_str.split(",")[1]
+    return bytes_to_image(base64.b64decode(base64_str))
+
+
+def decode_image(image_data: bytes, content_type: str, headers) -> np.ndarray:
+    """按 Content-Type 解码二进制图片：原始像素缓冲区或 PNG/JPEG 等编码格式"""
+    if content_type.split(";")[0].strip() == NDARRAY_CONTENT_TYPE:
+        return normalize_channels(ndarray_from_buffer(image_data, headers))
+    return bytes_to_image(image_data)
+
+
+def resolve_tiling(tile: Optional[str]) -> str:
+    """请求未指定切块模式时使用 OCR_TILING"""
+    mode = tile or TILING
+    if mode not in TILING_MODES:
+        raise HTTPException(status_code=400, detail=f"不支持的切块模式: {mode}，可选: {TILING_MODES}")
+    return mode
+
+
+def resolve_format(output_format: str) -> str:
+    if output_format not in OUTPUT_FORMATS:
+        raise HTTPException(
+            status_code=400, detail=f"不支持的输出格式: {output_format}，可选: {OUTPUT_FORMATS}"
+        )
+    return output_format
+
+
+def format_result(result: dict, output_format: str) -> dict:
+    """
+    按输出格式整理单张图片的识别结果
+
+    compact/packed 以列存储各文字行：texts、scores（保留 4 位小数）与 boxes（[x0, y0, x1, y1] 整数外接框），
+    去掉多边形浮点坐标与中间字段，序列化体积与编解码耗时都大幅下降
+    """
+    if output_format == "full":
+        return result
+    boxes = result.get("rec_boxes")
+    if boxes is None:
+        # 没有外接框字段时由多边形计算
+        boxes = [poly_to_box(poly) for poly in result.get("rec_polys", [])]
+    boxes = np.asarray(boxes, dtype=np.float64).reshape(-1, 4).round().astype("<i4")
+    compact = {
+        "texts": list(result.get("rec_texts", [])),
+        "scores": [round(float(score), 4) for score in result.get("rec_scores", [])],
+    }
+    if output_format == "packed":
+        compact["boxes"] = base64.b64encode(boxes.tobytes()).decode("ascii")
+        compact["boxes_dtype"] = "<i4"
+    else:
+        compact["boxes"] = boxes.tolist()
+    if "tiles" in result:
+        compact["tiles"] = result["tiles"]
+    return compact
+
+
+async def recognize_image(image: np.ndarray, tile: str = "off") -> Any:
+    """
+    识别单张图片，需要时切块
+
+    切块是原图的视图，经微批调度器分发到推理进程池并行识别，
+    每个推理进程一次只接收切块大小的数组；合并时换算坐标并去除重叠区域的重复文字框
+    """
+    height, width = image.shape[:2]
+    if tile == "off" or (tile == "auto" and max(height, width) <= TILE_SIZE):
+        return await batcher.submit(image)
+    tiles = plan_tiles(height, width, TILE_SIZE, TILE_OVERLAP)
+    logger.info(f"图片尺寸 {width}x{height}，切分为 {len(tiles)} 块并行识别")
+    results = await batcher.submit_many(split_tiles(image, tiles))
+    return merge_tile_results(results, tiles)
+
+
+async def run_ocr_batch(
+    images: List[np.ndarray], tile: str = "off", output_format: str = "full"
+) -> List[Any]:
+    """批量识别：各图片与其他并发请求一起参与组批，按输入顺序返回结果"""
+    logger.info(f"开始批量 OCR 识别，共 {len(images)} 张图片...")
+    results = await asyncio.gather(*(recognize_image(image, tile) for image in images))
+    logger.info("批量 OCR 识别完成")
+    return [format_result(result, output_format) for result in results]
+
+
+async def run_ocr(image: np.ndarray, tile: str = "off", output_format: str = "full") -> dict:
+    """执行识别并整理为响应格式"""
+    logger.info("开始 OCR 识别...")
+    result = await recognize_image(image, tile)
+    logger.info("OCR 识别完成")
+    return {'result': [format_result(result, output_format)]}
+
+
 @app.post("/ocr")
 async def ocr_recognize(request: OCRRequest) :
-    """OCR 识别接口"""
+    """OCR 识别接口（JSON + base64，兼容旧客户端）"""
     logger.info("收到 OCR 识别请求")
+    tile = resolve_tiling(request.tile)
+    output_format = resolve_format(request.format)
+    try:
+        image = await asyncio.to_thread(base64_to_image, request.image)
+        return await run_ocr(image, tile, output_format)
+    except Exception as e:
+        logger.error(f"OCR 识别失败: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@app.post("/ocr/binary")
+async def ocr_recognize_binary(
+    request: Request,
+    tile: Optional[str] = Query(None),
+    output_format: str = Query("full", alias="format"),
+):
+    """
+    OCR 识别接口（二进制传输）
+
+    请求体直接是图片文件的原始字节（Content-Type: application/octet-stream 或 image/*），
+    省去 base64 编码带来的 33% 体积膨胀与多次完整拷贝；
+    Content-Type 为 application/x-ndarray 时请求体是原始像素缓冲区，
+    形状、dtype 与步长由 X-Array-Shape、X-Array-Dtype、X-Array-Strides 请求头给出，
+    直接包装为数组，省去 PNG 解码。
+    查询参数 tile（off/auto/on）控制是否切块识别，默认取 OCR_TILING；
+    format（full/compact/packed）选择输出格式
+    """
+    tile = resolve_tiling(tile)
+    output_format = resolve_format(output_format)
+    image_data = await request.body()
+    logger.info(f"收到二进制 OCR 识别请求，大小: {len(image_data)} 字节")
+    if not image_data:
+        raise HTTPException(status_code=400, detail="请求体为空")
     try:
-        image = base64_to_image(request.image)
-        logger.info("开始 OCR 识别...")
-        result = ocr.predict(image)
-        logger.info(
-            f"OCR 识别完成"
+        image = await asyncio.to_thread(
+            decode_image, image_data, request.headers.get("content-type", ""), request.headers
         )
-        return {'result':[res.json['res'] for res in result]}
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=f"无法解码图片: {e}")
+    try:
+        return await run_ocr(image, tile, output_format)
     except Exception as e:
         logger.error(f"OCR 识别失败: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
+
+def check_batch_size(count: int) -> None:
+    """在解码之前检查批量请求的图片数"""
+    if not count:
+        raise HTTPException(status_code=400, detail="请求中没有图片")
+    if count > MAX_BATCH_SIZE:
+        raise HTTPException(
+            status_code=413, detail=f"单次最多 {MAX_BATCH_SIZE} 张图片，实际 {count} 张"
+        )
+
+
+async def decode_batch(decoders: List[Callable[[], np.ndarray]]) -> List[np.ndarray]:
+    """在线程池中并行解码各张图片，不阻塞事件循环"""
+    results = await asyncio.gather(
+        *(asyncio.to_thread(decoder) for decoder in decoders), return_exceptions=True
+    )
+    for index, result in enumerate(results):
+        if isinstance(result, Exception):
+            raise HTTPException(status_code=400, detail=f"第 {index} 张图片无法解码: {result}")
+    return results
+
+
+async def read_batch(request: Request) -> List[np.ndarray]:
+    """
+    读取批量请求中的图片，先检查图片数再解码
+
+    multipart/form-data: 每个 images 字段是一张图片，按各部分的 Content-Type 解码，
+        原始像素缓冲区的元数据放在该部分的 X-Array-* 头中
+    application/json: {"images": [base64, ...]}，兼容 base64 传输
+    """
+    content_type = request.headers.get("content-type", "")
+    if content_type.startswith("multipart/form-data"):
+        form = await request.form()
+        parts = form.getlist("images")
+        check_batch_size(len(parts))
+        decoders = []
+        for part in parts:
+            data = await part.read()
+            decoders.append(
+                functools.partial(decode_image, data, part.content_type or "", part.headers)
+            )
+        return await decode_batch(decoders)
+
+    body = OCRBatchRequest.model_validate_json(await request.body())
+    check_batch_size(len(body.images))
+    return await decode_batch(
+        [functools.partial(base64_to_image, image) for image in body.images]
+    )
+
+
+@app.post("/ocr/batch")
+async def ocr_recognize_batch(
+    request: Request,
+    tile: Optional[str] = Query(None),
+    output_format: str = Query("full", alias="format"),
+):
+    """
+    批量 OCR 识别接口
+
+    一个请求携带多张图片，解码后交给微批调度器组批识别，
+    分摊每个请求的 HTTP、序列化与日志开销；返回的 results 与输入顺序一一对应。
+    查询参数 tile 与 format 同 /ocr/binary
+    """
+    tile = resolve_tiling(tile)
+    output_format = resolve_format(output_format)
+    try:
+        images = await read_batch(request)
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=f"批量请求格式无效: {e}")
+    logger.info(f"收到批量 OCR 识别请求，共 {len(images)} 张图片")
+    try:
+        return {'results': await run_ocr_batch(images, tile, output_format)}
+    except Exception as e:
+        logger.error(f"批量 OCR 识别失败: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+
 @app.get("/health")
-async def health_check() -> dict:
-    """健康检查接口"""
+async def health_check():
+    """
+    存活检查接口：服务进程能响应请求即为健康，不代表模型已加载；
+    全部工作进程连续崩溃、已停止重启时返回 503，由编排系统重启服务
+    """
+    if workers is not None and not workers.healthy():
+        return JSONResponse(
+            status_code=503,
+            content={"status": "unhealthy", "detail": "全部 OCR 工作进程连续崩溃，已停止重启"},
+        )
     return {"status": "healthy"}
 
 
+@app.get("/ready")
+async def readiness_check():
+    """
+    就绪检查接口
+
+    至少一个工作进程完成模型加载与预热后返回 200，否则返回 503；
+    响应中包含各工作进程的模型加载与预热耗时（毫秒）
+    """
+    ready = workers.ready_count()
+    content = {
+        "status": "ready" if ready else "starting",
+        "workers_ready": ready,
+        "workers": workers.size,
+        "warmup": [
+            {"index": worker.index, "ready": worker.ready.is_set(), **(worker.timings or {})}
+            for worker in workers.workers
+        ],
+    }
+    return JSONResponse(status_code=200 if ready else 503, content=content)
+
+
+@app.get("/stats")
+async def stats() -> dict:
+    """微批调度统计（队列深度、批大小与每批耗时的直方图）与工作进程状态"""
+    return {"batcher": batcher.stats(), "workers": workers.stats()}
+
+
 
 if __name__ == "__main__":
     logger.info("启动 PaddleOCR 服务器，端口: 8001")
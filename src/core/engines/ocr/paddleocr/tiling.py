@@ -0,0 +1,260 @@
+import logging
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# 切块区域: (y0, x0, y1, x1)
+Tile = Tuple[int, int, int, int]
+
+
+def _starts(length: int, tile_size: int, overlap: int) -> List[int]:
+    """单个方向上各切块的起点，最后一块与边缘对齐"""
+    if length <= tile_size:
+        return [0]
+    step = tile_size - overlap
+    starts = list(range(0, length - tile_size, step))
+    starts.append(length - tile_size)
+    return starts
+
+
+def plan_tiles(height: int, width: int, tile_size: int, overlap: int) -> List[Tile]:
+    """
+    规划相互重叠的切块
+
+    参数:
+        height: 图片高度
+        width: 图片宽度
+        tile_size: 切块边长上限
+        overlap: 相邻切块的重叠像素数，应大于最长文字行的高度，保证被切断的文字在相邻块中完整出现
+
+    返回:
+        按行优先顺序排列的切块区域列表
+    """
+    if not 0 <= overlap < tile_size:
+        raise ValueError(f"重叠像素数 {overlap} 应在 [0, {tile_size}) 范围内")
+    return [
+        (y0, x0, min(y0 + tile_size, height), min(x0 + tile_size, width))
+        for y0 in _starts(height, tile_size, overlap)
+        for x0 in _starts(width, tile_size, overlap)
+    ]
+
+
+def split_tiles(image: np.ndarray, tiles: List[Tile]) -> List[np.ndarray]:
+    """按切块区域切分图片，返回的是原图的视图，不拷贝像素"""
+    return [image[y0:y1, x0:x1] for y0, x0, y1, x1 in tiles]
+
+
+# 需要换算坐标并去重的逐行字段组：(多边形字段, 外接框字段, 文字字段, 置信度字段, 同组逐行字段的前缀)
+# rec_* 为识别结果，dt_* 与 textline_orientation_angles 为检测结果，两组各自按行对齐
+_LINE_GROUPS = (
+    ("rec_polys", "rec_boxes", "rec_texts", "rec_scores", ("rec_",)),
+    ("dt_polys", None, None, None, ("dt_", "textline_orientation_angles")),
+)
+
+
+def poly_to_box(poly: List[List[float]]) -> List[float]:
+    """多边形的外接框 [x0, y0, x1, y1]"""
+    return [
+        min(p[0] for p in poly),
+        min(p[1] for p in poly),
+        max(p[0] for p in poly),
+        max(p[1] for p in poly),
+    ]
+
+
+def _box_area(box: List[float]) -> float:
+    return max(0.0, box[2] - box[0]) * max(0.0, box[3] - box[1])
+
+
+def _overlap_ratio(a: List[float], b: List[float]) -> float:
+    """交集面积占较小框面积的比例：被切断的半截文字框几乎完全落在完整框内"""
+    width = min(a[2], b[2]) - max(a[0], b[0])
+    height = min(a[3], b[3]) - max(a[1], b[1])
+    if width <= 0 or height <= 0:
+        return 0.0
+    smaller = min(_box_area(a), _box_area(b))
+    return width * height / smaller if smaller > 0 else 0.0
+
+
+def _fragments(a: List[float], b: List[float], collinear_threshold: float) -> bool:
+    """
+    两个框是否为同一行文字被竖直切块边界切开的左右两段：
+    竖直方向基本重合，水平方向相交且左右错开（重复识别的同一行左右边界基本一致）
+    """
+    height = min(a[3] - a[1], b[3] - b[1])
+    if height <= 0:
+        return False
+    if (min(a[3], b[3]) - max(a[1], b[1])) / height < collinear_threshold:
+        return False
+    if min(a[2], b[2]) <= max(a[0], b[0]):
+        return False
+    left, right = (a, b) if a[0] <= b[0] else (b, a)
+    tolerance = height / 2
+    return right[0] - left[0] > tolerance and right[2] - left[2] > tolerance
+
+
+def _join_text(left: str, right: str) -> str:
+    """拼接左右两段文字，两段在重叠区域中重复识别的部分（左段后缀等于右段前缀）只保留一次"""
+    for size in range(min(len(left), len(right)), 0, -1):
+        if left.endswith(right[:size]):
+            return left + right[size:]
+    return left + right
+
+
+def _join_fragments(
+    kept: Dict[str, Any], other: Dict[str, Any], text_field: Optional[str], score_field: Optional[str]
+) -> None:
+    """把 other 合并进 kept：外接框取并集，文字按左右顺序拼接，置信度按文字长度加权"""
+    left, right = (kept, other) if kept["box"][0] <= other["box"][0] else (other, kept)
+    box = [
+        min(kept["box"][0], other["box"][0]),
+        min(kept["box"][1], other["box"][1]),
+        max(kept["box"][2], other["box"][2]),
+        max(kept["box"][3], other["box"][3]),
+    ]
+    if text_field is not None:
+        left_text, right_text = left["fields"][text_field], right["fields"][text_field]
+        kept["fields"][text_field] = _join_text(left_text, right_text)
+        if score_field is not None:
+            weights = max(1, len(left_text)) + max(1, len(right_text))
+            kept["fields"][score_field] = (
+                left["fields"][score_field] * max(1, len(left_text))
+                + right["fields"][score_field] * max(1, len(right_text))
+            ) / weights
+    kept["box"] = box
+    kept["poly"] = [[box[0], box[1]], [box[2], box[1]], [box[2], box[3]], [box[0], box[3]]]
+    kept["tiles"] |= other["tiles"]
+    kept["merged"] = True
+
+
+def _merge_group(
+    results: List[Dict[str, Any]],
+    tiles: List[Tile],
+    group: Tuple[str, Optional[str], Optional[str], Optional[str], Tuple[str, ...]],
+    dedup_threshold: float,
+    collinear_threshold: float,
+) -> Tuple[Optional[Dict[str, List[Any]]], int, int]:
+    """
+    合并一组逐行字段
+
+    返回:
+        (合并后的逐行字段，各切块都没有该组字段时为 None, 去重的行数, 拼接的断行数)
+    """
+    poly_field, box_field, text_field, score_field, prefixes = group
+    if not any(poly_field in result for result in results):
+        return None, 0, 0
+
+    items = []
+    names: List[str] = []
+    for index, (result, (y0, x0, _, _)) in enumerate(zip(results, tiles)):
+        polys = result.get(poly_field) or []
+        boxes = result.get(box_field) if box_field is not None else None
+        if boxes is None or len(boxes) != len(polys):
+            # 没有外接框字段时由多边形计算
+            boxes = [poly_to_box(poly) for poly in polys]
+        aligned = [
+            name
+            for name, value in result.items()
+            if name.startswith(prefixes)
+            and name not in (poly_field, box_field)
+            and isinstance(value, list)
+            and len(value) == len(polys)
+        ]
+        names.extend(name for name in aligned if name not in names)
+        for line, (poly, box) in enumerate(zip(polys, boxes)):
+            fields = {name: result[name][line] for name in aligned}
+            items.append(
+                {
+                    "tiles": {index},
+                    "poly": [[point[0] + x0, point[1] + y0] for point in poly],
+                    "box": [box[0] + x0, box[1] + y0, box[2] + x0, box[3] + y0],
+                    "fields": fields,
+                }
+            )
+
+    # 贪心合并：先保留面积大、置信度高的框；与其他切块中已保留框左右错开的同一行断开的两段拼接为一行，
+    # 与之重复的框丢弃。同一切块内的框由检测模型给出，不会重复，不参与比较
+    items.sort(
+        key=lambda item: (_box_area(item["box"]), item["fields"].get(score_field, 0.0)),
+        reverse=True,
+    )
+    kept: List[Dict[str, Any]] = []
+    duplicates = 0
+    joined = 0
+    for item in items:
+        for other in kept:
+            if item["tiles"] & other["tiles"]:
+                continue
+            if _fragments(item["box"], other["box"], collinear_threshold):
+                _join_fragments(other, item, text_field, score_field)
+                joined += 1
+                break
+            if _overlap_ratio(item["box"], other["box"]) >= dedup_threshold:
+                duplicates += 1
+                break
+        else:
+            kept.append(item)
+    kept.sort(key=lambda item: (item["box"][1], item["box"][0]))
+
+    merged = {name: [item["fields"].get(name) for item in kept] for name in names}
+    merged[poly_field] = [item["poly"] for item in kept]
+    if box_field is not None:
+        merged[box_field] = [item["box"] for item in kept]
+    return merged, duplicates, joined
+
+
+def merge_tile_results(
+    results: List[Dict[str, Any]],
+    tiles: List[Tile],
+    dedup_threshold: float = 0.6,
+    collinear_threshold: float = 0.6,
+) -> Dict[str, Any]:
+    """
+    合并各切块的识别结果
+
+    检测框与多边形按切块偏移换算回原图坐标；切块结果没有 rec_boxes 时由 rec_polys 计算外接框。
+    重叠区域中同一行文字会在相邻切块中各识别一次，两个框的交集占较小框的比例超过阈值时
+    只保留面积更大（通常是未被切断的完整行）的一个，面积相同时保留置信度更高的一个。
+
+    比重叠宽度更长的文字行被竖直切块边界切开时，没有任何切块包含完整的一行，
+    两个切块各自识别出左右两段：竖直方向重合、水平方向相交且左右错开的两段拼接为一行，
+    外接框取并集（多边形随之变为外接矩形），文字中两段在重叠区域重复识别的部分只保留一次。
+    切开位置附近的字可能被两侧都识别错，此时拼接结果会多字或错字；
+    需要精确结果时应把 OCR_TILE_OVERLAP 设为大于最长文字行的宽度，或不切块。
+    结果按从上到下、从左到右排序
+
+    参数:
+        results: 各切块的识别结果，与 tiles 一一对应
+        tiles: 切块区域
+        dedup_threshold: 判定为重复文字框的重叠比例
+        collinear_threshold: 判定为同一行两段时，两框竖直方向交集占较矮框高度的比例
+
+    返回:
+        与单图识别结果字段一致的合并结果，另含 tiles（切块数）。rec_*、dt_polys 等逐行字段按上述规则合并，
+        其余字段（如 model_settings、text_det_params）取自第一个切块的结果
+    """
+    merged: Dict[str, Any] = {}
+    line_fields = set()
+    duplicates = joined = 0
+    for group in _LINE_GROUPS:
+        fields, group_duplicates, group_joined = _merge_group(
+            results, tiles, group, dedup_threshold, collinear_threshold
+        )
+        if fields is None:
+            continue
+        merged.update(fields)
+        line_fields.update(fields)
+        if group[2] is not None:
+            duplicates, joined = group_duplicates, group_joined
+
+    result: Dict[str, Any] = {}
+    for tile_result in results:
+        for name, value in tile_result.items():
+            if name not in result and name not in line_fields:
+                result[name] = value
+    result.update(merged)
+    result["tiles"] = len(tiles)
+    logger.debug(f"切块结果合并完成，去重 {duplicates} 个重复文字框，拼接 {joined} 个断开的文字行")
+    return result
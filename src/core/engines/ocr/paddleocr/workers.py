@@ -0,0 +1,379 @@
+import itertools
+import logging
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import Future
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from typing import Any, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# 使用 spawn 启动子进程：父进程中的线程与已加载的推理库状态不会被 fork 复制
+_context = multiprocessing.get_context("spawn")
+
+# 工作进程初始化完成后发送的消息
+_READY = "ready"
+
+
+class WorkerCrashed(RuntimeError):
+    """工作进程在任务完成前退出"""
+
+
+class InferenceTimeout(TimeoutError):
+    """推理超过超时时间，执行该任务的工作进程已被结束并将重启"""
+
+
+def _elapsed_ms(started: float) -> float:
+    return round((time.perf_counter() - started) * 1000, 1)
+
+
+def _worker_main(conn, ocr_kwargs: Dict[str, Any], warmup_images: List[Any]) -> None:
+    """
+    工作进程入口：持有独立的 PaddleOCR 实例，逐个处理父进程发来的批量任务
+
+    模型加载后先逐张识别预热图片，首次推理的显存分配与算子初始化在就绪前完成，
+    就绪消息附带加载与各次预热的耗时
+    """
+    import paddleocr
+
+    started = time.perf_counter()
+    ocr = paddleocr.PaddleOCR(**ocr_kwargs)
+    timings: Dict[str, Any] = {"load_ms": _elapsed_ms(started), "warmup_ms": []}
+    for image in warmup_images:
+        started = time.perf_counter()
+        try:
+            ocr.predict([image])
+        except Exception as e:
+            # 预热失败不影响就绪，真实请求出错时由父进程按任务报告
+            timings["warmup_error"] = f"{type(e).__name__}: {e}"
+            break
+        timings["warmup_ms"].append(_elapsed_ms(started))
+    conn.send((_READY, timings, None))
+    while True:
+        try:
+            job_id, images = conn.recv()
+        except (EOFError, KeyboardInterrupt):
+            break
+        try:
+            results = [res.json['res'] for res in ocr.predict(images)]
+            conn.send((job_id, results, None))
+        except Exception as e:
+            conn.send((job_id, None, f"{type(e).__name__}: {e}"))
+
+
+class Worker:
+    """
+    单个工作进程及其管道
+
+    属性:
+        index: 工作进程编号
+        outstanding: 已派发但尚未完成的任务数
+        restarts: 崩溃后重启的次数
+        consecutive_crashes: 自上次成功完成任务以来的连续崩溃次数，决定重启退避时间
+        failed: 连续崩溃次数超过上限后不再重启
+        timings: 最近一次启动的模型加载与预热耗时（毫秒）
+    """
+
+    def __init__(self, index: int, ocr_kwargs: Dict[str, Any], warmup_images: List[Any]):
+        self.index = index
+        self.ocr_kwargs = ocr_kwargs
+        self.warmup_images = warmup_images
+        self.outstanding = 0
+        self.jobs = 0
+        self.restarts = 0
+        self.consecutive_crashes = 0
+        self.failed = False
+        self.timings: Optional[Dict[str, Any]] = None
+        self.ready = threading.Event()
+        self.pending: Dict[int, Future] = {}
+        self.process: Optional[multiprocessing.Process] = None
+        self.conn = None
+        self.send_lock = threading.Lock()
+
+    def spawn(self) -> None:
+        parent_conn, child_conn = _context.Pipe()
+        self.ready.clear()
+        self.conn = parent_conn
+        self.process = _context.Process(
+            target=_worker_main,
+            args=(child_conn, self.ocr_kwargs, self.warmup_images),
+            name=f"ocr-worker-{self.index}",
+            daemon=True,
+        )
+        self.process.start()
+        child_conn.close()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "index": self.index,
+            "pid": self.process.pid if self.process is not None else None,
+            "alive": self.process is not None and self.process.is_alive(),
+            "ready": self.ready.is_set(),
+            "outstanding": self.outstanding,
+            "jobs": self.jobs,
+            "restarts": self.restarts,
+            "consecutive_crashes": self.consecutive_crashes,
+            "failed": self.failed,
+            "timings": self.timings,
+        }
+
+
+class WorkerPool:
+    """
+    PaddleOCR 推理进程池
+
+    每个工作进程持有独立的 PaddleOCR 实例，任务派发给进行中任务最少的就绪进程；
+    进程崩溃时其未完成的任务以 WorkerCrashed 结束，并按指数退避自动重启该进程，
+    连续崩溃超过 max_restarts 次的进程不再重启，全部进程都停止重启后进程池不再健康。
+    推理超过 inference_timeout 时结束该进程（其上的其他任务同样以 WorkerCrashed 结束）并重启。
+    工作进程完成模型加载与预热后才接收任务，重启的进程同样先预热。
+    predict 是线程安全的阻塞调用，可同时从多个线程调用，并发度即进程数
+    """
+
+    def __init__(
+        self,
+        size: int = 1,
+        ocr_kwargs: Optional[Dict[str, Any]] = None,
+        restart_delay: float = 1.0,
+        warmup_images: Optional[List[Any]] = None,
+        max_restart_delay: float = 60.0,
+        max_restarts: Optional[int] = 5,
+        inference_timeout: Optional[float] = None,
+    ):
+        """
+        参数:
+            size: 工作进程数
+            ocr_kwargs: 传给 PaddleOCR 的参数
+            restart_delay: 进程首次崩溃后重启前的等待时间（秒），连续崩溃时逐次翻倍
+            warmup_images: 工作进程就绪前依次识别的预热图片数组，None 表示不预热
+            max_restart_delay: 重启等待时间的上限（秒）
+            max_restarts: 连续崩溃多少次后不再重启该进程，None 表示一直重启；
+                进程成功完成一个任务后连续崩溃次数清零
+            inference_timeout: 单次 predict 等待结果的超时时间（秒），None 表示一直等待
+        """
+        if size < 1:
+            raise ValueError("工作进程数至少为 1")
+        self.size = size
+        self.ocr_kwargs = ocr_kwargs or {}
+        self.restart_delay = restart_delay
+        self.max_restart_delay = max_restart_delay
+        self.max_restarts = max_restarts
+        self.inference_timeout = inference_timeout
+        self.timeouts = 0
+        self.warmup_images = list(warmup_images or [])
+        self.workers = [
+            Worker(index, self.ocr_kwargs, self.warmup_images) for index in range(size)
+        ]
+        self.crashes = 0
+        self._job_ids = itertools.count()
+        self._lock = threading.Lock()
+        self._available = threading.Condition(self._lock)
+        self._closed = False
+
+    def start(self) -> None:
+        """启动全部工作进程及其结果接收线程，不等待模型加载完成"""
+        for worker in self.workers:
+            worker.spawn()
+            threading.Thread(
+                target=self._receive_loop,
+                args=(worker,),
+                name=f"ocr-worker-{worker.index}-receiver",
+                daemon=True,
+            ).start()
+        logger.info(f"已启动 {self.size} 个 OCR 工作进程")
+
+    def ready_count(self) -> int:
+        """已完成模型加载的工作进程数"""
+        return sum(1 for worker in self.workers if worker.ready.is_set())
+
+    def healthy(self) -> bool:
+        """是否还有未因连续崩溃而停止重启的工作进程"""
+        return not all(worker.failed for worker in self.workers)
+
+    def _receive_loop(self, worker: Worker) -> None:
+        """接收单个工作进程的结果；管道断开时视为崩溃，结束其任务并重启进程"""
+        while not self._closed:
+            try:
+                job_id, results, error = worker.conn.recv()
+            except (EOFError, OSError):
+                if self._closed or not self._handle_crash(worker):
+                    return
+                continue
+
+            if job_id == _READY:
+                with self._available:
+                    worker.timings = results
+                    worker.ready.set()
+                    self._available.notify_all()
+                logger.info(
+                    f"OCR 工作进程 {worker.index} 就绪，pid: {worker.process.pid}，"
+                    f"模型加载 {results['load_ms']} ms，预热 {results['warmup_ms']} ms"
+                )
+                if "warmup_error" in results:
+                    logger.warning(
+                        f"OCR 工作进程 {worker.index} 预热失败: {results['warmup_error']}"
+                    )
+                continue
+
+            with self._available:
+                future = worker.pending.pop(job_id, None)
+                worker.outstanding -= 1
+                worker.jobs += 1
+                if error is None:
+                    worker.consecutive_crashes = 0
+                self._available.notify_all()
+            if future is None:
+                continue
+            if error is not None:
+                future.set_exception(RuntimeError(error))
+            else:
+                future.set_result(results)
+
+    def _handle_crash(self, worker: Worker) -> bool:
+        """
+        结束崩溃进程的未完成任务，按指数退避等待后重启
+
+        返回:
+            是否已重启；连续崩溃次数超过上限时不再重启，返回 False
+        """
+        worker.process.join(timeout=1)
+        exitcode = worker.process.exitcode
+        with self._available:
+            worker.ready.clear()
+            pending, worker.pending = worker.pending, {}
+            worker.outstanding = 0
+            worker.consecutive_crashes += 1
+            self.crashes += 1
+            if self.max_restarts is not None and worker.consecutive_crashes > self.max_restarts:
+                worker.failed = True
+            # 唤醒等待就绪进程的调用方，全部进程停止重启时它们不必继续等待
+            self._available.notify_all()
+        delay = min(
+            self.restart_delay * 2 ** (worker.consecutive_crashes - 1), self.max_restart_delay
+        )
+        for future in pending.values():
+            if not future.done():
+                future.set_exception(WorkerCrashed(f"OCR 工作进程 {worker.index} 异常退出"))
+        if worker.failed:
+            logger.error(
+                f"OCR 工作进程 {worker.index} 异常退出，退出码: {exitcode}，"
+                f"丢失 {len(pending)} 个任务，已连续崩溃 {worker.consecutive_crashes} 次，不再重启"
+            )
+            worker.conn.close()
+            return False
+        logger.error(
+            f"OCR 工作进程 {worker.index} 异常退出，退出码: {exitcode}，"
+            f"丢失 {len(pending)} 个任务，{delay} 秒后重启"
+        )
+        time.sleep(delay)
+        if self._closed:
+            return False
+        worker.conn.close()
+        worker.restarts += 1
+        worker.spawn()
+        return True
+
+    def _acquire(self, timeout: Optional[float]) -> Worker:
+        """选择进行中任务最少的就绪进程，都未就绪时等待"""
+        deadline = time.monotonic() + timeout if timeout is not None else None
+        with self._available:
+            while True:
+                if self._closed:
+                    raise RuntimeError("OCR 工作进程池已关闭")
+                if not self.healthy():
+                    raise WorkerCrashed("全部 OCR 工作进程连续崩溃，已停止重启")
+                ready = [worker for worker in self.workers if worker.ready.is_set()]
+                if ready:
+                    worker = min(ready, key=lambda w: w.outstanding)
+                    worker.outstanding += 1
+                    return worker
+                remaining = deadline - time.monotonic() if deadline is not None else None
+                if remaining is not None and remaining <= 0:
+                    raise TimeoutError("没有可用的 OCR 工作进程")
+                self._available.wait(remaining)
+
+    def predict(self, images: List[Any], timeout: Optional[float] = None) -> List[Any]:
+        """
+        在工作进程中识别一批图片，阻塞直到返回
+
+        参数:
+            images: 图片数组列表
+            timeout: 等待就绪进程的超时时间（秒），None 表示一直等待
+
+        返回:
+            与输入等长的识别结果列表
+
+        异常:
+            InferenceTimeout: 超过 inference_timeout 仍未返回，该工作进程已被结束
+            WorkerCrashed: 工作进程在任务完成前退出
+        """
+        worker = self._acquire(timeout)
+        job_id = next(self._job_ids)
+        future: Future = Future()
+        with self._available:
+            worker.pending[job_id] = future
+        try:
+            with worker.send_lock:
+                worker.conn.send((job_id, images))
+        except (OSError, ValueError) as e:
+            # 发送时进程已退出，接收线程会处理重启，这里只结束本任务
+            with self._available:
+                if worker.pending.pop(job_id, None) is not None:
+                    worker.outstanding -= 1
+            raise WorkerCrashed(f"OCR 工作进程 {worker.index} 不可用: {e}")
+        try:
+            return future.result(timeout=self.inference_timeout)
+        except FutureTimeoutError:
+            pass
+        with self._available:
+            # 任务仍未完成时该进程必然还是执行它的那个进程：崩溃处理会先清空 pending 再重启
+            stuck = job_id in worker.pending
+            if stuck:
+                self.timeouts += 1
+                # 不再向该进程派发新任务，接收线程随后按崩溃处理并重启
+                worker.ready.clear()
+                worker.process.kill()
+        if not stuck:
+            return future.result()
+        logger.error(
+            f"OCR 工作进程 {worker.index} 推理超过 {self.inference_timeout} 秒，已结束该进程并重启"
+        )
+        raise InferenceTimeout(f"OCR 推理超过 {self.inference_timeout} 秒")
+
+    def stats(self) -> Dict[str, Any]:
+        """返回进程池统计信息"""
+        return {
+            "size": self.size,
+            "ready": self.ready_count(),
+            "healthy": self.healthy(),
+            "crashes": self.crashes,
+            "timeouts": self.timeouts,
+            "workers": [worker.stats() for worker in self.workers],
+        }
+
+    def close(self) -> None:
+        """结束全部工作进程"""
+        with self._available:
+            self._closed = True
+            self._available.notify_all()
+        for worker in self.workers:
+            if worker.conn is not None:
+                worker.conn.close()
+        for worker in self.workers:
+            if worker.process is not None:
+                worker.process.join(timeout=5)
+                if worker.process.is_alive():
+                    worker.process.terminate()
+            for future in worker.pending.values():
+                if not future.done():
+                    future.set_exception(RuntimeError("OCR 工作进程池已关闭"))
+
+
+def default_pool_size() -> int:
+    """OCR_WORKERS 环境变量，auto 表示按 CPU 核数"""
+    value = os.getenv("OCR_WORKERS", "1")
+    if value == "auto":
+        return max(1, os.cpu_count() or 1)
+    return int(value)
@@ -0,0 +1,10 @@
+"""
+Local persistence layer for MyAgent.
+
+This package contains the SQLite-backed stores used to keep conversation
+state across restarts and between server workers.
+"""
+
+from .conversation_log import ConversationLog
+
+__all__ = ["ConversationLog"]
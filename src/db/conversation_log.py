@@ -0,0 +1,431 @@
+"""
+追加写对话日志
+
+基于 SQLite WAL 模式的本地持久化层：每次写入都是一条追加的事件记录，
+由后台线程批量提交（group commit），请求路径只负责入队，不等待磁盘同步。
+事件按 (session_id, seq) 建立索引，读取会话时按顺序回放；
+追加事件的版本号必须紧接会话最新事件的版本号，多个进程基于同一版本写入时只有先提交的生效；
+压缩任务定期把每个会话的多条事件折叠为一条快照，并清理已删除与过期的会话。
+
+多个进程（如 SERVER_WORKERS > 1）可以共享同一个数据库文件，
+其他进程尚未提交的写入在一个提交间隔内不可见
+"""
+
+import atexit
+import json
+import queue
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from src.core.base.logger import get_logger
+
+# 默认数据库文件位置: src/db/conversation_log.db
+DEFAULT_LOG_PATH = Path(__file__).parent / "conversation_log.db"
+
+EVENT_APPEND = "append"
+EVENT_DELETE = "delete"
+
+# 把一个会话的事件负载列表折叠为单个快照负载
+Compactor = Callable[[List[Dict[str, Any]]], Dict[str, Any]]
+# 事件提交后的回调，参数为 (会话 ID, 版本号, 是否已写入)
+CommitCallback = Callable[[str, int, bool], None]
+
+_STOP = object()
+
+
+class ConversationLog:
+    """
+    追加写的会话事件日志
+
+    属性:
+        db_path: 数据库文件路径
+        flush_interval: 批量提交的最长等待时间（秒）
+        batch_size: 单次提交的最大事件数
+        compact_interval: 自动压缩的间隔（秒），None 表示不自动压缩
+        ttl: 会话空闲过期时间（秒），压缩时清理，None 表示不过期
+    """
+
+    def __init__(
+        self,
+        db_path: Optional[str] = None,
+        compactor: Optional[Compactor] = None,
+        flush_interval: float = 0.05,
+        batch_size: int = 512,
+        compact_interval: Optional[float] = 600.0,
+        ttl: Optional[float] = None,
+        on_commit: Optional[CommitCallback] = None,
+    ) -> None:
+        """
+        初始化日志并启动后台提交线程
+
+        参数:
+            db_path: 数据库文件路径，默认 src/db/conversation_log.db
+            compactor: 压缩时把会话的事件负载折叠为快照的函数，为 None 时只清理已删除与过期的会话
+            flush_interval: 批量提交的最长等待时间（秒）
+            batch_size: 单次提交的最大事件数
+            compact_interval: 自动压缩的间隔（秒），None 表示不自动压缩
+            ttl: 会话空闲过期时间（秒），按最近一次写入计算，None 表示不过期
+            on_commit: 每条事件提交（或因版本冲突、写入失败被丢弃）后在后台线程中调用
+        """
+        self.db_path = Path(db_path) if db_path else DEFAULT_LOG_PATH
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self.compactor = compactor
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self.compact_interval = compact_interval
+        self.ttl = ttl
+        self.on_commit = on_commit
+        self.logger = get_logger(self.__class__.__name__)
+
+        self.batches = 0
+        self.events_written = 0
+        self.compactions = 0
+        self.write_errors = 0
+        self.conflicts = 0
+
+        self._queue: "queue.Queue[Any]" = queue.Queue()
+        self._read_lock = threading.Lock()
+        self._reader = self._connect()
+        self._init_schema(self._reader)
+
+        self._closed = False
+        self._writer = threading.Thread(
+            target=self._write_loop, name="conversation-log-writer", daemon=True
+        )
+        self._writer.start()
+        atexit.register(self.close)
+        self.logger.info(f"对话日志已就绪: {self.db_path}")
+
+    def _connect(self) -> sqlite3.Connection:
+        """打开 WAL 模式连接；synchronous=NORMAL 下提交只写 WAL，检查点时才同步到磁盘"""
+        conn = sqlite3.connect(
+            str(self.db_path), check_same_thread=False, timeout=30.0, isolation_level=None
+        )
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    @staticmethod
+    def _init_schema(conn: sqlite3.Connection) -> None:
+        conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS events (
+                seq INTEGER PRIMARY KEY AUTOINCREMENT,
+                session_id TEXT NOT NULL,
+                version INTEGER NOT NULL,
+                kind TEXT NOT NULL,
+                payload TEXT,
+                created_at REAL NOT NULL
+            )
+            """
+        )
+        conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_events_session ON events (session_id, seq)"
+        )
+
+    def append(
+        self,
+        session_id: str,
+        version: int,
+        payload: Dict[str, Any],
+        created_at: Optional[float] = None,
+    ) -> None:
+        """
+        追加一条会话事件，立即返回，由后台线程批量提交
+
+        version 必须比会话最新事件的版本号大一（删除后或新会话为 1），
+        否则提交时丢弃该事件并计入 conflicts；created_at 默认为入队时间
+        """
+        self._enqueue(session_id, version, EVENT_APPEND, payload, created_at)
+
+    def delete(self, session_id: str) -> None:
+        """追加一条删除事件，压缩时清除该会话的全部记录"""
+        self._enqueue(session_id, 0, EVENT_DELETE, None)
+
+    def _enqueue(
+        self,
+        session_id: str,
+        version: int,
+        kind: str,
+        payload: Optional[Dict[str, Any]],
+        created_at: Optional[float] = None,
+    ) -> None:
+        if self._closed:
+            raise RuntimeError("对话日志已关闭")
+        encoded = json.dumps(payload, ensure_ascii=False) if payload is not None else None
+        self._queue.put((session_id, version, kind, encoded, created_at or time.time()))
+
+    def flush(self, timeout: Optional[float] = None) -> None:
+        """阻塞直到此前入队的事件全部提交"""
+        done = threading.Event()
+        self._queue.put(done)
+        done.wait(timeout)
+
+    def _write_loop(self) -> None:
+        """后台提交线程：攒批写入，一个事务一次提交"""
+        conn = self._connect()
+        last_compaction = time.monotonic()
+        while True:
+            batch: List[Tuple[Any, ...]] = []
+            waiters: List[threading.Event] = []
+            stop = False
+            try:
+                item = self._queue.get(timeout=self.flush_interval)
+            except queue.Empty:
+                item = None
+
+            # 拿到第一条后，在 flush_interval 内继续收集，直到攒满一批
+            deadline = time.monotonic() + self.flush_interval
+            while item is not None:
+                if item is _STOP:
+                    stop = True
+                elif isinstance(item, threading.Event):
+                    waiters.append(item)
+                else:
+                    batch.append(item)
+                if stop or len(batch) >= self.batch_size:
+                    break
+                remaining = deadline - time.monotonic()
+                try:
+                    item = (
+                        self._queue.get(timeout=remaining)
+                        if remaining > 0
+                        else self._queue.get_nowait()
+                    )
+                except queue.Empty:
+                    item = None
+
+            if batch:
+                self._commit(conn, batch)
+            for waiter in waiters:
+                waiter.set()
+            if stop:
+                break
+
+            if (
+                self.compact_interval is not None
+                and time.monotonic() - last_compaction >= self.compact_interval
+            ):
+                last_compaction = time.monotonic()
+                try:
+                    self._compact(conn)
+                except Exception as e:
+                    self.logger.error(f"对话日志压缩失败: {e}")
+        conn.close()
+
+    def _commit(self, conn: sqlite3.Connection, batch: List[Tuple[Any, ...]]) -> None:
+        """
+        在一个事务中写入一批事件
+
+        追加事件只在版本号紧接会话最新事件时写入（删除事件的版本号为 0），
+        检查与写入在同一写事务中完成，其他进程无法在两者之间插入事件
+        """
+        written: List[bool] = []
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            for event in batch:
+                session_id, version, kind = event[:3]
+                if kind == EVENT_APPEND:
+                    cursor = conn.execute(
+                        "INSERT INTO events (session_id, version, kind, payload, created_at) "
+                        "SELECT ?, ?, ?, ?, ? WHERE COALESCE(("
+                        "SELECT version FROM events WHERE session_id = ? "
+                        "ORDER BY seq DESC LIMIT 1), 0) = ?",
+                        (*event, session_id, version - 1),
+                    )
+                    written.append(cursor.rowcount > 0)
+                else:
+                    conn.execute(
+                        "INSERT INTO events (session_id, version, kind, payload, created_at) "
+                        "VALUES (?, ?, ?, ?, ?)",
+                        event,
+                    )
+                    written.append(True)
+            conn.execute("COMMIT")
+            self.batches += 1
+            self.events_written += sum(written)
+        except Exception as e:
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+            written = [False] * len(batch)
+            self.write_errors += 1
+            self.logger.error(f"对话日志批量写入失败，丢弃 {len(batch)} 条事件: {e}")
+        else:
+            for event, ok in zip(batch, written):
+                if not ok:
+                    self.conflicts += 1
+                    self.logger.warning(
+                        f"会话 {event[0]} 的版本 {event[1]} 与已提交的事件冲突，已丢弃"
+                    )
+
+        if self.on_commit is not None:
+            for event, ok in zip(batch, written):
+                try:
+                    self.on_commit(event[0], event[1], ok)
+                except Exception as e:
+                    self.logger.error(f"对话日志提交回调失败: {e}")
+
+    def head(self, session_id: str) -> Optional[Tuple[int, str, float]]:
+        """
+        会话最新一条已提交事件，只走索引读取一行
+
+        返回:
+            (版本号, 事件类型, 写入时间)，会话不存在时返回 None
+        """
+        with self._read_lock:
+            return self._reader.execute(
+                "SELECT version, kind, created_at FROM events WHERE session_id = ? "
+                "ORDER BY seq DESC LIMIT 1",
+                (session_id,),
+            ).fetchone()
+
+    def read(self, session_id: str) -> Optional[Tuple[int, List[Dict[str, Any]]]]:
+        """
+        按顺序读取会话最近一次删除之后的全部事件负载
+
+        返回:
+            (最新版本号, 负载列表)，会话不存在或已删除时返回 None
+        """
+        with self._read_lock:
+            rows = self._reader.execute(
+                "SELECT version, kind, payload FROM events WHERE session_id = ? "
+                "ORDER BY seq",
+                (session_id,),
+            ).fetchall()
+
+        version: Optional[int] = None
+        payloads: List[Dict[str, Any]] = []
+        for row_version, kind, payload in rows:
+            if kind == EVENT_DELETE:
+                version, payloads = None, []
+                continue
+            version = row_version
+            payloads.append(json.loads(payload))
+        if version is None:
+            return None
+        return version, payloads
+
+    def compact(self) -> None:
+        """立即压缩：提交队列中的事件后折叠每个会话的事件"""
+        self.flush()
+        conn = self._connect()
+        try:
+            self._compact(conn)
+        finally:
+            conn.close()
+
+    def _compact(self, conn: sqlite3.Connection) -> None:
+        """
+        清理已删除与过期的会话，并把事件多于一条的会话折叠为一条快照
+
+        每个会话在独立的短事务中处理，只删除读取时已存在的事件（seq 不超过读取到的最大值），
+        压缩期间其他进程追加的事件不受影响
+        """
+        started = time.monotonic()
+        removed = 0
+        if self.ttl:
+            expired_before = time.time() - self.ttl
+            cursor = conn.execute(
+                "DELETE FROM events WHERE session_id IN ("
+                "SELECT session_id FROM events GROUP BY session_id "
+                "HAVING MAX(created_at) <= ?)",
+                (expired_before,),
+            )
+            removed += cursor.rowcount
+
+        sessions = conn.execute(
+            "SELECT session_id FROM events GROUP BY session_id HAVING COUNT(*) > 1 "
+            "OR MAX(kind = ?) = 1",
+            (EVENT_DELETE,),
+        ).fetchall()
+        folded = 0
+        for (session_id,) in sessions:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                removed += self._compact_session(conn, session_id)
+                folded += 1
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+
+        conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        self.compactions += 1
+        self.logger.info(
+            f"对话日志压缩完成，折叠 {folded} 个会话，净删除 {removed} 条事件，"
+            f"耗时 {time.monotonic() - started:.3f} 秒"
+        )
+
+    def _compact_session(self, conn: sqlite3.Connection, session_id: str) -> int:
+        """在当前事务中压缩单个会话，返回净删除的事件数"""
+        rows = conn.execute(
+            "SELECT seq, version, kind, payload, created_at FROM events "
+            "WHERE session_id = ? ORDER BY seq",
+            (session_id,),
+        ).fetchall()
+        if not rows:
+            return 0
+        last_delete = max(
+            (i for i, row in enumerate(rows) if row[2] == EVENT_DELETE), default=-1
+        )
+        live = rows[last_delete + 1:]
+
+        if live and self.compactor is None:
+            # 没有折叠函数时只清除最近一次删除之前的事件
+            upto = rows[last_delete][0] if last_delete >= 0 else None
+        else:
+            upto = rows[-1][0]
+        if upto is None:
+            return 0
+
+        cursor = conn.execute(
+            "DELETE FROM events WHERE session_id = ? AND seq <= ?", (session_id, upto)
+        )
+        removed = cursor.rowcount
+        if live and self.compactor is not None:
+            snapshot = self.compactor([json.loads(row[3]) for row in live])
+            conn.execute(
+                "INSERT INTO events (session_id, version, kind, payload, created_at) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (
+                    session_id,
+                    live[-1][1],
+                    EVENT_APPEND,
+                    json.dumps(snapshot, ensure_ascii=False),
+                    live[-1][4],
+                ),
+            )
+            removed -= 1
+        return removed
+
+    def stats(self) -> Dict[str, Any]:
+        """返回日志统计信息"""
+        with self._read_lock:
+            events, sessions = self._reader.execute(
+                "SELECT COUNT(*), COUNT(DISTINCT session_id) FROM events"
+            ).fetchone()
+        return {
+            "path": str(self.db_path),
+            "events": events,
+            "sessions": sessions,
+            "pending": self._queue.qsize(),
+            "batches": self.batches,
+            "events_written": self.events_written,
+            "avg_batch_size": self.events_written / self.batches if self.batches else 0.0,
+            "write_errors": self.write_errors,
+            "conflicts": self.conflicts,
+            "compactions": self.compactions,
+        }
+
+    def close(self) -> None:
+        """提交剩余事件并停止后台线程"""
+        if self._closed:
+            return
+        self._closed = True
+        self._queue.put(_STOP)
+        self._writer.join(timeout=10)
+        with self._read_lock:
+            self._reader.close()
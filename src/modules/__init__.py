@@ -0,0 +1,6 @@
+"""
+Feature modules for MyAgent project.
+
+This package contains higher-level modules built on top of the core engines,
+such as the tool-calling agent.
+"""
@@ -0,0 +1,17 @@
+"""
+Agent module for MyAgent project.
+
+This module contains the tool-calling agent loop and tool definitions.
+"""
+
+from .agent import Agent
+from .tools import Tool, ToolRegistry, load_mcp_tools, schema_from_signature, tool
+
+__all__ = [
+    "Agent",
+    "Tool",
+    "ToolRegistry",
+    "load_mcp_tools",
+    "schema_from_signature",
+    "tool",
+]
@@ -0,0 +1,228 @@
+"""
+工具调用 Agent
+
+在 LLM 之上实现“模型请求工具 → 执行工具 → 结果写回上下文”的循环。
+同一步中相互独立的工具调用并发执行，并分别受超时限制，
+因此每一步的耗时取决于最慢的工具，而不是所有工具耗时之和
+"""
+
+import asyncio
+import json
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+from src.core.base.logger import get_logger
+from src.core.engines.llm.base import LLM
+from src.core.engines.llm.history import MessageHistory
+from src.modules.agent.tools import Tool, ToolRegistry
+
+
+class Agent:
+    """
+    并行工具调用 Agent
+
+    属性:
+        llm: 底层 LLM 实例，对话上下文（含工具调用与结果）保存在其中
+        tools: 工具注册表
+        max_steps: 每轮最多请求模型的次数
+        tool_timeout: 工具调用的默认超时时间（秒）
+        system_prompt: 系统提示，仅首轮有效
+    """
+
+    def __init__(
+        self,
+        llm: LLM,
+        tools: ToolRegistry,
+        max_steps: int = 8,
+        tool_timeout: float = 30.0,
+        system_prompt: Optional[str] = None,
+    ) -> None:
+        """
+        初始化 Agent
+
+        参数:
+            llm: 底层 LLM 实例
+            tools: 可供模型调用的工具
+            max_steps: 每轮最多请求模型的次数，用完后结束本轮
+            tool_timeout: 工具未单独设置超时时使用的超时时间（秒）
+            system_prompt: 系统提示，仅首轮有效
+        """
+        if max_steps < 1:
+            raise ValueError("max_steps 至少为 1")
+        self.llm = llm
+        self.tools = tools
+        self.max_steps = max_steps
+        self.tool_timeout = tool_timeout
+        self.system_prompt = system_prompt
+        self.logger = get_logger(self.__class__.__name__)
+
+    async def _run_tool(self, call: Dict[str, Any]) -> Dict[str, Any]:
+        """执行单个工具调用，错误与超时作为结果返回给模型，不中断本轮"""
+        started = time.perf_counter()
+        name = call["function"]["name"]
+        record: Dict[str, Any] = {"id": call["id"], "name": name}
+        registered: Optional[Tool] = self.tools.get(name)
+        timeout = (
+            registered.timeout
+            if registered is not None and registered.timeout is not None
+            else self.tool_timeout
+        )
+
+        try:
+            if registered is None:
+                raise LookupError(f"未知工具: {name}")
+            arguments = json.loads(call["function"]["arguments"] or "{}")
+            record["arguments"] = arguments
+            record["content"] = await asyncio.wait_for(
+                registered.acall(arguments), timeout=timeout
+            )
+        except asyncio.TimeoutError:
+            record["error"] = f"工具调用超时（{timeout} 秒）"
+        except Exception as e:
+            record["error"] = f"{type(e).__name__}: {e}"
+
+        record["elapsed"] = round(time.perf_counter() - started, 3)
+        if "error" in record:
+            self.logger.warning(f"工具 {name} 调用失败: {record['error']}")
+            record["content"] = f"错误: {record['error']}"
+        return record
+
+    async def _run_tools(
+        self, index: int, calls: List[Dict[str, Any]], step: Dict[str, Any]
+    ) -> None:
+        """并发执行同一步中相互独立的工具调用，并按调用顺序写回上下文"""
+        started = time.perf_counter()
+        results = await asyncio.gather(*(self._run_tool(call) for call in calls))
+        for result in results:
+            self.llm.add_tool_result(result["id"], result["content"])
+            step["tool_calls"].append({k: v for k, v in result.items() if k != "content"})
+        step["tools_elapsed"] = round(time.perf_counter() - started, 3)
+        self.logger.info(
+            f"第 {index + 1} 步并发执行 {len(calls)} 个工具调用，"
+            f"耗时 {step['tools_elapsed']} 秒"
+        )
+
+    @staticmethod
+    def _new_step(index: int, started: float) -> Dict[str, Any]:
+        return {
+            "step": index + 1,
+            "llm_elapsed": round(time.perf_counter() - started, 3),
+            "tool_calls": [],
+        }
+
+    def _result(
+        self,
+        reply: Dict[str, Any],
+        steps: List[Dict[str, Any]],
+        started: float,
+    ) -> Dict[str, Any]:
+        """构造本轮结果；最后一步仍在请求工具时视为步数用完"""
+        stop_reason = "completed" if not reply.get("tool_calls") else "max_steps"
+        if stop_reason == "max_steps":
+            self.logger.warning(f"已达到最大步数 {self.max_steps}，结束本轮")
+        return {
+            "response": reply.get("content", ""),
+            "stop_reason": stop_reason,
+            "steps": steps,
+            "elapsed": round(time.perf_counter() - started, 3),
+        }
+
+    def _checkpoint(self) -> Tuple[MessageHistory, bool]:
+        """记录本轮开始前的上下文（O(1) 快照，只复制分支头指针）"""
+        return self.llm.history.snapshot(), self.llm.history_rewritten
+
+    def _rollback(self, checkpoint: Tuple[MessageHistory, bool], error: Exception) -> None:
+        """
+        本轮失败时恢复本轮开始前的上下文
+
+        恢复快照而不是按节点 ID 回退：本轮中的滚动摘要会用 reset 替换早期节点，
+        按 ID 回退可能找不到节点而掩盖原始错误
+        """
+        self.logger.error(f"Agent 运行出错，回退本轮上下文: {error}")
+        self.llm.history, self.llm.history_rewritten = checkpoint
+
+    async def arun(self, user_input: str, temperature: float = 0.7) -> Dict[str, Any]:
+        """
+        运行一轮对话：反复请求模型并执行其请求的工具，直到模型给出最终回复或步数用完
+
+        参数:
+            user_input: 用户本轮输入
+            temperature: 生成温度参数
+
+        返回:
+            包含 response（最终回复）、stop_reason（completed 或 max_steps）、
+            steps（每步的模型耗时与各工具的参数、耗时、错误）与 elapsed（总耗时）的字典
+        """
+        started = time.perf_counter()
+        checkpoint = self._checkpoint()
+        schemas = self.tools.schemas()
+        steps: List[Dict[str, Any]] = []
+        pending_input: Optional[str] = user_input
+
+        try:
+            for index in range(self.max_steps):
+                step_started = time.perf_counter()
+                reply = await self.llm.achat_step(
+                    pending_input,
+                    schemas,
+                    system_prompt=self.system_prompt,
+                    temperature=temperature,
+                )
+                pending_input = None
+                step = self._new_step(index, step_started)
+                steps.append(step)
+                if reply.get("tool_calls"):
+                    await self._run_tools(index, reply["tool_calls"], step)
+                step["elapsed"] = round(time.perf_counter() - step_started, 3)
+                if not reply.get("tool_calls"):
+                    break
+        except Exception as e:
+            self._rollback(checkpoint, e)
+            raise
+
+        return self._result(reply, steps, started)
+
+    def run(self, user_input: str, temperature: float = 0.7) -> Dict[str, Any]:
+        """
+        arun 的同步版本：模型请求使用同步客户端，每步的工具调用在本轮私有的事件循环中并发执行，
+        不能在运行中的事件循环内调用
+
+        私有事件循环关闭时不等待线程池：超时的工具线程在后台继续运行至结束，不阻塞本轮返回
+        （asyncio.run 退出时会等待默认线程池中的全部线程，使工具超时失效）
+
+        参数与返回值同 arun
+        """
+        started = time.perf_counter()
+        checkpoint = self._checkpoint()
+        schemas = self.tools.schemas()
+        steps: List[Dict[str, Any]] = []
+        pending_input: Optional[str] = user_input
+        loop = asyncio.new_event_loop()
+
+        try:
+            for index in range(self.max_steps):
+                step_started = time.perf_counter()
+                reply = self.llm.chat_step(
+                    pending_input,
+                    schemas,
+                    system_prompt=self.system_prompt,
+                    temperature=temperature,
+                )
+                pending_input = None
+                step = self._new_step(index, step_started)
+                steps.append(step)
+                if reply.get("tool_calls"):
+                    loop.run_until_complete(
+                        self._run_tools(index, reply["tool_calls"], step)
+                    )
+                step["elapsed"] = round(time.perf_counter() - step_started, 3)
+                if not reply.get("tool_calls"):
+                    break
+        except Exception as e:
+            self._rollback(checkpoint, e)
+            raise
+        finally:
+            # close 以 wait=False 关闭默认线程池
+            loop.close()
+
+        return self._result(reply, steps, started)
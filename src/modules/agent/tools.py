@@ -0,0 +1,215 @@
+"""
+Agent 工具定义
+
+将普通函数或协程函数包装为可供模型调用的工具，自动根据函数签名生成
+OpenAI 格式的 JSON Schema，并支持从 FastMCP 客户端加载远程工具
+"""
+
+import asyncio
+import inspect
+import json
+import typing
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Union
+
+# Python 类型到 JSON Schema 类型的映射
+_JSON_TYPES = {
+    str: "string",
+    int: "integer",
+    float: "number",
+    bool: "boolean",
+    list: "array",
+    dict: "object",
+}
+
+
+def _json_type(annotation: Any) -> Dict[str, Any]:
+    """将类型注解转换为 JSON Schema 片段，无法识别的类型不限制"""
+    origin = typing.get_origin(annotation)
+    if origin is Union:
+        args = [a for a in typing.get_args(annotation) if a is not type(None)]
+        return _json_type(args[0]) if len(args) == 1 else {}
+    if origin in (list, List):
+        args = typing.get_args(annotation)
+        schema: Dict[str, Any] = {"type": "array"}
+        if args:
+            schema["items"] = _json_type(args[0])
+        return schema
+    if origin in (dict, Dict):
+        return {"type": "object"}
+    if annotation in _JSON_TYPES:
+        return {"type": _JSON_TYPES[annotation]}
+    return {}
+
+
+def schema_from_signature(fn: Callable[..., Any]) -> Dict[str, Any]:
+    """
+    根据函数签名生成参数的 JSON Schema
+
+    没有默认值的参数为必填参数；*args 与 **kwargs 会被忽略
+    """
+    hints = typing.get_type_hints(fn)
+    properties: Dict[str, Any] = {}
+    required: List[str] = []
+    for name, parameter in inspect.signature(fn).parameters.items():
+        if parameter.kind in (parameter.VAR_POSITIONAL, parameter.VAR_KEYWORD):
+            continue
+        properties[name] = _json_type(hints.get(name, Any))
+        if parameter.default is parameter.empty:
+            required.append(name)
+    return {"type": "object", "properties": properties, "required": required}
+
+
+class Tool:
+    """
+    可供模型调用的工具
+
+    属性:
+        name: 工具名称
+        description: 工具描述，模型据此决定何时调用
+        parameters: 参数的 JSON Schema
+        timeout: 单次调用超时时间（秒），为 None 时使用 Agent 的默认超时
+    """
+
+    def __init__(
+        self,
+        fn: Callable[..., Any],
+        name: Optional[str] = None,
+        description: Optional[str] = None,
+        parameters: Optional[Dict[str, Any]] = None,
+        timeout: Optional[float] = None,
+    ) -> None:
+        """
+        初始化工具
+
+        参数:
+            fn: 工具函数，可以是普通函数或协程函数；普通函数在线程池中执行
+            name: 工具名称，默认使用函数名
+            description: 工具描述，默认使用文档字符串的第一段
+            parameters: 参数的 JSON Schema，默认根据函数签名生成
+            timeout: 单次调用超时时间（秒）
+        """
+        self.fn = fn
+        self.name = name or fn.__name__
+        self.description = description or (inspect.getdoc(fn) or "").split("\n\n")[0]
+        self.parameters = parameters or schema_from_signature(fn)
+        self.timeout = timeout
+
+    def schema(self) -> Dict[str, Any]:
+        """返回 OpenAI 格式的工具定义"""
+        return {
+            "type": "function",
+            "function": {
+                "name": self.name,
+                "description": self.description,
+                "parameters": self.parameters,
+            },
+        }
+
+    async def acall(self, arguments: Dict[str, Any]) -> str:
+        """
+        执行工具并返回字符串结果
+
+        超时后调用方不再等待；普通函数所在的线程无法被中断，会在后台继续运行至结束
+        """
+        if inspect.iscoroutinefunction(self.fn):
+            result = await self.fn(**arguments)
+        else:
+            result = await asyncio.to_thread(self.fn, **arguments)
+        if inspect.isawaitable(result):
+            result = await result
+        if isinstance(result, str):
+            return result
+        return json.dumps(result, ensure_ascii=False, default=str)
+
+
+def tool(
+    name: Optional[str] = None,
+    description: Optional[str] = None,
+    timeout: Optional[float] = None,
+) -> Callable[[Callable[..., Any]], Tool]:
+    """
+    将函数声明为工具的装饰器
+
+    示例:
+        @tool(description="查询城市天气", timeout=10)
+        def get_weather(city: str) -> str:
+            ...
+    """
+
+    def decorator(fn: Callable[..., Any]) -> Tool:
+        return Tool(fn, name=name, description=description, timeout=timeout)
+
+    return decorator
+
+
+class ToolRegistry:
+    """
+    工具注册表
+
+    属性:
+        tools: 工具名称到工具的映射
+    """
+
+    def __init__(self, tools: Optional[List[Union[Tool, Callable[..., Any]]]] = None) -> None:
+        self.tools: Dict[str, Tool] = {}
+        for item in tools or []:
+            self.register(item)
+
+    def register(self, item: Union[Tool, Callable[..., Any]]) -> Tool:
+        """注册工具，传入普通函数时自动包装为 Tool"""
+        registered = item if isinstance(item, Tool) else Tool(item)
+        if registered.name in self.tools:
+            raise ValueError(f"工具名称重复: {registered.name}")
+        self.tools[registered.name] = registered
+        return registered
+
+    def get(self, name: str) -> Optional[Tool]:
+        """按名称获取工具"""
+        return self.tools.get(name)
+
+    def schemas(self) -> List[Dict[str, Any]]:
+        """返回所有工具的 OpenAI 格式定义"""
+        return [registered.schema() for registered in self.tools.values()]
+
+    def __contains__(self, name: str) -> bool:
+        return name in self.tools
+
+    def __len__(self) -> int:
+        return len(self.tools)
+
+
+async def load_mcp_tools(client: Any, timeout: Optional[float] = None) -> List[Tool]:
+    """
+    从已连接的 FastMCP 客户端加载工具
+
+    参数:
+        client: 已进入上下文（async with）的 fastmcp.Client
+        timeout: 这些工具的单次调用超时时间（秒）
+
+    返回:
+        包装后的工具列表，调用时通过该客户端转发到 MCP 服务器
+    """
+
+    def make_call(tool_name: str) -> Callable[..., Awaitable[Any]]:
+        async def call(**arguments: Any) -> Any:
+            result = await client.call_tool(tool_name, arguments)
+            data = getattr(result, "data", None)
+            if data is not None:
+                return data
+            content = getattr(result, "content", result)
+            if not isinstance(content, list):
+                return content
+            return "\n".join(getattr(block, "text", str(block)) for block in content)
+
+        return call
+
+    return [
+        Tool(
+            make_call(mcp_tool.name),
+            name=mcp_tool.name,
+            description=mcp_tool.description or "",
+            parameters=mcp_tool.inputSchema,
+            timeout=timeout,
+        )
+        for mcp_tool in await client.list_tools()
+    ]
@@ -4,6 +4,7 @@ MyAgent 主服务器
 提供 OCR 和 LLM 功能的统一 API 服务
 """
 
+import asyncio
 import os
 from contextlib import asynccontextmanager
 from typing import Dict, Any
@@ -25,18 +26,33 @@ async def lifespan(app: FastAPI):
     # 启动时的初始化
     logger.info("正在启动 MyAgent 服务器...")
 
-    # 初始化 OCR 引擎
+    # 初始化 OCR 引擎：创建连接池并在后台预热，预热完成前 /ready 返回 503
+    from src.server.routes.ocr import get_ocr_engine, ocr_readiness, warmup_ocr_engine
+
+    ocr_warmup_task = None
     try:
         logger.info("正在初始化 OCR 引擎...")
-        # OCR 引擎将在第一次请求时延迟初始化
-        logger.info("OCR 引擎初始化成功")
+        get_ocr_engine()
+        if os.getenv("OCR_WARMUP", "true").lower() == "true":
+            ocr_warmup_task = asyncio.create_task(
+                warmup_ocr_engine(
+                    runs=int(os.getenv("OCR_WARMUP_RUNS", "2")),
+                    retry_interval=float(os.getenv("OCR_WARMUP_RETRY_INTERVAL", "5")),
+                    image_path=os.getenv("OCR_WARMUP_IMAGE") or None,
+                    max_retry_interval=float(os.getenv("OCR_WARMUP_MAX_RETRY_INTERVAL", "60")),
+                )
+            )
+            logger.info("OCR 引擎初始化成功，正在后台预热")
+        else:
+            ocr_readiness["ready"] = True
+            logger.info("OCR 引擎初始化成功，已跳过预热")
     except Exception as e:
         logger.error(f"OCR 引擎初始化失败: {e}")
 
     # 初始化 LLM 引擎
     try:
         logger.info("正在初始化 LLM 服务...")
-        # LLM 引擎将在每次请求时使用前端传递的配置动态创建
+        # LLM 引擎将在每次请求时使用前端传递的配置动态创建，底层客户端从进程级客户端池复用
         logger.info("LLM 服务初始化成功 - 将使用前端传递的 API 配置")
     except Exception as e:
         logger.error(f"LLM 服务初始化失败: {e}")
@@ -48,6 +64,25 @@ async def lifespan(app: FastAPI):
     # 关闭时的清理
     logger.info("正在关闭 MyAgent 服务器...")
 
+    if ocr_warmup_task is not None and not ocr_warmup_task.done():
+        ocr_warmup_task.cancel()
+        await asyncio.gather(ocr_warmup_task, return_exceptions=True)
+
+    from src.core.engines.llm.client_pool import get_client_pool
+
+    await get_client_pool().aclose()
+    logger.info("LLM 客户端池已关闭")
+
+    from src.core.engines.llm.session import close_session_store
+
+    close_session_store()
+    logger.info("会话存储已关闭")
+
+    from src.server.routes.ocr import close_ocr_engine
+
+    await close_ocr_engine()
+    logger.info("OCR 客户端连接池已关闭")
+
 
 # 创建 FastAPI 应用
 app = FastAPI(
@@ -84,12 +119,37 @@ async def root() -> Dict[str, Any]:
         },
         "docs": "/docs",
         "health": "/health",
+        "ready": "/ready",
     }
 
 
+@app.get("/ready")
+async def readiness_check() -> JSONResponse:
+    """
+    整体就绪检查
+
+    与 /health（存活检查）分开：OCR 预热完成且 PaddleOCR 服务当前就绪时返回 200，否则返回 503，
+    下游就绪状态缓存数秒；响应中包含预热次数、各次识别耗时、最近一次失败原因与下游就绪详情
+    """
+    from src.server.routes.ocr import get_ocr_readiness
+
+    readiness = await get_ocr_readiness()
+    ready = readiness["ready"]
+    if ready:
+        status = "ready"
+    elif not readiness["warmed_up"]:
+        status = "starting"
+    else:
+        status = "unavailable"
+    return JSONResponse(
+        status_code=200 if ready else 503,
+        content={"status": status, "services": {"ocr": readiness}},
+    )
+
+
 @app.get("/health")
 async def health_check() -> Dict[str, Any]:
-    """整体健康检查"""
+    """整体存活检查，不请求下游服务，就绪状态见 /ready"""
     health_status = {"status": "healthy", "services": {}}
 
     # 检查 OCR 服务
@@ -126,6 +186,7 @@ async def not_found_handler(request, exc):
             "available_endpoints": [
                 "/docs - API 文档",
                 "/health - 健康检查",
+                "/ready - 就绪检查",
                 "/ocr/* - OCR 相关接口",
                 "/llm/* - LLM 相关接口",
             ],
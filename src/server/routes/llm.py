@@ -4,15 +4,30 @@ LLM 路由接口
 提供大语言模型对话的 REST API 接口
 """
 
+import asyncio
+import json
 import os
+import weakref
 from datetime import datetime
-from typing import Any, Dict, List, Optional
+from typing import Any, AsyncIterator, Callable, Dict, List, Literal, Optional
 
-from fastapi import APIRouter, HTTPException, Query
-from pydantic import BaseModel
+from fastapi import APIRouter, Header, HTTPException, Query, Response
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel, Field
 
 from src.core.base.logger import get_logger
+from src.core.engines.llm.balancer import endpoint_pool_stats, get_endpoint_pool
 from src.core.engines.llm.base import LLM
+from src.core.engines.llm.cache import get_response_cache
+from src.core.engines.llm.client_pool import get_client_pool, key_fingerprint
+from src.core.engines.llm.context_window import ContextWindow
+from src.core.engines.llm.ratelimit import UpstreamBusy, limiter_stats
+from src.core.engines.llm.session import (
+    SessionConflict,
+    SessionRecord,
+    get_session_store,
+)
+from src.core.engines.llm.singleflight import get_singleflight
 
 logger = get_logger(__name__)
 
@@ -26,6 +41,11 @@ class LLMConfig(BaseModel):
     model: str 
     api_key: str
     base_url: Optional[str] = None
+    base_urls: Optional[List[str]] = None  # 多个同模型端点，设置后在其间负载均衡
+    routing_policy: Literal["least_latency", "least_outstanding"] = "least_latency"
+    hedge: bool = False  # 首个请求超过观测 p95 延迟时向另一端点发起对冲请求
+    max_context_tokens: Optional[int] = None  # 上下文 token 预算，为空时发送完整上下文
+    context_policy: Literal["drop_oldest", "pin_system", "summarize"] = "pin_system"
 
 
 class ChatRequest(BaseModel):
@@ -36,6 +56,27 @@ class ChatRequest(BaseModel):
     system_prompt: Optional[str] = None
     keep_context: bool = True
     temperature: float = 0.7
+    session_id: Optional[str] = None  # 服务端会话 ID，为空时创建新会话
+    delta: bool = False  # 增量模式：仅返回本轮新增的消息
+    context_version: Optional[int] = None  # 客户端持有的上下文版本，增量模式下用于校验
+    use_cache: bool = True  # temperature=0 时是否使用响应缓存
+
+
+class BatchChatItem(BaseModel):
+    """批量聊天中的单个独立请求"""
+
+    message: str
+    system_prompt: Optional[str] = None
+    temperature: float = 0.7
+    use_cache: bool = True
+
+
+class BatchChatRequest(BaseModel):
+    """批量聊天请求模型"""
+
+    config: LLMConfig
+    items: List[BatchChatItem]
+    concurrency: int = Field(default=8, ge=1, le=64)  # 同时发往上游的最大请求数
 
 
 class ContextRequest(BaseModel):
@@ -43,14 +84,18 @@ class ContextRequest(BaseModel):
 
     config: LLMConfig
     context: Optional[List[Dict[str, str]]] = None
+    session_id: Optional[str] = None
 
 
 class ChatResponse(BaseModel):
     """聊天响应模型"""
 
     response: str
-    context: List[Dict[str, str]]
+    context: Optional[List[Dict[str, str]]] = None  # 完整上下文（非增量模式或版本不一致时）
+    delta: Optional[List[Dict[str, str]]] = None  # 本轮新增的消息（增量模式）
+    context_version: int = 0
     model_info: Dict[str, Any]
+    session_id: str
 
 
 class ContextMessage(BaseModel):
@@ -65,15 +110,152 @@ class ContextResponse(BaseModel):
 
     context: List[Dict[str, str]]
     count: int
+    session_id: Optional[str] = None
+    context_version: int = 0
+
+
+class ForkRequest(BaseModel):
+    """分叉请求模型"""
+
+    config: LLMConfig
+    session_id: str
+    branch: str  # 新分支名
+    at: Optional[str] = None  # 分叉位置的消息节点 ID，为空时从当前分支头分叉
+
+
+class CheckoutRequest(BaseModel):
+    """切换分支请求模型"""
+
+    config: LLMConfig
+    session_id: str
+    branch: str
+
 
+class UndoRequest(BaseModel):
+    """回退请求模型"""
 
-@llm_router.post("/chat", response_model=ChatResponse)
-async def chat(request: ChatRequest) -> ChatResponse:
+    config: LLMConfig
+    session_id: str
+    to: Optional[str] = None  # 回退到的消息节点 ID（保留该节点），为空时清空当前分支
+
+
+class BranchResponse(BaseModel):
+    """分支操作响应模型"""
+
+    nodes: List[Dict[str, str]]  # 当前分支的消息，每条带节点 ID
+    branches: List[Dict[str, Any]]
+    branch: str
+    session_id: str
+    context_version: int = 0
+
+
+def _create_llm(config: LLMConfig) -> LLM:
+    """使用前端传入的配置创建 LLM 实例"""
+    context_window = None
+    if config.max_context_tokens:
+        context_window = ContextWindow(
+            max_tokens=config.max_context_tokens, policy=config.context_policy
+        )
+    endpoints = None
+    if config.base_urls:
+        endpoints = get_endpoint_pool(
+            config.base_urls, policy=config.routing_policy, hedge=config.hedge
+        )
+    return LLM(
+        model=config.model,
+        api_key=config.api_key,
+        base_url=config.base_url,
+        context_window=context_window,
+        endpoints=endpoints,
+    )
+
+
+# 同一会话的请求串行执行，避免并发对话互相覆盖上下文
+_session_locks: "weakref.WeakValueDictionary[str, asyncio.Lock]" = (
+    weakref.WeakValueDictionary()
+)
+
+
+def _session_key(api_key: str, session_id: str) -> str:
+    """会话存储键，按 API 密钥隔离，持有会话 ID 也无法读取其他密钥的会话"""
+    # 16 位哈希与已保存的会话键保持一致
+    return f"{key_fingerprint(api_key, length=16)}:{session_id}"
+
+
+def _session_lock(key: str) -> asyncio.Lock:
+    """获取会话对应的锁"""
+    lock = _session_locks.get(key)
+    if lock is None:
+        lock = asyncio.Lock()
+        _session_locks[key] = lock
+    return lock
+
+
+async def _load_session(llm_instance: LLM, key: str) -> SessionRecord:
+    """从会话存储加载上下文到 LLM 实例，存储读取不阻塞事件循环"""
+    record = await get_session_store().aload(key)
+    if record.history is not None:
+        # 只复制分支头指针，本次请求失败时不会影响已保存的历史
+        llm_instance.history = record.history.snapshot()
+    elif record.messages:
+        llm_instance.set_context(record.messages)
+    return record
+
+
+async def _save_session(
+    llm_instance: LLM, key: str, record: SessionRecord
+) -> SessionRecord:
+    """将 LLM 实例的上下文写回会话存储，存储写入不阻塞事件循环"""
+    return await get_session_store().asave(
+        key, llm_instance.messages, record.version, history=llm_instance.history
+    )
+
+
+def _etag(session_id: str, version: int) -> str:
+    """上下文版本对应的 ETag"""
+    return f'"{session_id}-{version}"'
+
+
+def _context_payload(
+    request: ChatRequest,
+    llm_instance: LLM,
+    previous: SessionRecord,
+    saved: SessionRecord,
+) -> Dict[str, Any]:
+    """
+    构造响应中的上下文部分
+
+    增量模式下且客户端持有的版本与本轮开始前的版本一致时，只返回本轮新增的消息；
+    否则（包括早期轮次被压缩为摘要时）返回完整上下文供客户端重新同步
+    """
+    if (
+        request.delta
+        and request.context_version == previous.version
+        and not llm_instance.history_rewritten
+    ):
+        return {
+            "delta": llm_instance.messages[len(previous.messages):],
+            "context_version": saved.version,
+        }
+    if request.delta:
+        logger.info(
+            f"上下文版本不一致（客户端: {request.context_version}，"
+            f"服务端: {previous.version}），返回完整上下文"
+        )
+    return {"context": llm_instance.get_context(), "context_version": saved.version}
+
+
+@llm_router.post("/chat", response_model=ChatResponse, response_model_exclude_none=True)
+async def chat(request: ChatRequest, response: Response) -> ChatResponse:
     """
     与 LLM 进行对话
 
+    增量模式（delta=True）下，若 context_version 与服务端一致，仅返回本轮新增的消息，
+    否则返回完整上下文；响应头 ETag 携带新的上下文版本
+
     Args:
         request: 聊天请求，包含消息内容和 LLM 配置
+        response: 用于设置 ETag 响应头
 
     Returns:
         ChatResponse: 包含 LLM 响应和上下文的响应对象
@@ -81,24 +263,31 @@ async def chat(request: ChatRequest) -> ChatResponse:
     Raises:
         HTTPException: 当 LLM 引擎初始化失败或处理失败时
     """
+    session_id = request.session_id or get_session_store().new_session_id()
+    key = _session_key(request.config.api_key, session_id)
+
     try:
         # 使用前端传入的配置创建 LLM 实例
-        llm_instance = LLM(
-            model=request.config.model,
-            api_key=request.config.api_key,
-            base_url=request.config.base_url,
-        )
+        llm_instance = _create_llm(request.config)
 
-        # 发送消息并获取响应
-        response = llm_instance.chat(
-            user_input=request.message,
-            system_prompt=request.system_prompt,
-            keep_context=request.keep_context,
-            temperature=request.temperature,
-        )
+        async with _session_lock(key):
+            # 从服务端会话恢复上下文，客户端每轮只需发送本轮输入
+            record = await _load_session(llm_instance, key)
 
-        # 获取当前上下文
-        context = llm_instance.get_context()
+            # 发送消息并获取响应（异步调用，不阻塞事件循环）
+            reply = await llm_instance.achat(
+                user_input=request.message,
+                system_prompt=request.system_prompt,
+                keep_context=request.keep_context,
+                temperature=request.temperature,
+                use_cache=request.use_cache,
+            )
+
+            saved = await _save_session(llm_instance, key, record)
+
+        # 获取上下文（完整或增量）
+        context_payload = _context_payload(request, llm_instance, record, saved)
+        response.headers["ETag"] = _etag(session_id, saved.version)
 
         # 获取模型信息
         model_info = {
@@ -107,29 +296,167 @@ async def chat(request: ChatRequest) -> ChatResponse:
             "temperature": request.temperature,
         }
 
-        return ChatResponse(response=response, context=context, model_info=model_info)
+        return ChatResponse(
+            response=reply,
+            model_info=model_info,
+            session_id=session_id,
+            **context_payload,
+        )
 
+    except UpstreamBusy as e:
+        logger.warning(f"聊天请求排队超时: {str(e)}")
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "1"})
+    except SessionConflict as e:
+        logger.warning(f"会话保存冲突: {str(e)}")
+        raise HTTPException(status_code=409, detail=str(e))
     except Exception as e:
         logger.error(f"聊天处理失败: {str(e)}")
         raise HTTPException(status_code=500, detail=f"聊天处理失败: {str(e)}")
 
 
+def _sse_event(data: Dict[str, Any], event: Optional[str] = None) -> str:
+    """编码一条 server-sent events 消息"""
+    payload = json.dumps(data, ensure_ascii=False)
+    if event:
+        return f"event: {event}\ndata: {payload}\n\n"
+    return f"data: {payload}\n\n"
+
+
+@llm_router.post("/chat/stream")
+async def chat_stream(request: ChatRequest) -> StreamingResponse:
+    """
+    以 SSE（server-sent events）流式返回 LLM 回复
+
+    每个增量片段以 `data: {"delta": "..."}` 推送；生成结束后推送
+    `event: done`，携带完整回复、上下文（或增量模式下的新增消息）和模型信息；
+    出错时推送 `event: error`
+
+    Args:
+        request: 聊天请求，与 /llm/chat 相同
+
+    Returns:
+        StreamingResponse: text/event-stream 响应
+
+    Raises:
+        HTTPException: 当 LLM 引擎初始化失败时
+    """
+    try:
+        llm_instance = _create_llm(request.config)
+    except Exception as e:
+        logger.error(f"流式聊天初始化失败: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"流式聊天初始化失败: {str(e)}")
+
+    session_id = request.session_id or get_session_store().new_session_id()
+    key = _session_key(request.config.api_key, session_id)
+
+    async def event_stream() -> AsyncIterator[str]:
+        parts: List[str] = []
+        try:
+            async with _session_lock(key):
+                record = await _load_session(llm_instance, key)
+
+                async for delta in llm_instance.achat_stream(
+                    user_input=request.message,
+                    system_prompt=request.system_prompt,
+                    keep_context=request.keep_context,
+                    temperature=request.temperature,
+                ):
+                    parts.append(delta)
+                    yield _sse_event({"delta": delta})
+
+                saved = await _save_session(llm_instance, key, record)
+
+            model_info = {
+                "model": request.config.model,
+                "base_url": request.config.base_url,
+                "temperature": request.temperature,
+            }
+            yield _sse_event(
+                {
+                    "response": "".join(parts).strip(),
+                    "model_info": model_info,
+                    "session_id": session_id,
+                    **_context_payload(request, llm_instance, record, saved),
+                },
+                event="done",
+            )
+        except UpstreamBusy as e:
+            logger.warning(f"流式聊天请求排队超时: {str(e)}")
+            yield _sse_event({"detail": str(e), "status": 503}, event="error")
+        except SessionConflict as e:
+            logger.warning(f"会话保存冲突: {str(e)}")
+            yield _sse_event({"detail": str(e), "status": 409}, event="error")
+        except Exception as e:
+            logger.error(f"流式聊天处理失败: {str(e)}")
+            yield _sse_event({"detail": f"流式聊天处理失败: {str(e)}"}, event="error")
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@llm_router.post("/chat/batch")
+async def chat_batch(request: BatchChatRequest) -> StreamingResponse:
+    """
+    批量执行相互独立的单轮对话
+
+    各条目并发发往上游（受 concurrency 限制），结果按完成顺序以 NDJSON 逐行返回，
+    每行包含 index、elapsed，以及 response 或 error；单个条目失败不影响其他条目
+
+    Args:
+        request: 批量聊天请求，包含 LLM 配置、请求条目和并发上限
+
+    Returns:
+        StreamingResponse: application/x-ndjson 响应
+
+    Raises:
+        HTTPException: 当 LLM 引擎初始化失败时
+    """
+    try:
+        llm_instance = _create_llm(request.config)
+    except Exception as e:
+        logger.error(f"批量聊天初始化失败: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"批量聊天初始化失败: {str(e)}")
+
+    async def result_stream() -> AsyncIterator[str]:
+        async for result in llm_instance.achat_many(
+            (item.model_dump() for item in request.items),
+            concurrency=request.concurrency,
+        ):
+            yield json.dumps(result, ensure_ascii=False) + "\n"
+
+    return StreamingResponse(result_stream(), media_type="application/x-ndjson")
+
+
 @llm_router.get("/context", response_model=ContextResponse)
 async def get_context(
     api_key: str = Query(..., description="API 密钥"),
     model: str = Query(default="gpt-3.5-turbo", description="模型名称"),
     base_url: Optional[str] = Query(default=None, description="API 基础 URL"),
-) -> ContextResponse:
+    session_id: Optional[str] = Query(default=None, description="会话 ID"),
+    known_version: Optional[int] = Query(
+        default=None, description="客户端持有的上下文版本，与服务端一致时返回 304"
+    ),
+    if_none_match: Optional[str] = Header(default=None),
+) -> Any:
     """
     获取当前对话上下文
 
+    客户端通过 known_version 或 If-None-Match 头携带已知版本，
+    与服务端版本一致时返回 304，仅在版本不一致时才需要完整重新同步
+
     Args:
         api_key: API 密钥
         model: 模型名称
         base_url: API 基础 URL
+        session_id: 会话 ID，为空时返回空上下文
+        known_version: 客户端持有的上下文版本
+        if_none_match: 客户端持有的 ETag
 
     Returns:
-        ContextResponse: 包含上下文信息的响应对象
+        ContextResponse: 包含上下文信息的响应对象，或 304 响应
 
     Raises:
         HTTPException: 当获取上下文失败时
@@ -138,9 +465,22 @@ async def get_context(
         # 使用传入的配置创建 LLM 实例
         llm_instance = LLM(model=model, api_key=api_key, base_url=base_url)
 
+        version = 0
+        if session_id:
+            record = await _load_session(llm_instance, _session_key(api_key, session_id))
+            version = record.version
+            etag = _etag(session_id, version)
+            if known_version == version or if_none_match == etag:
+                return Response(status_code=304, headers={"ETag": etag})
+
         context = llm_instance.get_context()
 
-        return ContextResponse(context=context, count=len(context))
+        return ContextResponse(
+            context=context,
+            count=len(context),
+            session_id=session_id,
+            context_version=version,
+        )
 
     except Exception as e:
         logger.error(f"获取上下文失败: {str(e)}")
@@ -153,7 +493,7 @@ async def set_context(request: ContextRequest) -> ContextResponse:
     设置对话上下文
 
     Args:
-        request: 包含 LLM 配置和上下文数据的请求
+        request: 包含 LLM 配置和上下文数据的请求，session_id 为空时创建新会话
 
     Returns:
         ContextResponse: 包含设置后上下文信息的响应对象
@@ -161,21 +501,32 @@ async def set_context(request: ContextRequest) -> ContextResponse:
     Raises:
         HTTPException: 当设置上下文失败时
     """
+    session_id = request.session_id or get_session_store().new_session_id()
+    key = _session_key(request.config.api_key, session_id)
+
     try:
         # 使用传入的配置创建 LLM 实例
-        llm_instance = LLM(
-            model=request.config.model,
-            api_key=request.config.api_key,
-            base_url=request.config.base_url,
-        )
+        llm_instance = _create_llm(request.config)
+
+        async with _session_lock(key):
+            record = await _load_session(llm_instance, key)
 
-        if request.context:
-            llm_instance.set_context(request.context)
+            if request.context:
+                llm_instance.set_context(request.context)
+
+            saved = await _save_session(llm_instance, key, record)
 
         context = llm_instance.get_context()
 
-        return ContextResponse(context=context, count=len(context))
+        return ContextResponse(
+            context=context,
+            count=len(context),
+            session_id=session_id,
+            context_version=saved.version,
+        )
 
+    except SessionConflict as e:
+        raise HTTPException(status_code=409, detail=str(e))
     except Exception as e:
         logger.error(f"设置上下文失败: {str(e)}")
         raise HTTPException(status_code=500, detail=f"设置上下文失败: {str(e)}")
@@ -186,6 +537,7 @@ async def clear_context(
     api_key: str = Query(..., description="API 密钥"),
     model: str = Query(default="gpt-3.5-turbo", description="模型名称"),
     base_url: Optional[str] = Query(default=None, description="API 基础 URL"),
+    session_id: Optional[str] = Query(default=None, description="会话 ID"),
 ) -> Dict[str, Any]:
     """
     清空对话上下文
@@ -194,6 +546,7 @@ async def clear_context(
         api_key: API 密钥
         model: 模型名称
         base_url: API 基础 URL
+        session_id: 会话 ID，提供时同时删除服务端会话
 
     Returns:
         Dict[str, Any]: 操作结果
@@ -207,6 +560,11 @@ async def clear_context(
 
         llm_instance.clear_context()
 
+        if session_id:
+            key = _session_key(api_key, session_id)
+            async with _session_lock(key):
+                await get_session_store().adelete(key)
+
         return {"success": True, "message": "上下文已清空", "context_count": 0}
 
     except Exception as e:
@@ -219,6 +577,7 @@ async def delete_last_qa(
     api_key: str = Query(..., description="API 密钥"),
     model: str = Query(default="gpt-3.5-turbo", description="模型名称"),
     base_url: Optional[str] = Query(default=None, description="API 基础 URL"),
+    session_id: Optional[str] = Query(default=None, description="会话 ID"),
 ) -> Dict[str, Any]:
     """
     删除最后一轮问答
@@ -227,6 +586,7 @@ async def delete_last_qa(
         api_key: API 密钥
         model: 模型名称
         base_url: API 基础 URL
+        session_id: 会话 ID
 
     Returns:
         Dict[str, Any]: 操作结果
@@ -238,7 +598,15 @@ async def delete_last_qa(
         # 使用传入的配置创建 LLM 实例
         llm_instance = LLM(model=model, api_key=api_key, base_url=base_url)
 
-        success = llm_instance.delete_last_qa()
+        if session_id:
+            key = _session_key(api_key, session_id)
+            async with _session_lock(key):
+                record = await _load_session(llm_instance, key)
+                success = llm_instance.delete_last_qa()
+                if success:
+                    await _save_session(llm_instance, key, record)
+        else:
+            success = llm_instance.delete_last_qa()
 
         if success:
             context = llm_instance.get_context()
@@ -254,11 +622,162 @@ async def delete_last_qa(
                 "context_count": len(llm_instance.get_context()),
             }
 
+    except SessionConflict as e:
+        raise HTTPException(status_code=409, detail=str(e))
     except Exception as e:
         logger.error(f"删除最后一轮问答失败: {str(e)}")
         raise HTTPException(status_code=500, detail=f"删除最后一轮问答失败: {str(e)}")
 
 
+def _branch_response(
+    llm_instance: LLM, session_id: str, version: int
+) -> BranchResponse:
+    """构造分支操作的响应"""
+    return BranchResponse(
+        nodes=llm_instance.get_context_nodes(),
+        branches=llm_instance.list_branches(),
+        branch=llm_instance.history.branch,
+        session_id=session_id,
+        context_version=version,
+    )
+
+
+async def _apply_branch_operation(
+    config: LLMConfig, session_id: str, operation: Callable[[LLM], None]
+) -> BranchResponse:
+    """在会话锁内加载历史、执行分支操作并保存"""
+    key = _session_key(config.api_key, session_id)
+    llm_instance = _create_llm(config)
+    try:
+        async with _session_lock(key):
+            record = await _load_session(llm_instance, key)
+            operation(llm_instance)
+            saved = await _save_session(llm_instance, key, record)
+    except KeyError as e:
+        raise HTTPException(status_code=404, detail=f"分支或节点不存在: {e}")
+    except (ValueError, SessionConflict) as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    return _branch_response(llm_instance, session_id, saved.version)
+
+
+@llm_router.get("/context/branches", response_model=BranchResponse)
+async def list_branches(
+    api_key: str = Query(..., description="API 密钥"),
+    session_id: str = Query(..., description="会话 ID"),
+) -> BranchResponse:
+    """
+    获取会话的所有分支，以及当前分支上带节点 ID 的消息
+
+    节点 ID 可用于 /context/fork 的 at 与 /context/undo 的 to
+
+    Args:
+        api_key: API 密钥
+        session_id: 会话 ID
+
+    Returns:
+        BranchResponse: 分支列表与当前分支的消息
+
+    Raises:
+        HTTPException: 当获取分支失败时
+    """
+    try:
+        llm_instance = LLM(api_key=api_key)
+        record = await _load_session(llm_instance, _session_key(api_key, session_id))
+        return _branch_response(llm_instance, session_id, record.version)
+
+    except Exception as e:
+        logger.error(f"获取分支失败: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"获取分支失败: {str(e)}")
+
+
+@llm_router.post("/context/fork", response_model=BranchResponse)
+async def fork_context(request: ForkRequest) -> BranchResponse:
+    """
+    从当前分支头或指定消息节点分叉出新分支并切换过去
+
+    新分支与原分支共享公共前缀，不复制历史，适用于重新生成、修改早期提问或对比不同提示
+
+    Args:
+        request: 分叉请求，包含会话 ID、新分支名与可选的分叉节点
+
+    Returns:
+        BranchResponse: 分叉后的分支列表与当前分支消息
+
+    Raises:
+        HTTPException: 节点不存在（404）、分支已存在（409）或其他错误（500）
+    """
+    try:
+        return await _apply_branch_operation(
+            request.config,
+            request.session_id,
+            lambda llm_instance: llm_instance.fork(request.branch, request.at),
+        )
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"分叉上下文失败: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"分叉上下文失败: {str(e)}")
+
+
+@llm_router.post("/context/checkout", response_model=BranchResponse)
+async def checkout_branch(request: CheckoutRequest) -> BranchResponse:
+    """
+    切换到已有分支，后续对话在该分支上继续
+
+    Args:
+        request: 切换请求，包含会话 ID 与分支名
+
+    Returns:
+        BranchResponse: 切换后的分支列表与当前分支消息
+
+    Raises:
+        HTTPException: 分支不存在（404）或其他错误（500）
+    """
+    try:
+        return await _apply_branch_operation(
+            request.config,
+            request.session_id,
+            lambda llm_instance: llm_instance.checkout(request.branch),
+        )
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"切换分支失败: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"切换分支失败: {str(e)}")
+
+
+@llm_router.post("/context/undo", response_model=BranchResponse)
+async def undo_context(request: UndoRequest) -> BranchResponse:
+    """
+    将当前分支回退到任意消息节点
+
+    被回退的消息不会被删除，仍可通过其节点 ID 再次回到该位置
+
+    Args:
+        request: 回退请求，包含会话 ID 与目标节点 ID
+
+    Returns:
+        BranchResponse: 回退后的分支列表与当前分支消息
+
+    Raises:
+        HTTPException: 节点不存在（404）或其他错误（500）
+    """
+    try:
+        return await _apply_branch_operation(
+            request.config,
+            request.session_id,
+            lambda llm_instance: llm_instance.undo(request.to),
+        )
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"回退上下文失败: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"回退上下文失败: {str(e)}")
+
+
 @llm_router.get("/health")
 async def health_check() -> Dict[str, Any]:
     """
@@ -283,6 +802,26 @@ async def health_check() -> Dict[str, Any]:
         }
 
 
+@llm_router.get("/stats")
+async def get_stats() -> Dict[str, Any]:
+    """
+    获取 LLM 服务运行统计
+
+    Returns:
+        Dict[str, Any]: 客户端池、会话存储、响应缓存的命中率与淘汰次数，
+        请求合并次数，各上游的重试次数与限流等待时间，以及多端点池的延迟与健康状态
+    """
+    return {
+        "client_pool": get_client_pool().stats(),
+        "sessions": get_session_store().stats(),
+        "response_cache": get_response_cache().stats(),
+        "singleflight": get_singleflight().stats(),
+        "upstreams": limiter_stats(),
+        "endpoint_pools": endpoint_pool_stats(),
+        "timestamp": datetime.now().isoformat(),
+    }
+
+
 @llm_router.get("/info")
 async def get_info() -> Dict[str, Any]:
     """
@@ -307,12 +846,22 @@ async def get_info() -> Dict[str, Any]:
             "supports_custom_base_url": True,
             "supports_temperature": True,
             "supports_context": True,
+            "supports_streaming": True,
+            "supports_sessions": True,
+            "supports_branching": True,
         },
         "endpoints": {
             "chat": "/llm/chat",
+            "chat_stream": "/llm/chat/stream",
+            "chat_batch": "/llm/chat/batch",
             "context": "/llm/context",
+            "context_branches": "/llm/context/branches",
+            "context_fork": "/llm/context/fork",
+            "context_checkout": "/llm/context/checkout",
+            "context_undo": "/llm/context/undo",
             "health": "/llm/health",
             "info": "/llm/info",
+            "stats": "/llm/stats",
         },
         "timestamp": datetime.now().isoformat(),
     }
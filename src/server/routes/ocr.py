@@ -4,16 +4,22 @@ OCR 路由接口
 提供 OCR 文字识别的 REST API 接口
 """
 
-from typing import Dict, Any, Optional
-import base64
-import io
-from PIL import Image
+from typing import Dict, Any, List, Optional, Union
+import asyncio
+import json
+import time
+import os
+from contextlib import aclosing
+from pathlib import Path
 import numpy as np
 
 from fastapi import APIRouter, HTTPException, UploadFile, File
+from fastapi.responses import JSONResponse, StreamingResponse
 from pydantic import BaseModel
 
-from src.core.engines.ocr.base import OCR
+from src.core.engines.ocr.base import AsyncOCR
+from src.core.engines.ocr.cache import get_result_cache, image_key
+from src.core.engines.ocr.document import iter_pages, recognize_document
 from src.core.base.logger import get_logger
 
 # 创建路由器
@@ -21,7 +27,17 @@ ocr_router = APIRouter(prefix="/ocr", tags=["OCR"])
 logger = get_logger(__name__)
 
 # 全局 OCR 实例
-ocr_engine: Optional[OCR] = None
+ocr_engine: Optional[AsyncOCR] = None
+
+# 启动预热使用的内置示例图片
+WARMUP_IMAGE = Path(__file__).resolve().parents[2] / "common" / "images" / "image001.png"
+
+# 启动预热状态，由 warmup_ocr_engine 更新，就绪检查接口读取
+ocr_readiness: Dict[str, Any] = {"ready": False, "attempts": 0, "error": None, "warmup": None}
+
+# PaddleOCR 服务就绪检查结果的缓存，避免每次就绪探测都请求下游
+_downstream_readiness: Dict[str, Any] = {"checked_at": None, "result": None}
+_downstream_lock: Optional[asyncio.Lock] = None
 
 
 class OCRRequest(BaseModel):
@@ -29,6 +45,7 @@ class OCRRequest(BaseModel):
 
     image_data: str  # Base64 编码的图片数据或文件路径
     format: str = "base64"  # 数据格式: base64, file_path
+    use_cache: bool = True  # 是否使用结果缓存
 
 
 class OCRResponse(BaseModel):
@@ -39,12 +56,30 @@ class OCRResponse(BaseModel):
     data: Optional[Dict[str, Any]] = None
 
 
-def get_ocr_engine() -> OCR:
-    """获取 OCR 引擎实例"""
+def get_ocr_engine() -> AsyncOCR:
+    """
+    获取 OCR 引擎实例
+
+    通过环境变量配置:
+        OCR_SERVER_URL: PaddleOCR 服务地址
+        OCR_POOL_SIZE: 连接池大小
+        OCR_TIMEOUT: 等待识别结果的超时时间（秒）
+        OCR_CONNECT_TIMEOUT: 建立连接的超时时间（秒）
+        OCR_TRANSPORT: 与 PaddleOCR 服务之间的传输方式，json（默认）或 binary，
+            PaddleOCR 服务已提供 /ocr/binary 接口时可设为 binary
+        OCR_OUTPUT_FORMAT: 识别结果格式，full、compact 或 packed
+    """
     global ocr_engine
     if ocr_engine is None:
         try:
-            ocr_engine = OCR()
+            ocr_engine = AsyncOCR(
+                server_url=os.getenv("OCR_SERVER_URL", "http://localhost:8001"),
+                pool_size=int(os.getenv("OCR_POOL_SIZE", "10")),
+                timeout=float(os.getenv("OCR_TIMEOUT", "60")),
+                connect_timeout=float(os.getenv("OCR_CONNECT_TIMEOUT", "5")),
+                transport=os.getenv("OCR_TRANSPORT", "json"),
+                output_format=os.getenv("OCR_OUTPUT_FORMAT", "full"),
+            )
             logger.info("OCR 引擎初始化成功")
         except Exception as e:
             logger.error(f"OCR 引擎初始化失败: {e}")
@@ -52,6 +87,77 @@ def get_ocr_engine() -> OCR:
     return ocr_engine
 
 
+def _cache_options(ocr: AsyncOCR) -> Dict[str, Any]:
+    """影响识别结果的选项，参与缓存键计算"""
+    return {"server": ocr.server_url, "format": ocr.output_format}
+
+
+async def recognize_cached(
+    ocr: AsyncOCR, image: Union[bytes, np.ndarray], use_cache: bool = True
+) -> Any:
+    """
+    带结果缓存的识别：按图片内容哈希查询缓存，未命中时请求 OCR 服务并写入缓存
+
+    参数:
+        ocr: OCR 客户端
+        image: 解码后的图片文件字节或像素数组
+        use_cache: False 表示本次请求跳过缓存（结果仍会写入缓存）
+    """
+    cache = get_result_cache()
+    # 哈希与磁盘层读写都在线程池中执行，不阻塞事件循环
+    key = await asyncio.to_thread(image_key, image, _cache_options(ocr))
+    if use_cache:
+        cached = await cache.aget(key)
+        if cached is not None:
+            logger.info("OCR 结果缓存命中")
+            return cached
+    else:
+        cache.record_bypass()
+
+    result = await ocr.recognize(image)
+    await cache.aput(key, result)
+    return result
+
+
+async def recognize_many_cached(
+    ocr: AsyncOCR,
+    images: List[Union[bytes, np.ndarray]],
+    batch_size: int,
+    concurrency: int,
+    use_cache: bool = True,
+) -> List[Any]:
+    """带结果缓存的批量识别：只把未命中（且不重复）的图片发送给 OCR 服务"""
+    cache = get_result_cache()
+    options = _cache_options(ocr)
+    keys = await asyncio.to_thread(
+        lambda: [image_key(image, options) for image in images]
+    )
+    results: Dict[str, Any] = {}
+    if use_cache:
+        for key in keys:
+            if key not in results:
+                cached = await cache.aget(key)
+                if cached is not None:
+                    results[key] = cached
+    else:
+        cache.record_bypass()
+
+    # 同一批中重复的图片只识别一次
+    missing: Dict[str, Union[bytes, np.ndarray]] = {}
+    for key, image in zip(keys, images):
+        if key not in results:
+            missing.setdefault(key, image)
+    if missing:
+        recognized = await ocr.recognize_many(
+            list(missing.values()), batch_size=batch_size, concurrency=concurrency
+        )
+        for key, result in zip(missing, recognized):
+            await cache.aput(key, result)
+            results[key] = result
+    logger.info(f"批量识别 {len(images)} 张图片，缓存命中 {len(images) - len(missing)} 张")
+    return [results[key] for key in keys]
+
+
 @ocr_router.post("/recognize", response_model=OCRResponse)
 async def recognize_text(request: OCRRequest) -> OCRResponse:
     """
@@ -62,8 +168,9 @@ async def recognize_text(request: OCRRequest) -> OCRResponse:
     try:
         ocr = get_ocr_engine()
 
-        # 执行 OCR 识别
-        result = ocr.recognize(request.image_data)
+        # 先解码为图片字节，缓存按图片内容而不是输入形式计算键
+        image = await asyncio.to_thread(ocr.read_image, request.image_data)
+        result = await recognize_cached(ocr, image, use_cache=request.use_cache)
 
         return OCRResponse(success=True, message="识别成功", data={"result": result})
 
@@ -73,7 +180,9 @@ async def recognize_text(request: OCRRequest) -> OCRResponse:
 
 
 @ocr_router.post("/recognize/upload", response_model=OCRResponse)
-async def recognize_upload(file: UploadFile = File(...)) -> OCRResponse:
+async def recognize_upload(
+    file: UploadFile = File(...), use_cache: bool = True
+) -> OCRResponse:
     """
     文件上传识别接口
 
@@ -84,15 +193,11 @@ async def recognize_upload(file: UploadFile = File(...)) -> OCRResponse:
         if not file.content_type or not file.content_type.startswith("image/"):
             raise HTTPException(status_code=400, detail="请上传图片文件")
 
-        # 读取文件内容
+        # 读取文件内容，原始字节直接交给客户端发送，不再经过 base64
         file_content = await file.read()
 
-        # 转换为 Base64
-        base64_data = base64.b64encode(file_content).decode("utf-8")
-        image_data = f"data:{file.content_type};base64,{base64_data}"
-
         ocr = get_ocr_engine()
-        result = ocr.recognize(image_data)
+        result = await recognize_cached(ocr, file_content, use_cache=use_cache)
 
         return OCRResponse(
             success=True,
@@ -105,17 +210,223 @@ async def recognize_upload(file: UploadFile = File(...)) -> OCRResponse:
         return OCRResponse(success=False, message=f"识别失败: {str(e)}")
 
 
+@ocr_router.post("/recognize/batch", response_model=OCRResponse)
+async def recognize_batch(
+    files: List[UploadFile] = File(...),
+    batch_size: int = int(os.getenv("OCR_BATCH_SIZE", "8")),
+    concurrency: int = int(os.getenv("OCR_BATCH_CONCURRENCY", "2")),
+    use_cache: bool = True,
+) -> OCRResponse:
+    """
+    批量上传识别接口
+
+    一次上传多张图片，按 batch_size 分批转发到 PaddleOCR 服务的批量接口，
+    最多 concurrency 个批次并发；结果与上传顺序一一对应
+    """
+    try:
+        for file in files:
+            if not file.content_type or not file.content_type.startswith("image/"):
+                raise HTTPException(status_code=400, detail=f"请上传图片文件: {file.filename}")
+
+        contents = [await file.read() for file in files]
+
+        ocr = get_ocr_engine()
+        results = await recognize_many_cached(
+            ocr, contents, batch_size, concurrency, use_cache=use_cache
+        )
+
+        return OCRResponse(
+            success=True,
+            message="识别成功",
+            data={
+                "results": [
+                    {"filename": file.filename, "result": result}
+                    for file, result in zip(files, results)
+                ]
+            },
+        )
+
+    except Exception as e:
+        logger.error(f"批量识别失败: {e}")
+        return OCRResponse(success=False, message=f"识别失败: {str(e)}")
+
+
+@ocr_router.post("/recognize/document")
+async def recognize_document_upload(
+    file: UploadFile = File(...),
+    concurrency: int = int(os.getenv("OCR_DOCUMENT_CONCURRENCY", "4")),
+    dpi: int = 200,
+    use_cache: bool = True,
+) -> StreamingResponse:
+    """
+    多页文档识别接口
+
+    支持多页 TIFF 与 PDF（PDF 需安装 pypdfium2）。文档逐页解码，最多 concurrency 页同时识别，
+    每页结果在完成后立即以 NDJSON 逐行返回（按完成顺序，每行含 page、elapsed，以及 result 或 error），
+    最后一行为 {"done": true, "pages": 页数, "elapsed": 总耗时}
+    """
+    ocr = get_ocr_engine()
+    data = await file.read()
+    if not data:
+        raise HTTPException(status_code=400, detail="上传的文件为空")
+    try:
+        pages = iter_pages(data, file.content_type, dpi=dpi)
+    except ImportError as e:
+        raise HTTPException(status_code=415, detail=str(e))
+    logger.info(f"开始流式识别文档: {file.filename}，大小: {len(data)} 字节")
+
+    async def result_stream():
+        started = time.perf_counter()
+        count = 0
+        # 客户端断开时立即关闭识别流，取消剩余识别并关闭页迭代器
+        records = recognize_document(
+            pages,
+            lambda image: recognize_cached(ocr, image, use_cache=use_cache),
+            concurrency=concurrency,
+        )
+        async with aclosing(records):
+            async for record in records:
+                count += "page" in record
+                yield json.dumps(record, ensure_ascii=False) + "\n"
+        summary = {"done": True, "pages": count, "elapsed": round(time.perf_counter() - started, 3)}
+        logger.info(f"文档识别完成: {file.filename}，共 {count} 页，耗时 {summary['elapsed']} 秒")
+        yield json.dumps(summary, ensure_ascii=False) + "\n"
+
+    return StreamingResponse(result_stream(), media_type="application/x-ndjson")
+
+
+async def close_ocr_engine() -> None:
+    """关闭全局 OCR 实例的连接池"""
+    global ocr_engine
+    if ocr_engine is not None:
+        await ocr_engine.aclose()
+        ocr_engine = None
+
+
+async def warmup_ocr_engine(
+    runs: int = 2,
+    retry_interval: float = 5.0,
+    image_path: Optional[str] = None,
+    max_retry_interval: float = 60.0,
+) -> None:
+    """
+    预热 OCR 引擎：创建连接池并用内置图片执行识别，失败时按指数退避重试直到成功
+
+    预热请求直接发送到 OCR 服务、不经过结果缓存，首次请求包含建立连接的开销，
+    各次耗时记录在 ocr_readiness 中；PaddleOCR 服务尚未就绪时请求会失败，
+    重试间隔从 retry_interval 开始每次翻倍，不超过 max_retry_interval
+
+    参数:
+        runs: 预热识别次数
+        retry_interval: 预热失败后的首次重试间隔（秒）
+        image_path: 预热图片路径，默认为内置示例图片
+        max_retry_interval: 重试间隔上限（秒）
+    """
+    image_path = image_path or str(WARMUP_IMAGE)
+    started = time.perf_counter()
+    delay = retry_interval
+    while True:
+        ocr_readiness["attempts"] += 1
+        try:
+            ocr = get_ocr_engine()
+            image = await asyncio.to_thread(ocr.read_image, image_path)
+            timings = []
+            for _ in range(max(1, runs)):
+                run_started = time.perf_counter()
+                await ocr.recognize(image)
+                timings.append(round((time.perf_counter() - run_started) * 1000, 1))
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            ocr_readiness["error"] = str(e)
+            logger.warning(
+                f"OCR 预热失败（第 {ocr_readiness['attempts']} 次），{delay:g} 秒后重试: {e}"
+            )
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, max_retry_interval)
+            continue
+        break
+
+    ocr_readiness.update(
+        ready=True,
+        error=None,
+        warmup={
+            "image": image_path,
+            "runs_ms": timings,
+            "total_ms": round((time.perf_counter() - started) * 1000, 1),
+        },
+    )
+    logger.info(f"OCR 预热完成，各次识别耗时 {timings} ms")
+
+
+async def check_ocr_server() -> Dict[str, Any]:
+    """
+    查询 PaddleOCR 服务是否就绪，结果缓存 OCR_READY_CACHE_TTL 秒（默认 3）
+
+    并发的就绪探测共用同一次下游请求；缓存过期前下游状态的变化最迟在一个缓存周期后反映出来
+    """
+    global _downstream_lock
+    if _downstream_lock is None:
+        _downstream_lock = asyncio.Lock()
+    ttl = float(os.getenv("OCR_READY_CACHE_TTL", "3"))
+    async with _downstream_lock:
+        checked_at = _downstream_readiness["checked_at"]
+        if checked_at is None or time.monotonic() - checked_at >= ttl:
+            try:
+                result = await get_ocr_engine().check_ready(
+                    timeout=float(os.getenv("OCR_READY_TIMEOUT", "2"))
+                )
+            except Exception as e:
+                result = {"ready": False, "detail": str(e)}
+            if result["ready"] != (_downstream_readiness["result"] or {}).get("ready"):
+                logger.info(f"PaddleOCR 服务就绪状态变为: {result['ready']}")
+            _downstream_readiness.update(checked_at=time.monotonic(), result=result)
+        return _downstream_readiness["result"]
+
+
+async def get_ocr_readiness() -> Dict[str, Any]:
+    """
+    OCR 整体就绪状态：网关预热已完成且 PaddleOCR 服务当前就绪
+
+    预热只在启动时执行一次，之后下游服务重启或全部工作进程不可用时，
+    就绪检查随下游的 /ready 返回未就绪
+    """
+    server = await check_ocr_server()
+    return {
+        **ocr_readiness,
+        "ready": ocr_readiness["ready"] and server["ready"],
+        "warmed_up": ocr_readiness["ready"],
+        "server": server,
+    }
+
+
+@ocr_router.get("/ready")
+async def readiness_check() -> JSONResponse:
+    """
+    就绪检查接口：OCR 预热完成且 PaddleOCR 服务就绪时返回 200，否则返回 503，
+    响应体包含各次预热识别的耗时与 PaddleOCR 服务的就绪详情
+    """
+    readiness = await get_ocr_readiness()
+    return JSONResponse(status_code=200 if readiness["ready"] else 503, content=readiness)
+
+
 @ocr_router.get("/health")
 async def health_check() -> Dict[str, str]:
-    """健康检查接口"""
+    """存活检查接口，不请求 OCR 服务，就绪状态见 /ocr/ready"""
     try:
-        ocr = get_ocr_engine()
+        get_ocr_engine()
         return {"status": "healthy", "service": "OCR", "message": "OCR 服务运行正常"}
     except Exception as e:
         logger.error(f"OCR 健康检查失败: {e}")
         raise HTTPException(status_code=503, detail=f"OCR 服务不可用: {e}")
 
 
+@ocr_router.get("/stats")
+async def get_stats() -> Dict[str, Any]:
+    """获取 OCR 结果缓存的命中、未命中与淘汰统计"""
+    return {"result_cache": get_result_cache().stats()}
+
+
 @ocr_router.get("/info")
 async def get_info() -> Dict[str, Any]:
     """获取 OCR 服务信息"""
@@ -123,11 +434,21 @@ async def get_info() -> Dict[str, Any]:
         "service": "OCR Text Recognition",
         "version": "1.0.0",
         "description": "基于 PaddleOCR 的文字识别服务",
-        "supported_formats": ["image/jpeg", "image/png", "image/bmp", "image/tiff"],
+        "supported_formats": [
+            "image/jpeg",
+            "image/png",
+            "image/bmp",
+            "image/tiff",
+            "application/pdf",
+        ],
         "endpoints": [
             "/ocr/recognize - POST: 文字识别",
             "/ocr/recognize/upload - POST: 文件上传识别",
+            "/ocr/recognize/batch - POST: 多文件批量识别",
+            "/ocr/recognize/document - POST: 多页 TIFF/PDF 流式识别（NDJSON）",
             "/ocr/health - GET: 健康检查",
+            "/ocr/ready - GET: 就绪检查（预热耗时）",
+            "/ocr/stats - GET: 结果缓存统计",
             "/ocr/info - GET: 服务信息",
         ],
     }
\ No newline at end of file
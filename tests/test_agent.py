@@ -0,0 +1,148 @@
+"""工具调用 Agent 单元测试"""
+
+import asyncio
+import json
+import time
+import types
+
+import pytest
+
+from src.core.engines.llm.base import LLM
+from src.core.engines.llm.context_window import ContextWindow
+from src.modules.agent import Agent, Tool, ToolRegistry
+
+
+def tool_call(call_id, name, **arguments):
+    return types.SimpleNamespace(
+        id=call_id,
+        function=types.SimpleNamespace(name=name, arguments=json.dumps(arguments)),
+    )
+
+
+def response(content="", tool_calls=None):
+    message = types.SimpleNamespace(content=content, tool_calls=tool_calls)
+    return types.SimpleNamespace(choices=[types.SimpleNamespace(message=message)])
+
+
+def scripted_llm(replies, **kwargs):
+    """按顺序返回预设回复的 LLM，回复为异常时抛出；摘要请求返回固定摘要"""
+    llm = LLM(
+        model="test-model",
+        api_key="sk-test",
+        base_url="http://upstream.test",
+        use_response_cache=False,
+        coalesce_requests=False,
+        **kwargs,
+    )
+    replies = list(replies)
+    llm.requests = []
+
+    def create(request):
+        if request["messages"][0]["content"].startswith("请将以下对话压缩"):
+            return response("summary")
+        llm.requests.append(request)
+        reply = replies.pop(0)
+        if isinstance(reply, Exception):
+            raise reply
+        return reply
+
+    async def acreate(request):
+        return create(request)
+
+    llm._create_response = create
+    llm._acreate_response = acreate
+    return llm
+
+
+def sleepy(name, seconds):
+    def fn(tag: str) -> str:
+        time.sleep(seconds)
+        return f"{name}:{tag}"
+
+    return Tool(fn, name=name, description=name)
+
+
+def test_parallel_tool_calls_run_concurrently():
+    llm = scripted_llm(
+        [
+            response(tool_calls=[tool_call("1", "a", tag="x"), tool_call("2", "b", tag="y")]),
+            response("done"),
+        ]
+    )
+    agent = Agent(llm, ToolRegistry([sleepy("a", 0.3), sleepy("b", 0.3)]))
+
+    result = agent.run("hi")
+    assert result["response"] == "done"
+    assert result["stop_reason"] == "completed"
+    assert result["steps"][0]["tools_elapsed"] < 0.55
+    tool_messages = [m for m in llm.messages if m["role"] == "tool"]
+    assert [(m["tool_call_id"], m["content"]) for m in tool_messages] == [
+        ("1", "a:x"),
+        ("2", "b:y"),
+    ]
+
+
+@pytest.mark.parametrize("asynchronous", [False, True])
+def test_slow_tool_times_out(asynchronous):
+    llm = scripted_llm(
+        [response(tool_calls=[tool_call("1", "slow", tag="x")]), response("done")]
+    )
+    agent = Agent(llm, ToolRegistry([sleepy("slow", 2)]), tool_timeout=0.2)
+
+    if asynchronous:
+        # 测试自身的 asyncio.run 退出时会等待线程池，只检查 arun 本身的耗时
+        result = asyncio.run(agent.arun("hi"))
+        assert result["elapsed"] < 1.5
+    else:
+        started = time.perf_counter()
+        result = agent.run("hi")
+        assert time.perf_counter() - started < 1.5
+    assert "超时" in result["steps"][0]["tool_calls"][0]["error"]
+    assert result["response"] == "done"
+
+
+def test_unknown_tool_and_max_steps():
+    llm = scripted_llm([response(tool_calls=[tool_call("1", "missing")])])
+    agent = Agent(llm, ToolRegistry([]), max_steps=1)
+
+    result = agent.run("hi")
+    assert result["stop_reason"] == "max_steps"
+    assert "未知工具" in result["steps"][0]["tool_calls"][0]["error"]
+
+
+def test_failed_turn_rolls_back_context():
+    llm = scripted_llm(
+        [
+            response("first"),
+            response(tool_calls=[tool_call("1", "a", tag="x")]),
+            RuntimeError("boom"),
+        ]
+    )
+    agent = Agent(llm, ToolRegistry([sleepy("a", 0)]))
+    agent.run("one")
+    before = list(llm.messages)
+
+    with pytest.raises(RuntimeError, match="boom"):
+        agent.run("two")
+    assert llm.messages == before
+
+
+def test_rollback_after_summary_rewrote_history():
+    # 预算很小，第二步之前的滚动摘要会用 reset 替换本轮开始时的节点
+    window = ContextWindow(max_tokens=60, policy="summarize", summary_max_tokens=5)
+    llm = scripted_llm(
+        [
+            response("a" * 40),
+            response(tool_calls=[tool_call("1", "a", tag="x" * 40)]),
+            RuntimeError("boom"),
+        ],
+        context_window=window,
+    )
+    agent = Agent(llm, ToolRegistry([sleepy("a", 0)]))
+    agent.run("one")
+    before = list(llm.messages)
+
+    with pytest.raises(RuntimeError, match="boom"):
+        asyncio.run(agent.arun("two " * 10))
+    assert llm.messages == before
+    assert not llm.history_rewritten
@@ -0,0 +1,51 @@
+"""PaddleOCR 服务微批调度单元测试"""
+
+import pytest
+
+from src.core.engines.ocr.paddleocr.batcher import MicroBatcher
+
+
+class Timeout(TimeoutError):
+    pass
+
+
+def test_batch_failure_falls_back_per_image():
+    def predict(images):
+        if len(images) > 1 or images[0] == "bad":
+            raise ValueError("bad image")
+        return [f"ok:{images[0]}"]
+
+    batcher = MicroBatcher(predict, fail_fast=(Timeout,))
+    results = batcher._predict(["a", "bad", "b"])
+    assert results[0] == "ok:a" and results[2] == "ok:b"
+    assert isinstance(results[1], ValueError)
+    assert batcher.fallbacks == 1
+
+
+def test_fail_fast_errors_skip_per_image_retry():
+    calls = []
+
+    def predict(images):
+        calls.append(list(images))
+        raise Timeout("推理超时")
+
+    batcher = MicroBatcher(predict, fail_fast=(Timeout,))
+    with pytest.raises(Timeout):
+        batcher._predict(["a", "b", "c"])
+    assert calls == [["a", "b", "c"]]
+    assert batcher.fallbacks == 0
+
+
+def test_fail_fast_error_during_fallback_stops_retrying():
+    calls = []
+
+    def predict(images):
+        calls.append(list(images))
+        if len(images) > 1:
+            raise ValueError("bad batch")
+        raise Timeout("推理超时")
+
+    batcher = MicroBatcher(predict, fail_fast=(Timeout,))
+    results = batcher._predict(["a", "b", "c"])
+    assert len(calls) == 2
+    assert len(results) == 3 and all(isinstance(result, Timeout) for result in results)
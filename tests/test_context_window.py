@@ -0,0 +1,134 @@
+"""上下文窗口预算策略单元测试"""
+
+import pytest
+
+from src.core.engines.llm.context_window import (
+    MESSAGE_OVERHEAD_TOKENS,
+    SUMMARY_PREFIX,
+    ContextWindow,
+    Message,
+    TokenCounter,
+    is_summary,
+)
+
+
+class CharCounter(TokenCounter):
+    """按字符数计数，不依赖是否安装 tiktoken"""
+
+    def __init__(self) -> None:
+        self.encoding = None
+        self.encoding_name = "chars"
+
+    def count_text(self, text: str) -> int:
+        return len(text)
+
+
+def turn(index: int, size: int = 10):
+    return [
+        {"role": "user", "content": f"u{index}".ljust(size, ".")},
+        {"role": "assistant", "content": f"a{index}".ljust(size, ".")},
+    ]
+
+
+def conversation(turns: int, size: int = 10):
+    messages = [{"role": "system", "content": "sys"}]
+    for index in range(turns):
+        messages.extend(turn(index, size))
+    return messages
+
+
+def test_within_budget_keeps_everything():
+    messages = conversation(2)
+    window = ContextWindow(max_tokens=1000)
+    assert window.fit(messages, CharCounter()) == messages
+
+
+def test_pin_system_drops_whole_oldest_turns():
+    counter = CharCounter()
+    messages = conversation(4)
+    # 每条消息 14 tokens，系统提示 7 tokens；预算只够两轮
+    window = ContextWindow(max_tokens=7 + 4 * 14)
+
+    pinned, dropped, kept = window.split(messages, counter)
+    assert pinned == messages[:1]
+    assert dropped == messages[1:5]
+    assert kept == messages[5:]
+    assert kept[0]["role"] == "user"
+    assert counter.count_messages(pinned + kept) <= window.max_tokens
+
+
+def test_drop_oldest_may_drop_system_prompt():
+    messages = [{"role": "system", "content": "s" * 50}] + turn(0) + turn(1)
+    window = ContextWindow(max_tokens=2 * 14, policy="drop_oldest")
+
+    fitted = window.fit(messages, CharCounter())
+    assert fitted == messages[3:]
+
+
+def test_last_turn_is_always_kept():
+    messages = conversation(2, size=100)
+    window = ContextWindow(max_tokens=50)
+
+    _, dropped, kept = window.split(messages, CharCounter())
+    assert kept == messages[3:]
+    assert dropped == messages[1:3]
+
+
+def test_summarize_compacts_below_low_watermark():
+    counter = CharCounter()
+    messages = conversation(20)
+    window = ContextWindow(
+        max_tokens=300, policy="summarize", summary_max_tokens=20, low_watermark=0.5
+    )
+
+    pinned, dropped, kept = window.split(messages, counter)
+    budget = 300 - counter.count_messages(pinned) - 20 - MESSAGE_OVERHEAD_TOKENS
+    assert dropped
+    assert counter.count_messages(kept) <= int(budget * 0.5)
+    assert kept[0]["role"] == "user"
+
+    # 摘要替换早期轮次后，下一轮不再触发摘要
+    summary = window.summary_message("earlier turns")
+    compacted = pinned + [summary] + kept + turn(20)
+    assert window.split(compacted, counter)[1] == []
+
+
+def test_summary_request_folds_previous_summary():
+    summary = ContextWindow.summary_message("  old facts ")
+    assert is_summary(summary)
+    assert summary["content"] == f"{SUMMARY_PREFIX} old facts"
+
+    request = ContextWindow.summary_request([summary, {"role": "user", "content": "hi"}])
+    assert request[1]["content"] == "此前摘要: old facts\nuser: hi"
+
+
+def test_invalid_arguments():
+    with pytest.raises(ValueError):
+        ContextWindow(max_tokens=100, policy="unknown")
+    with pytest.raises(ValueError):
+        ContextWindow(max_tokens=0)
+    with pytest.raises(ValueError):
+        ContextWindow(max_tokens=100, low_watermark=0)
+
+
+def test_token_count_cached_on_message():
+    counter = CharCounter()
+    message = Message(role="user", content="hello")
+    assert counter.count_message(message) == MESSAGE_OVERHEAD_TOKENS + 5
+    assert message.token_cache == ("chars", MESSAGE_OVERHEAD_TOKENS + 5)
+
+    # 缓存按编码名称区分，换用其他计数器时重新计算
+    message.token_cache = ("chars", 999)
+    assert counter.count_message(message) == 999
+    assert TokenCounter().count_message(message) != 999
+
+
+def test_estimate_without_tiktoken(monkeypatch):
+    import src.core.engines.llm.context_window as context_window
+
+    monkeypatch.setattr(context_window, "tiktoken", None)
+    counter = TokenCounter()
+    assert counter.encoding_name == "estimate"
+    assert counter.count_text("abcdefgh") == 2
+    assert counter.count_text("中文") == 2
+    assert counter.count_text("") == 0
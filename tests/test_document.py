@@ -0,0 +1,42 @@
+"""多页文档流水线识别单元测试"""
+
+import asyncio
+import time
+
+import pytest
+
+pytest.importorskip("numpy")
+pytest.importorskip("PIL")
+
+from src.core.engines.ocr.document import recognize_document  # noqa: E402
+
+
+def test_pages_are_closed_when_consumer_stops_early():
+    state = {"closed": False, "decoding": False}
+
+    def pages():
+        try:
+            for index in range(100):
+                state["decoding"] = True
+                time.sleep(0.05)
+                state["decoding"] = False
+                yield index
+        finally:
+            # 关闭时不能有线程仍在执行 next
+            assert not state["decoding"]
+            state["closed"] = True
+
+    async def recognize(image):
+        return image
+
+    source = pages()
+
+    async def run():
+        records = recognize_document(source, recognize, concurrency=2)
+        async for record in records:
+            assert "result" in record
+            break
+        await records.aclose()
+        assert state["closed"]
+
+    asyncio.run(run())
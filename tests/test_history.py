@@ -0,0 +1,206 @@
+"""结构共享对话历史单元测试"""
+
+import copy
+import pickle
+
+import pytest
+
+from src.core.engines.llm.context_window import Message
+from src.core.engines.llm.history import DEFAULT_BRANCH, MessageHistory, MessageList
+
+
+def user(content: str) -> Message:
+    return Message(role="user", content=content)
+
+
+def contents(history: MessageHistory):
+    return [message["content"] for message in history.messages()]
+
+
+def build(*texts: str) -> MessageHistory:
+    history = MessageHistory()
+    for text in texts:
+        history.append(user(text))
+    return history
+
+
+def test_append_pop_and_len():
+    history = build("a", "b")
+    assert len(history) == 2
+    assert history.last()["content"] == "b"
+    assert history.pop()["content"] == "b"
+    assert contents(history) == ["a"]
+
+    history.clear()
+    assert len(history) == 0
+    assert history.last() is None
+    with pytest.raises(IndexError):
+        history.pop()
+
+
+def test_fork_shares_prefix():
+    history = build("a", "b")
+    shared = history.head
+    history.append(user("c"))
+
+    history.fork("alt", at=shared.node_id)
+    history.append(user("d"))
+    assert contents(history) == ["a", "b", "d"]
+    assert history.head.parent is shared
+
+    history.checkout(DEFAULT_BRANCH)
+    assert contents(history) == ["a", "b", "c"]
+    assert {branch["name"]: branch["length"] for branch in history.branch_list()} == {
+        DEFAULT_BRANCH: 3,
+        "alt": 3,
+    }
+
+    with pytest.raises(ValueError):
+        history.fork("alt")
+    with pytest.raises(ValueError):
+        history.delete_branch(DEFAULT_BRANCH)
+    history.delete_branch("alt")
+    with pytest.raises(KeyError):
+        history.checkout("alt")
+
+
+def test_rewind_keeps_nodes_until_pruned():
+    history = build("a", "b", "c")
+    nodes = history.path()
+
+    history.rewind(nodes[0].node_id)
+    assert contents(history) == ["a"]
+    # 被回退的节点仍可回到
+    history.rewind(nodes[2].node_id)
+    assert contents(history) == ["a", "b", "c"]
+
+    history.rewind(nodes[0].node_id)
+    assert history.prune() == 2
+    with pytest.raises(KeyError):
+        history.rewind(nodes[2].node_id)
+
+
+def test_reset_reuses_nodes_at_same_position():
+    history = MessageHistory()
+    history.append(Message(role="system", content="sys"))
+    history.append(user("a"))
+    system, a = history.path()
+
+    history.reset([{"role": "system", "content": "sys"}, {"role": "user", "content": "b"}])
+    assert contents(history) == ["sys", "b"]
+    assert history.path()[0] is system
+    assert isinstance(history.last(), Message)
+    # 被替换的节点不会立即丢弃，仍可通过节点 ID 回到
+    assert len(history.nodes) == 3
+    history.rewind(a.node_id)
+    assert contents(history) == ["sys", "a"]
+
+    # 与被回退掉的节点内容相同时沿用原节点 ID
+    history.reset([{"role": "system", "content": "sys"}, {"role": "user", "content": "b"}])
+    b = history.head
+    history.reset([{"role": "system", "content": "sys"}, {"role": "user", "content": "b"}])
+    assert history.head is b
+    assert len(history.nodes) == 3
+
+
+def test_reset_prunes_past_size_threshold():
+    history = build("a")
+    history.prune_bytes = 20
+    for text in ["bbbbbbbb", "cccccccc", "dddddddd"]:
+        history.reset([user(text)])
+    assert contents(history) == ["dddddddd"]
+    assert history.size() <= 20
+
+
+def test_size_tracks_registry():
+    history = build("aaaa", "bb")
+    assert history.size() == 2 * len("user") + 6
+
+    history.pop()
+    assert history.size() == 2 * len("user") + 6
+    history.prune()
+    assert history.size() == len("user") + 4
+
+
+def test_snapshot_is_isolated():
+    history = build("a")
+    size = history.size()
+    snapshot = history.snapshot()
+    snapshot.append(user("b"))
+    snapshot.fork("alt")
+
+    assert contents(history) == ["a"]
+    assert list(history.branches) == [DEFAULT_BRANCH]
+    assert contents(snapshot) == ["a", "b"]
+    # 副本上的新节点不登记到原历史的注册表
+    assert history.size() == size
+    assert len(history.nodes) == 1
+
+    history.append(user("c"))
+    assert len(snapshot.nodes) == 2
+    assert len(history.nodes) == 2
+
+
+def test_message_list_is_read_only():
+    messages = MessageList(build("a").messages())
+    with pytest.raises(TypeError):
+        messages.append(user("b"))
+    with pytest.raises(TypeError):
+        messages[0] = user("b")
+    with pytest.raises(TypeError):
+        messages += [user("b")]
+
+    assert type(messages + [user("b")]) is list
+    assert type(copy.deepcopy(messages)) is list
+    assert pickle.loads(pickle.dumps(messages)) == list(messages)
+
+
+def test_round_trip_through_dict():
+    history = build("a", "b")
+    history.fork("alt", at=history.path()[0].node_id)
+    history.append(user("c"))
+
+    restored = MessageHistory.from_dict(history.to_dict())
+    assert restored.branch == "alt"
+    assert contents(restored) == ["a", "c"]
+    restored.checkout(DEFAULT_BRANCH)
+    assert contents(restored) == ["a", "b"]
+    assert restored.size() == history.size()
+
+
+def test_to_dict_reachable_only():
+    history = build("a", "b")
+    history.pop()
+
+    assert len(history.to_dict()["nodes"]) == 1
+    assert len(history.to_dict(reachable_only=False)["nodes"]) == 2
+
+
+def test_merge_incremental_nodes():
+    history = build("a")
+    replica = MessageHistory.from_dict(history.to_dict())
+    saved = {node.node_id for node in history.path()}
+
+    history.append(user("b"))
+    delta = history.to_dict(exclude=saved)
+    assert [node["message"]["content"] for node in delta["nodes"]] == ["b"]
+
+    replica.merge(delta)
+    assert contents(replica) == ["a", "b"]
+
+
+def test_merge_rejects_missing_nodes_without_changes():
+    history = build("a")
+    delta = build("x", "y").to_dict()
+    delta["nodes"] = delta["nodes"][1:]
+
+    with pytest.raises(ValueError):
+        history.merge(delta)
+    assert contents(history) == ["a"]
+    assert len(history.nodes) == 1
+
+    with pytest.raises(ValueError):
+        history.merge(
+            {"nodes": [], "branches": {DEFAULT_BRANCH: "missing"}, "branch": DEFAULT_BRANCH}
+        )
+    assert contents(history) == ["a"]
@@ -0,0 +1,110 @@
+"""LRUCache 单元测试"""
+
+import types
+
+import pytest
+
+import src.core.base.cache as cache_module
+from src.core.base.cache import LRUCache
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """可手动推进的单调时钟，替换 cache 模块中的 time"""
+    now = [1000.0]
+    monkeypatch.setattr(cache_module, "time", types.SimpleNamespace(monotonic=lambda: now[0]))
+    return now
+
+
+def test_evicts_least_recently_used():
+    evicted = []
+    cache = LRUCache(max_items=2, on_evict=lambda key, value: evicted.append(key))
+    cache.put("a", 1)
+    cache.put("b", 2)
+    assert cache.get("a") == 1
+    cache.put("c", 3)
+
+    assert evicted == ["b"]
+    assert "b" not in cache
+    assert [key for key, _ in cache.items()] == ["a", "c"]
+    assert cache.stats()["evictions"] == 1
+
+
+def test_replace_does_not_evict_or_call_callback():
+    evicted = []
+    cache = LRUCache(max_items=2, on_evict=lambda key, value: evicted.append(key))
+    cache.put("a", 1)
+    cache.put("a", 2)
+
+    assert cache.get("a") == 2
+    assert len(cache) == 1
+    assert evicted == []
+
+
+def test_max_bytes_evicts_but_keeps_newest_entry():
+    cache = LRUCache(max_items=10, max_bytes=10, sizeof=len)
+    cache.put("a", "xxxx")
+    cache.put("b", "xxxx")
+    cache.put("c", "xxxx")
+    assert [key for key, _ in cache.items()] == ["b", "c"]
+    assert cache.stats()["bytes"] == 8
+
+    # 单个值超过上限时仍然保留，只淘汰其他条目
+    cache.put("d", "x" * 20)
+    assert [key for key, _ in cache.items()] == ["d"]
+
+
+def test_max_bytes_requires_sizeof():
+    with pytest.raises(ValueError):
+        LRUCache(max_bytes=10)
+    with pytest.raises(ValueError):
+        LRUCache(max_items=0)
+
+
+def test_ttl_expiry(clock):
+    evicted = []
+    cache = LRUCache(ttl=10, on_evict=lambda key, value: evicted.append(key))
+    cache.put("a", 1)
+    cache.put("b", 2)
+    clock[0] += 5
+    assert cache.get("a") == 1
+
+    clock[0] += 5
+    assert cache.get("a", "missing") == "missing"
+    assert cache.purge_expired() == 1
+    assert len(cache) == 0
+    assert sorted(evicted) == ["a", "b"]
+    assert cache.stats()["expirations"] == 2
+
+
+def test_put_refreshes_ttl(clock):
+    cache = LRUCache(ttl=10)
+    cache.put("a", 1)
+    clock[0] += 8
+    cache.put("a", 2)
+    clock[0] += 8
+    assert cache.get("a") == 2
+
+
+def test_pop_and_clear_release_values():
+    evicted = []
+    cache = LRUCache(on_evict=lambda key, value: evicted.append((key, value)))
+    cache.put("a", 1)
+    cache.put("b", 2)
+
+    assert cache.pop("a") == 1
+    assert cache.pop("a", "missing") == "missing"
+    cache.clear()
+    assert evicted == [("a", 1), ("b", 2)]
+    assert cache.stats()["bytes"] == 0
+
+
+def test_stats_hit_rate():
+    cache = LRUCache()
+    cache.put("a", 1)
+    cache.get("a")
+    cache.get("b")
+
+    stats = cache.stats()
+    assert (stats["hits"], stats["misses"]) == (1, 1)
+    assert stats["hit_rate"] == 0.5
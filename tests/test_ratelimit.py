@@ -0,0 +1,312 @@
+"""限流、自适应并发与重试策略单元测试"""
+
+import asyncio
+import email.utils
+import threading
+import time
+import types
+
+import openai
+import pytest
+
+import src.core.engines.llm.ratelimit as ratelimit
+from src.core.engines.llm.ratelimit import (
+    AdaptiveConcurrency,
+    RetryPolicy,
+    TokenBucket,
+    UpstreamLimiter,
+)
+
+
+def api_error(cls, status_code=None, headers=None):
+    """构造 openai 异常，不依赖具体 SDK 版本的构造参数"""
+    error = cls.__new__(cls)
+    Exception.__init__(error, f"{cls.__name__} {status_code}")
+    error.status_code = status_code
+    error.response = types.SimpleNamespace(headers=headers or {})
+    return error
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """可手动推进的时钟，sleep 直接推进时间"""
+    now = [1000.0]
+
+    def sleep(seconds):
+        now[0] += seconds
+
+    monkeypatch.setattr(
+        ratelimit,
+        "time",
+        types.SimpleNamespace(monotonic=lambda: now[0], sleep=sleep, time=time.time),
+    )
+    return now
+
+
+def test_token_bucket_burst_then_rate(clock):
+    bucket = TokenBucket(rate=2, burst=3)
+    assert [bucket.reserve() for _ in range(3)] == [0.0, 0.0, 0.0]
+    assert bucket.reserve() == pytest.approx(0.5)
+    assert bucket.reserve() == pytest.approx(1.0)
+
+    clock[0] += 10
+    assert bucket.reserve() == 0.0
+
+
+def test_aimd_limit():
+    concurrency = AdaptiveConcurrency(initial=4, min_limit=1, max_limit=5)
+    # 每次成功加 1/limit，约一个窗口的成功请求使上限加 1
+    for _ in range(4):
+        concurrency.on_success()
+    assert 4.9 < concurrency.limit < 5
+    for _ in range(10):
+        concurrency.on_success()
+    assert concurrency.limit == 5
+
+    for _ in range(5):
+        concurrency.on_throttle()
+    assert concurrency.limit == 1
+    assert AdaptiveConcurrency(initial=100, max_limit=8).limit == 8
+
+
+def test_threads_are_granted_in_arrival_order():
+    concurrency = AdaptiveConcurrency(initial=1, max_limit=1)
+    concurrency.acquire()
+    order = []
+
+    def worker(index):
+        concurrency.acquire()
+        order.append(index)
+        concurrency.release()
+
+    threads = []
+    for index in range(4):
+        thread = threading.Thread(target=worker, args=(index,))
+        thread.start()
+        threads.append(thread)
+        while concurrency.waiting < index + 1:
+            time.sleep(0.001)
+
+    concurrency.release()
+    for thread in threads:
+        thread.join(timeout=5)
+    assert order == [0, 1, 2, 3]
+    assert concurrency.in_flight == 0
+
+
+def test_cancelled_waiter_does_not_leak_slot():
+    concurrency = AdaptiveConcurrency(initial=1, max_limit=1)
+
+    async def run():
+        await concurrency.aacquire()
+        cancelled = asyncio.create_task(concurrency.aacquire())
+        waiting = asyncio.create_task(concurrency.aacquire())
+        await asyncio.sleep(0)
+        assert concurrency.waiting == 2
+
+        cancelled.cancel()
+        await asyncio.gather(cancelled, return_exceptions=True)
+        concurrency.release()
+        await asyncio.wait_for(waiting, timeout=5)
+        assert concurrency.in_flight == 1
+        concurrency.release()
+
+    asyncio.run(run())
+    assert concurrency.in_flight == 0
+    assert concurrency.waiting == 0
+
+
+def test_retryable_errors():
+    assert RetryPolicy.is_retryable(api_error(openai.RateLimitError, 429))
+    assert RetryPolicy.is_retryable(api_error(openai.APIStatusError, 503))
+    assert RetryPolicy.is_retryable(api_error(openai.APITimeoutError))
+    assert RetryPolicy.is_retryable(api_error(openai.APIConnectionError))
+    assert not RetryPolicy.is_retryable(api_error(openai.APIStatusError, 400))
+    assert not RetryPolicy.is_retryable(ValueError("bad"))
+
+
+def test_retry_after_headers():
+    def retry_after(headers):
+        return RetryPolicy.retry_after(api_error(openai.RateLimitError, 429, headers))
+
+    assert retry_after({"retry-after-ms": "250"}) == 0.25
+    assert retry_after({"retry-after": "3"}) == 3.0
+    assert retry_after({"retry-after": "soon"}) is None
+    assert retry_after({}) is None
+    date = email.utils.formatdate(time.time() + 60, usegmt=True)
+    assert 55 <= retry_after({"retry-after": date}) <= 60
+
+
+def test_retry_delay_is_jittered_and_capped():
+    policy = RetryPolicy(base_delay=1.0, max_delay=5.0)
+    error = api_error(openai.APIStatusError, 500)
+    for attempt in range(6):
+        assert 0 <= policy.delay(attempt, error) <= min(5.0, 2**attempt)
+
+    throttled = api_error(openai.RateLimitError, 429, {"retry-after": "100"})
+    assert policy.delay(0, throttled) == 5.0
+
+
+def test_limiter_retries_then_succeeds(clock):
+    limiter = UpstreamLimiter("http://upstream", retry_policy=RetryPolicy(max_retries=3))
+    errors = [
+        api_error(openai.RateLimitError, 429, {"retry-after": "1"}),
+        api_error(openai.APIStatusError, 502),
+    ]
+
+    def call():
+        if errors:
+            raise errors.pop(0)
+        return "ok"
+
+    assert limiter.call(call) == "ok"
+    stats = limiter.stats()
+    assert stats["requests"] == 1
+    assert (stats["retries"], stats["throttled"], stats["failures"]) == (2, 1, 0)
+    assert stats["in_flight"] == 0
+
+
+def test_limiter_does_not_retry_client_errors(clock):
+    limiter = UpstreamLimiter("http://upstream")
+    calls = []
+
+    def call():
+        calls.append(1)
+        raise api_error(openai.APIStatusError, 400)
+
+    with pytest.raises(openai.APIStatusError):
+        limiter.call(call)
+    assert len(calls) == 1
+    assert limiter.stats()["failures"] == 1
+    assert limiter.concurrency.in_flight == 0
+
+
+def test_limiter_gives_up_after_max_retries(clock):
+    limiter = UpstreamLimiter("http://upstream", retry_policy=RetryPolicy(max_retries=2))
+    calls = []
+
+    def call():
+        calls.append(1)
+        raise api_error(openai.APIStatusError, 500)
+
+    with pytest.raises(openai.APIStatusError):
+        limiter.call(call)
+    assert len(calls) == 3
+
+
+def test_stream_releases_slot_at_first_chunk():
+    limiter = UpstreamLimiter("http://upstream")
+
+    with limiter.stream(lambda: iter("abc")) as stream:
+        assert limiter.concurrency.in_flight == 1
+        assert next(stream) == "a"
+        assert limiter.concurrency.in_flight == 0
+        assert limiter.stats()["streaming"] == 1
+        assert "".join(stream) == "bc"
+    assert limiter.concurrency.in_flight == 0
+    assert limiter.stats()["streaming"] == 0
+
+    # 未读取任何分片就退出时同样释放
+    with limiter.stream(lambda: iter("abc")):
+        pass
+    assert limiter.concurrency.in_flight == 0
+
+    async def run():
+        async def chunks():
+            yield "x"
+            yield "y"
+
+        async def open_stream():
+            return chunks()
+
+        async with limiter.astream(open_stream) as stream:
+            assert limiter.concurrency.in_flight == 1
+            received = [chunk async for chunk in stream]
+            assert limiter.concurrency.in_flight == 0
+        return received
+
+    assert asyncio.run(run()) == ["x", "y"]
+
+
+def test_acquire_times_out():
+    concurrency = AdaptiveConcurrency(initial=1, max_limit=1)
+    assert concurrency.acquire()
+    assert not concurrency.acquire(timeout=0.01)
+    assert concurrency.waiting == 0
+
+    async def run():
+        return await concurrency.aacquire(timeout=0.01)
+
+    assert asyncio.run(run()) is False
+    assert concurrency.waiting == 0
+    assert concurrency.in_flight == 1
+
+
+def test_limiter_rejects_when_queue_wait_exceeded():
+    limiter = UpstreamLimiter(
+        "http://upstream",
+        concurrency=AdaptiveConcurrency(initial=1, max_limit=1),
+        queue_timeout=0.01,
+    )
+    with limiter.stream(lambda: iter("abc")):
+        with pytest.raises(ratelimit.UpstreamBusy):
+            limiter.call(lambda: "ok")
+    assert limiter.stats()["rejected"] == 1
+    assert limiter.call(lambda: "ok") == "ok"
+
+
+def test_no_retry_when_disabled(clock):
+    limiter = UpstreamLimiter("http://upstream", retry_policy=RetryPolicy(max_retries=3))
+    calls = []
+
+    def call():
+        calls.append(1)
+        raise api_error(openai.APIStatusError, 503)
+
+    with pytest.raises(openai.APIStatusError):
+        limiter.call(call, retry=False)
+    assert len(calls) == 1
+
+
+def test_limiters_are_isolated_per_api_key():
+    first = ratelimit.get_upstream_limiter("http://tenant.test", "sk-a")
+    assert ratelimit.get_upstream_limiter("http://tenant.test", "sk-a") is first
+    second = ratelimit.get_upstream_limiter("http://tenant.test", "sk-b")
+    assert second is not first
+
+    first.concurrency.on_throttle()
+    assert second.concurrency.limit > first.concurrency.limit
+    names = [name for name in ratelimit.limiter_stats() if name.endswith("@http://tenant.test")]
+    assert len(names) == 2
+
+
+def test_endpoint_pool_owns_retries(clock):
+    from contextlib import contextmanager
+
+    from src.core.engines.llm.balancer import EndpointPool
+    from src.core.engines.llm.base import LLM
+
+    calls = []
+
+    def create(**kwargs):
+        calls.append(kwargs)
+        raise api_error(openai.APIStatusError, 503)
+
+    class Pool:
+        @contextmanager
+        def lease(self, api_key, base_url, asynchronous=False):
+            yield types.SimpleNamespace(
+                chat=types.SimpleNamespace(completions=types.SimpleNamespace(create=create))
+            )
+
+    llm = LLM(
+        api_key="sk-pool",
+        client_pool=Pool(),
+        use_response_cache=False,
+        coalesce_requests=False,
+        endpoints=EndpointPool(["http://a.test", "http://b.test"]),
+    )
+    # 每个端点只尝试一次，限流器不再在端点内重试
+    with pytest.raises(openai.APIStatusError):
+        llm._create_response({"model": "m", "messages": []})
+    assert len(calls) == 2
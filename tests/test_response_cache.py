@@ -0,0 +1,82 @@
+"""LLM 响应缓存单元测试"""
+
+import asyncio
+
+from src.core.engines.llm.cache import ResponseCache, request_key
+
+MESSAGES = [{"role": "user", "content": "你好"}]
+
+
+def test_request_key_depends_on_request_and_credential():
+    key = request_key("gpt", "http://a", MESSAGES, {"temperature": 0})
+    assert key == request_key("gpt", "http://a", list(MESSAGES), {"temperature": 0, "stream": True})
+    assert key != request_key("gpt", "http://a", MESSAGES, {"temperature": 0.5})
+    assert key != request_key("gpt", "http://b", MESSAGES, {"temperature": 0})
+    assert key != request_key("gpt", "http://a", MESSAGES, {"temperature": 0}, api_key="k1")
+    assert request_key("gpt", "http://a", MESSAGES, {}, api_key="k1") != request_key(
+        "gpt", "http://a", MESSAGES, {}, api_key="k2"
+    )
+
+
+def test_memory_only():
+    cache = ResponseCache(max_items=4)
+    assert cache.get("k") is None
+    cache.put("k", "回复")
+    assert cache.get("k") == "回复"
+
+    stats = cache.stats()
+    assert not stats["disk_enabled"]
+    assert (stats["memory_hits"], stats["misses"]) == (1, 1)
+
+
+def test_disk_layer_survives_restart(tmp_path):
+    db_path = tmp_path / "cache" / "responses.db"
+    cache = ResponseCache(db_path=str(db_path))
+    cache.put("k", "回复")
+
+    reopened = ResponseCache(db_path=str(db_path))
+    assert reopened.stats()["disk_bytes"] == len("回复".encode("utf-8"))
+    assert reopened.get("k") == "回复"
+    assert reopened.stats()["disk_hits"] == 1
+    # 磁盘命中回填内存层
+    assert reopened.get("k") == "回复"
+    assert reopened.stats()["memory_hits"] == 1
+
+
+def test_disk_expiry(tmp_path, monkeypatch):
+    import src.core.engines.llm.cache as cache_module
+
+    cache = ResponseCache(ttl=10, db_path=str(tmp_path / "responses.db"))
+    cache.put("k", "回复")
+    cache.memory.clear()
+
+    now = cache_module.time.time()
+    monkeypatch.setattr(cache_module.time, "time", lambda: now + 20)
+    assert cache.get("k") is None
+    assert cache.purge_expired() == 1
+    assert cache.stats()["disk_bytes"] == 0
+
+
+def test_disk_eviction_keeps_newest(tmp_path):
+    cache = ResponseCache(max_items=1, db_path=str(tmp_path / "responses.db"), disk_max_bytes=100)
+    for index in range(5):
+        cache.put(f"k{index}", "x" * 30)
+
+    stats = cache.stats()
+    assert stats["disk_bytes"] <= 100
+    assert stats["disk_evictions"] > 0
+    cache.memory.clear()
+    assert cache.get("k4") == "x" * 30
+    assert cache.get("k0") is None
+
+
+def test_async_access(tmp_path):
+    cache = ResponseCache(db_path=str(tmp_path / "responses.db"))
+
+    async def run():
+        await cache.aput("k", "回复")
+        cache.memory.clear()
+        return await cache.aget("k"), await cache.aget("missing")
+
+    assert asyncio.run(run()) == ("回复", None)
+    assert cache.stats()["disk_hits"] == 1
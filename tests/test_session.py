@@ -0,0 +1,106 @@
+"""追加写日志会话后端单元测试"""
+
+import pytest
+
+import src.core.engines.llm.session as session_module
+from src.core.engines.llm.session import (
+    LogSessionBackend,
+    SessionConflict,
+    SessionRecord,
+    SessionStore,
+)
+
+
+def user(content):
+    return {"role": "user", "content": content}
+
+
+@pytest.fixture
+def db_path(tmp_path):
+    return str(tmp_path / "conversation_log.db")
+
+
+@pytest.fixture
+def backends(db_path):
+    opened = []
+
+    def open_backend(**kwargs):
+        kwargs.setdefault("compact_interval", None)
+        backend = LogSessionBackend(db_path, **kwargs)
+        opened.append(backend)
+        return backend
+
+    yield open_backend
+    for backend in opened:
+        backend.close()
+
+
+def test_pending_write_survives_cache_eviction(backends):
+    # 提交间隔很长，保存的记录在被淘汰出缓存时还没有写入日志
+    store = SessionStore(backends(max_sessions=1, flush_interval=1))
+    store.save("a", [user("1"), user("2")])
+    store.save("b", [user("x")])
+
+    record = store.load("a")
+    assert record.version == 1
+    assert record.messages == [user("1"), user("2")]
+    assert store.backend.replays == 0
+
+
+def test_stale_version_is_rejected(backends):
+    store = SessionStore(backends())
+    store.save("a", [user("1")])
+    with pytest.raises(SessionConflict):
+        store.save("a", [user("2")], version=0)
+    assert store.load("a").messages == [user("1")]
+
+
+def test_concurrent_workers_saving_same_version(backends):
+    first = backends(flush_interval=0.01)
+    second = backends(flush_interval=0.01)
+    SessionStore(first).save("a", [user("1")])
+    first.log.flush()
+    assert second.get("a").version == 1
+
+    # 两个 worker 都基于版本 1 保存，且都在对方提交之前通过了校验
+    first.put(SessionRecord("a", [user("1"), user("first")], 2))
+    second.put(SessionRecord("a", [user("1"), user("second")], 2))
+    first.log.flush()
+    second.log.flush()
+
+    assert first.get("a").messages == second.get("a").messages
+    assert first.log.conflicts + second.log.conflicts == 1
+    # 被丢弃的一方之后可以基于已提交的版本继续保存
+    loser = first if first.log.conflicts else second
+    SessionStore(loser).save("a", [user("retry")], version=2)
+    loser.log.flush()
+    assert first.get("a").messages == second.get("a").messages == [user("retry")]
+
+
+def test_recreated_session_does_not_return_stale_cache(backends):
+    writer = backends(flush_interval=0.01)
+    reader = backends(flush_interval=0.01)
+    store = SessionStore(writer)
+    store.save("a", [user("old")])
+    writer.log.flush()
+    assert reader.get("a").messages == [user("old")]
+
+    store.delete("a")
+    store.save("a", [user("new")])
+    writer.log.flush()
+    assert reader.get("a").messages == [user("new")]
+
+
+def test_ttl_counts_from_last_write(backends, monkeypatch):
+    store = SessionStore(backends(ttl=10, flush_interval=0.01))
+    store.save("a", [user("1")])
+    store.backend.log.flush()
+    assert store.load("a").version == 1
+
+    now = session_module.time.time()
+    monkeypatch.setattr(session_module.time, "time", lambda: now + 20)
+    # 只读取不会延长过期时间，过期后重新从版本 1 开始
+    assert store.load("a").version == 0
+    store.save("a", [user("2")])
+    store.backend.log.flush()
+    assert store.load("a").messages == [user("2")]
@@ -0,0 +1,115 @@
+"""PaddleOCR 服务切块规划与结果合并单元测试"""
+
+import pytest
+
+np = pytest.importorskip("numpy")
+
+from src.core.engines.ocr.paddleocr.tiling import (  # noqa: E402
+    merge_tile_results,
+    plan_tiles,
+    poly_to_box,
+    split_tiles,
+)
+
+
+def rect(x0, y0, x1, y1):
+    return [[x0, y0], [x1, y0], [x1, y1], [x0, y1]]
+
+
+def tile_result(lines, **extra):
+    """lines: [(text, score, (x0, y0, x1, y1))]，坐标为切块内坐标"""
+    return {
+        "rec_texts": [text for text, _, _ in lines],
+        "rec_scores": [score for _, score, _ in lines],
+        "rec_polys": [rect(*box) for _, _, box in lines],
+        "rec_boxes": [list(box) for _, _, box in lines],
+        **extra,
+    }
+
+
+def test_plan_tiles_covers_image_with_overlap():
+    tiles = plan_tiles(height=250, width=100, tile_size=100, overlap=20)
+    assert tiles == [(0, 0, 100, 100), (80, 0, 180, 100), (150, 0, 250, 100)]
+    assert plan_tiles(50, 60, 100, 20) == [(0, 0, 50, 60)]
+
+    with pytest.raises(ValueError):
+        plan_tiles(100, 100, tile_size=100, overlap=100)
+
+
+def test_split_tiles_returns_views():
+    image = np.zeros((250, 100, 3), dtype=np.uint8)
+    tiles = plan_tiles(250, 100, 100, 20)
+    parts = split_tiles(image, tiles)
+
+    assert [part.shape[:2] for part in parts] == [(100, 100)] * 3
+    assert all(np.shares_memory(part, image) for part in parts)
+
+
+def test_poly_to_box():
+    assert poly_to_box([[3, 5], [10, 4], [11, 9], [2, 8]]) == [2, 4, 11, 9]
+
+
+def test_merge_offsets_and_dedups_overlap_region():
+    tiles = [(0, 0, 100, 100), (0, 80, 100, 180)]
+    results = [
+        tile_result([("left", 0.9, (10, 10, 50, 30)), ("cut", 0.6, (85, 50, 100, 70))]),
+        # 第二块中的完整行与第一块被切断的半截重复
+        tile_result([("whole", 0.95, (2, 50, 40, 70)), ("right", 0.8, (60, 10, 90, 30))]),
+    ]
+
+    merged = merge_tile_results(results, tiles)
+    assert merged["rec_texts"] == ["left", "right", "whole"]
+    assert merged["rec_boxes"] == [[10, 10, 50, 30], [140, 10, 170, 30], [82, 50, 120, 70]]
+    assert merged["rec_polys"][1] == rect(140, 10, 170, 30)
+    assert merged["tiles"] == 2
+
+
+def test_merge_derives_boxes_from_polys():
+    tiles = [(0, 0, 100, 100), (0, 80, 100, 180)]
+    results = [tile_result([("a", 0.9, (10, 10, 50, 30))]), tile_result([])]
+    for result in results:
+        del result["rec_boxes"]
+
+    merged = merge_tile_results(results, tiles)
+    assert merged["rec_boxes"] == [[10, 10, 50, 30]]
+
+
+def test_merge_joins_line_cut_by_tile_edge():
+    # 文字行比重叠区域更宽，两块都只识别出半行
+    tiles = [(0, 0, 100, 100), (0, 80, 100, 180)]
+    results = [
+        tile_result([("hello wor", 0.9, (10, 10, 100, 30))]),
+        tile_result([("world", 0.7, (0, 10, 50, 30))]),
+    ]
+
+    merged = merge_tile_results(results, tiles)
+    assert merged["rec_texts"] == ["hello world"]
+    assert merged["rec_boxes"] == [[10, 10, 130, 30]]
+    assert merged["rec_polys"] == [rect(10, 10, 130, 30)]
+    assert 0.7 < merged["rec_scores"][0] < 0.9
+
+    separate = merge_tile_results(results, tiles, dedup_threshold=1.1, collinear_threshold=1.1)
+    assert separate["rec_texts"] == ["hello wor", "world"]
+
+
+def test_merge_keeps_other_fields():
+    tiles = [(0, 0, 100, 100), (0, 80, 100, 180)]
+    results = [
+        tile_result(
+            [("a", 0.9, (10, 10, 50, 30))],
+            dt_polys=[rect(10, 10, 50, 30)],
+            textline_orientation_angles=[0],
+            model_settings={"use_doc_orientation_classify": False},
+        ),
+        tile_result(
+            [("b", 0.9, (20, 50, 60, 70))],
+            dt_polys=[rect(20, 50, 60, 70)],
+            textline_orientation_angles=[1],
+            model_settings={"use_doc_orientation_classify": False},
+        ),
+    ]
+
+    merged = merge_tile_results(results, tiles)
+    assert merged["model_settings"] == {"use_doc_orientation_classify": False}
+    assert merged["dt_polys"] == [rect(10, 10, 50, 30), rect(100, 50, 140, 70)]
+    assert merged["textline_orientation_angles"] == [0, 1]